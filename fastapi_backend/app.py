@@ -1,17 +1,22 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, Response
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, field_validator
 from jugaad_data.nse import NSELive
 from nsepython import nse_get_top_gainers, nse_get_top_losers
-from pymongo import MongoClient
+import pymongo
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from bson.objectid import ObjectId
-from cachetools import TTLCache
+from cachetools import TTLCache, LRUCache
 from typing import Optional, List, Dict, Any, Set
+import numpy as np
 import pandas as pd
 import asyncio
+import heapq
 import threading
 import time
 import json
@@ -19,13 +24,24 @@ import os
 # import datetime
 import logging
 import uuid
+import re
+import base64
+import bisect
+import gzip
+import hashlib
+import mmap
+import struct
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 import csv
 import requests
 import time
 import json
-from datetime import datetime
+from datetime import datetime, date, timedelta, timezone, time as dt_time
 import feedparser
 from typing import List, Dict, Tuple, Optional
 import logging
@@ -42,8 +58,52 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# orjson is in requirements.txt; the stdlib fallback only keeps a bare install running
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    print("orjson not available. Install with: pip install orjson")
+    ORJSON_AVAILABLE = False
+    orjson = None
+
+def json_default(value):
+    """Encode the non-JSON types that Mongo documents and NumPy results carry."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS if ORJSON_AVAILABLE else 0
+
+def dumps_json(content) -> bytes:
+    """Compact JSON bytes, with ObjectId/datetime/NumPy handled inside the encoder."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=json_default, option=ORJSON_OPTIONS)
+    return json.dumps(content, default=json_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by ``dumps_json``.
+
+    Handlers returning Mongo documents should return this directly: a plain
+    dict return still goes through FastAPI's ``jsonable_encoder`` walk first.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps_json(content)
+
 # Initialize FastAPI app
-app = FastAPI(title="NSE Stock API", description="API for NSE stock data and trading")
+app = FastAPI(title="NSE Stock API", description="API for NSE stock data and trading",
+              default_response_class=FastJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -54,8 +114,197 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Market data provider: live NSE, live NSE with every response recorded, or a recorded session replayed
+MARKET_DATA_MODE = os.getenv("MARKET_DATA_MODE", "live").lower()  # live, record or replay
+MARKET_DATA_LOG = os.getenv(
+    "MARKET_DATA_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "market_data.log"),
+)
+MARKET_REPLAY_SPEED = min(100.0, max(1.0, float(os.getenv("MARKET_REPLAY_SPEED", 1))))  # 1x-100x wall time
+MARKET_REPLAY_LOOP = os.getenv("MARKET_REPLAY_LOOP", "true").lower() in ("1", "true", "yes")  # restart at the end
+REPLAY_MIN_POLL_INTERVAL = float(os.getenv("REPLAY_MIN_POLL_INTERVAL", 0.1))  # seconds, fastest replay broadcast
+
+# Log record: header (recorded-at epoch seconds, body length, key length), then the
+# key "call\0arg", then the zlib-compressed JSON response
+MARKET_LOG_HEADER = struct.Struct(">dIH")
+
+
+class MarketDataRecorder:
+    """NSELive wrapper appending every quote, trade info, indices and market status response to a log.
+
+    Calls arrive on executor threads, so appends are serialized by a lock and
+    flushed per record; an interrupted recording loses at most the record in
+    flight, which the replay skips as a truncated tail.
+    """
+
+    def __init__(self, source, path: str = MARKET_DATA_LOG):
+        self.source = source
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+
+    def record(self, call: str, arg: str, payload):
+        try:
+            key = f"{call}\0{arg}".encode()
+            body = zlib.compress(dumps_json(payload))
+            with self._lock:
+                self._file.write(MARKET_LOG_HEADER.pack(time.time(), len(body), len(key)) + key + body)
+                self._file.flush()
+        except Exception as e:
+            logger.error(f"Error recording {call} {arg}: {str(e)}")
+
+    def stock_quote(self, symbol: str) -> dict:
+        quote = self.source.stock_quote(symbol)
+        self.record("stock_quote", symbol, quote)
+        return quote
+
+    def trade_info(self, symbol: str) -> dict:
+        info = self.source.trade_info(symbol)
+        self.record("trade_info", symbol, info)
+        return info
+
+    def all_indices(self) -> dict:
+        indices = self.source.all_indices()
+        self.record("all_indices", "", indices)
+        return indices
+
+    def market_status(self) -> dict:
+        status = self.source.market_status()
+        self.record("market_status", "", status)
+        return status
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+
+class MarketReplay:
+    """Plays a recorded market data log back in place of NSELive.
+
+    The log is memory-mapped and indexed once from the record headers alone:
+    per (call, arg) key, recorded-at times and body offsets in time order. A
+    lookup is a bisect against the replay position, plus one decompress and
+    parse only when the answer changed since the last lookup for that key,
+    so polling thousands of symbols costs little beyond decoding the quotes
+    that actually moved.
+
+    The replay clock starts at the first record and runs ``speed`` times
+    faster than wall time. It never goes backwards: with ``loop`` the
+    recording restarts from the top while the clock keeps counting, so tick
+    timestamps stay increasing.
+    """
+
+    def __init__(self, path: str = MARKET_DATA_LOG, speed: float = MARKET_REPLAY_SPEED,
+                 loop: bool = MARKET_REPLAY_LOOP):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index: Dict[Tuple[str, str], Tuple[array, array, array]] = {}
+        self._decoded: Dict[Tuple[str, str], Tuple[int, Any]] = {}
+        self.records = self._build_index()
+        if not self.records:
+            raise ValueError(f"No records in market data log {path}")
+        self.first = min(times[0] for times, _, _ in self.index.values())
+        self.last = max(times[-1] for times, _, _ in self.index.values())
+        self.duration = self.last - self.first
+        self.started_at = time.time()
+
+    def _build_index(self) -> int:
+        entries: Dict[Tuple[str, str], list] = {}
+        offset, size, count = 0, len(self._map), 0
+        while offset + MARKET_LOG_HEADER.size <= size:
+            recorded_at, body_length, key_length = MARKET_LOG_HEADER.unpack_from(self._map, offset)
+            start = offset + MARKET_LOG_HEADER.size
+            end = start + key_length + body_length
+            if end > size:
+                logger.warning(f"Ignoring truncated record at byte {offset} of {self.path}")
+                break
+            call, _, arg = self._map[start:start + key_length].decode().partition("\0")
+            entries.setdefault((call, arg), []).append((recorded_at, start + key_length, body_length))
+            offset = end
+            count += 1
+
+        for key, records in entries.items():
+            # Concurrent recorder threads can append slightly out of order
+            records.sort()
+            self.index[key] = (array("d", (r[0] for r in records)), array("q", (r[1] for r in records)),
+                               array("I", (r[2] for r in records)))
+        return count
+
+    def now(self) -> float:
+        """Replay clock in epoch seconds; keeps increasing across loops."""
+        return self.first + (time.time() - self.started_at) * self.speed
+
+    def position(self) -> float:
+        """Recorded time currently playing."""
+        elapsed = (time.time() - self.started_at) * self.speed
+        if self.loop and self.duration > 0:
+            elapsed %= self.duration
+        return self.first + min(elapsed, self.duration)
+
+    def symbols(self) -> List[str]:
+        return sorted(arg for call, arg in self.index if call == "stock_quote")
+
+    def _payload(self, call: str, arg: str = ""):
+        key = (call, arg)
+        entry = self.index.get(key)
+        if entry is None:
+            raise ValueError(f"No recorded {call} for {arg}" if arg else f"No recorded {call}")
+        times, offsets, lengths = entry
+        i = max(0, bisect.bisect_right(times, self.position()) - 1)
+        cached = self._decoded.get(key)
+        if cached is not None and cached[0] == i:
+            return cached[1]
+        raw = zlib.decompress(self._map[offsets[i]:offsets[i] + lengths[i]])
+        payload = orjson.loads(raw) if ORJSON_AVAILABLE else json.loads(raw)
+        self._decoded[key] = (i, payload)
+        return payload
+
+    def stock_quote(self, symbol: str) -> dict:
+        return self._payload("stock_quote", symbol)
+
+    def trade_info(self, symbol: str) -> Optional[dict]:
+        # Logs recorded before trade_info was captured have none; volume stays unknown
+        if ("trade_info", symbol) not in self.index:
+            return None
+        return self._payload("trade_info", symbol)
+
+    def all_indices(self) -> dict:
+        return self._payload("all_indices")
+
+    def market_status(self) -> dict:
+        return self._payload("market_status")
+
+
+def market_data_provider():
+    """The NSE data source for MARKET_DATA_MODE, falling back to live NSE."""
+    if MARKET_DATA_MODE == "replay":
+        try:
+            replay = MarketReplay()
+            logger.info(f"Replaying {replay.records} records ({len(replay.symbols())} symbols, "
+                        f"{replay.duration / 60:.0f} min) from {MARKET_DATA_LOG} at {replay.speed:g}x")
+            return replay
+        except Exception as e:
+            logger.error(f"Error opening market data log {MARKET_DATA_LOG}, using live NSE: {str(e)}")
+    elif MARKET_DATA_MODE == "record":
+        logger.info(f"Recording market data to {MARKET_DATA_LOG}")
+        return MarketDataRecorder(NSELive())
+    return NSELive()
+
 # Initialize NSE object
-nse = NSELive()
+nse = market_data_provider()
+
+
+def market_time() -> float:
+    """Now as the market data sees it: the replay clock when replaying, else wall time."""
+    return nse.now() if isinstance(nse, MarketReplay) else time.time()
+
+def live_poll_interval() -> float:
+    """Broadcast cadence while prices move; a replay polls ``speed`` times as often."""
+    if isinstance(nse, MarketReplay):
+        return max(REPLAY_MIN_POLL_INTERVAL, LIVE_POLL_INTERVAL / nse.speed)
+    return LIVE_POLL_INTERVAL
 # Optional NewsAPI import
 try:
     from newsapi.newsapi_client import NewsApiClient
@@ -64,45 +313,440 @@ except ImportError:
     print("NewsAPI not available. Install with: pip install newsapi-python")
     NEWSAPI_AVAILABLE = False
     NewsApiClient = None
+# MessagePack is in requirements.txt; without it the binary WebSocket encoding is refused
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    print("msgpack not available. Install with: pip install msgpack")
+    MSGPACK_AVAILABLE = False
+    msgpack = None
+
+# Brotli is in requirements.txt; responses fall back to gzip without it
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    print("brotli not available. Install with: pip install brotli")
+    BROTLI_AVAILABLE = False
+    brotli = None
+
+# Metrics: a minimal in-process Prometheus registry served on /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)  # seconds
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))  # seconds between event-loop lag probes
+
+
+def format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric with label names; ``collect`` (if given) supplies values at scrape time.
+
+    Updates take a lock because blocking calls are timed on executor threads.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+        self.values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        if self.collect is not None:
+            values = self.collect()
+        else:
+            with self._lock:
+                values = dict(self.values)
+        return [(self.name, labels, value) for labels, value in values.items()]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            names = self.labels + ("le",) if name.endswith("_bucket") else self.labels
+            lines.append(f"{name}{format_labels(names, labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self.values[labels] = value
+
+
+class Histogram(Metric):
+    """Cumulative histogram; ``observe`` is one bisect and two increments."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[tuple, list] = {}  # labels -> [count per bucket..., count above last bucket, sum]
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        with self._lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        samples = []
+        for labels, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", labels + ("+Inf" if bound == float("inf") else format_value(bound),), cumulative))
+            samples.append((f"{self.name}_sum", labels, values[-1]))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = (), collect=None) -> Counter:
+        return self.register(Counter(name, help, labels, collect))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = (), collect=None) -> Gauge:
+        return self.register(Gauge(name, help, labels, collect))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                logger.error(f"Error collecting metric {metric.name}: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+upstream_seconds = metrics.histogram("growup_upstream_seconds", "Latency of blocking upstream calls (NSE, feeds)", ("call",))
+upstream_errors = metrics.counter("growup_upstream_errors_total", "Upstream calls that raised", ("call",))
+mongo_seconds = metrics.histogram("growup_mongo_seconds", "Latency of Mongo operations", ("collection", "op"))
+mongo_errors = metrics.counter("growup_mongo_errors_total", "Mongo operations that raised", ("collection", "op"))
+cache_requests = metrics.counter("growup_cache_requests_total", "Quote cache lookups by result", ("cache", "result"))
+cache_evictions = metrics.counter("growup_cache_evictions_total", "Quote cache entries removed, by reason", ("cache", "reason"))
+broadcast_cycle_seconds = metrics.histogram("growup_broadcast_cycle_seconds", "Price broadcast loop work per cycle, excluding its sleep")
+loop_lag_seconds = metrics.histogram("growup_event_loop_lag_seconds", "How late the event loop wakes a sleeping task", buckets=LOOP_LAG_BUCKETS)
+
+
+def timed_call(call: str, fn, *args, **kwargs):
+    """Run a blocking upstream call, recording its latency (and failure) under ``call``."""
+    started = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    except Exception:
+        upstream_errors.inc(call)
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - started, call)
+
+
+class MeteredTTLCache(TTLCache):
+    """TTLCache that counts size evictions and expirations into ``cache_evictions``."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float, timer=time.monotonic):
+        super().__init__(maxsize=maxsize, ttl=ttl, timer=timer)
+        self.name = name
+
+    def popitem(self):
+        item = super().popitem()
+        cache_evictions.inc(self.name, "size")
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        if expired:
+            cache_evictions.inc(self.name, "expired", amount=len(expired))
+        return expired
+
 # MongoDB connection
 mongo_uri = os.getenv("MONGO_URI")
-client = MongoClient(mongo_uri)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_OP_TIMEOUT = float(os.getenv("MONGO_OP_TIMEOUT", 5))  # seconds per operation
+client = MongoClient(
+    mongo_uri,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=int(MONGO_OP_TIMEOUT * 1000),
+    serverSelectionTimeoutMS=int(MONGO_OP_TIMEOUT * 1000),
+)
 db = client['Growup']
 orders_collection = db['orders']
 users = db['users']
 exchanges = db['exchanges']
 holdings = db['holdings']
 
-# Create indexes for faster queries
-orders_collection.create_index([('status', 1)])
-orders_collection.create_index([('symbol', 1)])
-orders_collection.create_index([('created_at', -1)])
+# One worker per pooled connection, so a request never waits on a thread
+# while a socket sits idle (or the other way round)
+mongo_executor = ThreadPoolExecutor(max_workers=MONGO_MAX_POOL_SIZE, thread_name_prefix="mongo")
+
+
+class AsyncCollection:
+    """Async facade over a pymongo collection.
+
+    Each operation runs on ``mongo_executor`` under ``pymongo.timeout`` so a
+    slow Mongo round-trip never blocks the event loop and never hangs longer
+    than ``timeout`` seconds.
+    """
+
+    def __init__(self, collection, executor: ThreadPoolExecutor, timeout: float = MONGO_OP_TIMEOUT):
+        self.collection = collection
+        self.executor = executor
+        self.timeout = timeout
+
+    async def _run(self, fn, *args, **kwargs):
+        def call():
+            started = time.perf_counter()
+            try:
+                with pymongo.timeout(self.timeout):
+                    return fn(*args, **kwargs)
+            except Exception:
+                mongo_errors.inc(self.collection.name, fn.__name__)
+                raise
+            finally:
+                mongo_seconds.observe(time.perf_counter() - started, self.collection.name, fn.__name__)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, call)
+
+    async def find_one(self, *args, **kwargs):
+        return await self._run(self.collection.find_one, *args, **kwargs)
+
+    async def find(self, filter: dict, projection: Optional[dict] = None,
+                   sort: Optional[list] = None, limit: int = 0) -> List[dict]:
+        """Run a query and materialize the results inside the worker thread."""
+        def find():
+            cursor = self.collection.find(filter, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+
+        return await self._run(find)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._run(self.collection.insert_one, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._run(self.collection.update_one, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._run(self.collection.find_one_and_update, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._run(self.collection.delete_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._run(self.collection.insert_many, *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self._run(self.collection.bulk_write, *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self._run(self.collection.delete_many, *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await self._run(self.collection.create_index, *args, **kwargs)
+
+
+async_orders = AsyncCollection(orders_collection, mongo_executor)
+async_users = AsyncCollection(users, mongo_executor)
+async_holdings = AsyncCollection(holdings, mongo_executor)
+
+
+async def create_indexes():
+    """Create indexes for faster queries"""
+    await async_orders.create_index([('status', 1)])
+    await async_orders.create_index([('symbol', 1)])
+    await async_orders.create_index([('created_at', -1)])
+    # Keyset pagination walks (created_at, _id) newest first, optionally within a filter
+    await async_orders.create_index([('created_at', -1), ('_id', -1)])
+    await async_orders.create_index([('Email', 1), ('created_at', -1), ('_id', -1)])
+    await async_orders.create_index([('status', 1), ('created_at', -1), ('_id', -1)])
+    await async_orders.create_index([('symbol', 1), ('created_at', -1), ('_id', -1)])
+    # Limit-order fills and cancels address orders by OrderId
+    await async_orders.create_index([('OrderId', 1)])
+    # Order execution filters users by Email and holdings by HoldingId on every trade
+    await async_users.create_index([('Email', 1)])
+    await async_holdings.create_index([('HoldingId', 1)])
 
 # WebSocket variables
-active_connections: Set[WebSocket] = set()
-symbol_subscribers: Dict[str, Set[WebSocket]] = {}
-price_cache = TTLCache(maxsize=100, ttl=5)  # Cache for 5 seconds
+WS_MAX_PENDING = int(os.getenv("WS_MAX_PENDING", 256))  # queued messages per connection
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 10))  # seconds before a stuck client is dropped
+active_connections: Dict[WebSocket, "ClientConnection"] = {}
+symbol_subscribers: Dict[str, Set["ClientConnection"]] = {}
+symbol_frames: Dict[str, "TickFrame"] = {}  # latest quote frame per symbol
+candle_subscribers: Dict[Tuple[str, str], Set["ClientConnection"]] = {}  # (symbol, interval) -> clients
+user_connections: Dict[str, Set["ClientConnection"]] = {}  # Email -> clients listening for their order fills
+indices_subscribers: Dict["ClientConnection", Optional[Set[str]]] = {}  # client -> selected indices (None = all)
+ws_retired = {"coalesced": 0, "dropped": 0}  # send-queue counters of connections already closed
+
+# WebSocket gauges are read from the live structures at scrape time, never on the tick path
+metrics.gauge("growup_ws_connections", "Open WebSocket connections",
+              collect=lambda: {(): len(active_connections)})
+metrics.gauge("growup_ws_symbol_subscribers", "WebSocket clients subscribed per symbol", ("symbol",),
+              collect=lambda: {(symbol,): len(clients) for symbol, clients in list(symbol_subscribers.items())})
+metrics.gauge("growup_ws_send_queue_depth", "Messages waiting in WebSocket send queues, in total and for the fullest one", ("stat",),
+              collect=lambda: ws_queue_depths())
+metrics.counter("growup_ws_messages_coalesced_total", "Queued messages replaced by a newer one for the same key",
+                collect=lambda: {(): ws_retired["coalesced"] + sum(c.coalesced for c in list(active_connections.values()))})
+metrics.counter("growup_ws_messages_dropped_total", "Queued messages dropped because a send queue was full",
+                collect=lambda: {(): ws_retired["dropped"] + sum(c.dropped for c in list(active_connections.values()))})
+metrics.gauge("growup_price_cache_entries", "Entries currently held in each quote cache", ("cache",),
+              collect=lambda: {("price",): len(price_cache), ("quote",): len(quote_cache)})
+
+
+def ws_queue_depths() -> Dict[tuple, int]:
+    depths = [len(conn.pending) for conn in list(active_connections.values())]
+    return {("total",): sum(depths), ("max",): max(depths, default=0)}
+
+# WebSocket wire protocols: v1 sends the full quote dict on every tick (default),
+# v2 sends one short-key snapshot per symbol and then only the fields that changed
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+# TTLs run on the market clock, so a replay at 100x refreshes quotes 100x as often
+quote_cache_timer = market_time if isinstance(nse, MarketReplay) else time.monotonic
+price_cache = MeteredTTLCache("price", maxsize=100, ttl=5, timer=quote_cache_timer)  # Cache for 5 seconds
+quote_cache = MeteredTTLCache("quote", maxsize=100, ttl=5, timer=quote_cache_timer)  # Raw NSE quotes, same lifetime as price_cache
+
+# Upstream NSE calls are blocking, so they run on a bounded pool off the event loop
+QUOTE_EXECUTOR_WORKERS = int(os.getenv("QUOTE_EXECUTOR_WORKERS", 8))
+quote_executor = ThreadPoolExecutor(max_workers=QUOTE_EXECUTOR_WORKERS, thread_name_prefix="nse-quote")
+
+# Report generation fans out per ticker; these bound how wide and how long
+REPORT_MAX_CONCURRENCY = int(os.getenv("REPORT_MAX_CONCURRENCY", 8))
+REPORT_QUOTE_TIMEOUT = float(os.getenv("REPORT_QUOTE_TIMEOUT", 8))  # seconds for all quotes
+REPORT_NEWS_TIMEOUT = float(os.getenv("REPORT_NEWS_TIMEOUT", 10))  # seconds for all news
+REPORT_FRESHNESS = int(os.getenv("REPORT_FRESHNESS", 30))  # seconds a report for unchanged holdings is reused
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", 1000))
+report_cache = TTLCache(maxsize=REPORT_CACHE_SIZE, ttl=REPORT_FRESHNESS)  # (holdings hash, window) -> report
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 4))  # reports generated at the same time
+REPORT_JOB_TTL = int(os.getenv("REPORT_JOB_TTL", 900))  # seconds a job stays pollable by id
+REPORT_WAIT_TIMEOUT = float(os.getenv("REPORT_WAIT_TIMEOUT", 20))  # GET with poll=true waits this long before answering 202
+report_executor = ThreadPoolExecutor(max_workers=REPORT_MAX_CONCURRENCY * 3, thread_name_prefix="report")
+
+# Market news feeds shared by every report, refreshed in the background
+MARKET_NEWS_FEEDS = {
+    "Economic Times": "https://economictimes.indiatimes.com/markets/stocks/rssfeeds/2146842.cms",
+    "Economic Times Markets": "https://economictimes.indiatimes.com/markets/rssfeeds/1977021501.cms",
+    "Moneycontrol": "https://www.moneycontrol.com/rss/buzzingstocks.xml",
+}
+FEED_REFRESH_INTERVAL = int(os.getenv("FEED_REFRESH_INTERVAL", 300))  # seconds
+FEED_MAX_ENTRIES = int(os.getenv("FEED_MAX_ENTRIES", 2000))  # entries kept across all feeds
+
+# Order history pagination
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", 100))  # default page size
+ORDERS_PAGE_MAX = int(os.getenv("ORDERS_PAGE_MAX", 500))  # page size cap
+ORDERS_EXPORT_BATCH = int(os.getenv("ORDERS_EXPORT_BATCH", 1000))  # docs per round-trip when streaming
+ORDERS_SORT = [('created_at', -1), ('_id', -1)]
+ORDERS_BATCH_MAX = int(os.getenv("ORDERS_BATCH_MAX", 500))  # orders per /api/place-orders call
+ORDERS_BATCH_RETRIES = int(os.getenv("ORDERS_BATCH_RETRIES", 3))  # re-runs after losing a race to another writer
+ORDERS_BATCH_MARKERS = 20  # recent batch write markers kept on each user/holding document
+ORDER_SETTLEMENT_WORKERS = int(os.getenv("ORDER_SETTLEMENT_WORKERS", 4))  # limit-order fills written concurrently
+
+# Intraday tick history kept in memory for charts
+TICK_HISTORY_SIZE = int(os.getenv("TICK_HISTORY_SIZE", 8192))  # ticks per symbol (~7h at 3s)
+TICK_HISTORY_SYMBOLS = int(os.getenv("TICK_HISTORY_SYMBOLS", 2000))  # symbols with history
+
+# Streaming OHLCV candles built from the quote stream
+CANDLE_INTERVALS = {"1m": 60_000, "5m": 300_000, "15m": 900_000}  # interval name -> ms
+CANDLE_HISTORY = int(os.getenv("CANDLE_HISTORY", 500))  # closed candles kept per symbol and interval
+CANDLE_TRADE_INFO = os.getenv("CANDLE_TRADE_INFO", "true").lower() in ("1", "true", "yes")  # trade_info volume for subscribed candles
+
+# Bundled NSE equity list (same layout as NSE's EQUITY_L.csv)
+SYMBOL_MASTER_FILE = os.getenv(
+    "SYMBOL_MASTER_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "EQUITY_L.csv"),
+)
+# Full exchange list, loaded at startup, on a schedule and by /api/symbols/refresh
+SYMBOL_MASTER_URL = os.getenv("SYMBOL_MASTER_URL", "https://archives.nseindia.com/content/equities/EQUITY_L.csv")
+SYMBOL_MASTER_REFRESH_INTERVAL = int(os.getenv("SYMBOL_MASTER_REFRESH_INTERVAL", 86400))  # seconds between reloads
+SYMBOL_MASTER_RETRY_INTERVAL = int(os.getenv("SYMBOL_MASTER_RETRY_INTERVAL", 300))  # seconds, after a failed load
+
+# NSE session calendar (times are IST)
+IST = timezone(timedelta(hours=5, minutes=30))
+MARKET_SESSIONS = [
+    ("pre_open", dt_time(9, 0), dt_time(9, 15)),
+    ("open", dt_time(9, 15), dt_time(15, 30)),
+    ("closing", dt_time(15, 40), dt_time(16, 0)),
+]
+NSE_HOLIDAYS_FILE = os.getenv(
+    "NSE_HOLIDAYS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "nse_holidays.csv"),
+)
+MARKET_STATUS_REFRESH = int(os.getenv("MARKET_STATUS_REFRESH", 60))  # seconds, during sessions
+MARKET_STATUS_REFRESH_CLOSED = int(os.getenv("MARKET_STATUS_REFRESH_CLOSED", 900))  # seconds, otherwise
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 3))  # broadcast cadence while prices move
+CLOSED_POLL_INTERVAL = float(os.getenv("CLOSED_POLL_INTERVAL", 60))  # broadcast cadence when closed
+
+# Market-wide snapshots (gainers/losers) are refreshed in the background and served from memory
+GAINERS_REFRESH_INTERVAL = float(os.getenv("GAINERS_REFRESH_INTERVAL", 30))  # seconds while prices move
+INDICES_REFRESH_INTERVAL = float(os.getenv("INDICES_REFRESH_INTERVAL", 5))  # seconds while prices move
+
+# Response compression (br when the client accepts it and brotli is installed, else gzip)
+RESPONSE_COMPRESS_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESS_MIN_SIZE", 1024))  # bytes; smaller bodies go out as-is
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", 6))
+RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", 4))  # 0-11; 4 is about gzip -6 speed, smaller output
 
 # Track market status
 market_open = False
 
 
 # Helper Functions
-def fetch_holdings_from_db(holding_id: str) -> Optional[pd.DataFrame]:
-    """Fetch holdings from MongoDB based on holding ID."""
+async def fetch_holdings_from_db(holding_id: str) -> Optional[List[dict]]:
+    """Fetch the positions of a holding document from MongoDB."""
     try:
-        holding = holdings.find_one({"HoldingId": holding_id})
+        holding = await async_holdings.find_one({"HoldingId": holding_id}, {"Holdings": 1})
         
-        if holding and "Holdings" in holding:
-            simplified_data = [
-                {"Ticker": item["symbol"], "quantity": item["quantity"]}
-                for item in holding["Holdings"]
-            ]
-            
-            df = pd.DataFrame(simplified_data)
+        if holding and holding.get("Holdings"):
             logger.info(f"✅ Holdings for ID: {holding_id}")
-            logger.info(f"Found {len(df)} holdings")
-            return df
+            logger.info(f"Found {len(holding['Holdings'])} holdings")
+            return holding["Holdings"]
         else:
             logger.warning(f"❌ No holding found with HoldingId = {holding_id}")
             return None
@@ -111,6 +755,37 @@ def fetch_holdings_from_db(holding_id: str) -> Optional[pd.DataFrame]:
         logger.error(f"Error fetching holdings from database: {str(e)}")
         return None
 
+async def gather_with_deadline(items: List[Any], fetch, limit: int, timeout: float) -> List[Any]:
+    """Run ``fetch(item)`` for every item with at most ``limit`` in flight.
+
+    Returns a list aligned with ``items``. Anything still running when
+    ``timeout`` expires is cancelled and reported as ``asyncio.TimeoutError``;
+    failures are returned as their exception instead of being raised.
+    """
+    if not items:
+        return []
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(item):
+        async with semaphore:
+            return await fetch(item)
+
+    tasks = [asyncio.create_task(bounded(item)) for item in items]
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+    results = []
+    for task in tasks:
+        if task in pending:
+            results.append(asyncio.TimeoutError(f"timed out after {timeout:.0f}s"))
+        elif task.exception() is not None:
+            results.append(task.exception())
+        else:
+            results.append(task.result())
+    return results
+
 class NSEStockAgent:
     """Agent to fetch real-time NSE stock data using your API."""
     
@@ -122,76 +797,206 @@ class NSEStockAgent:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
     
-    def fetch_data(self, tickers: List[Tuple[str, float]]) -> List[Dict]:
-        """Fetch real-time NSE stock data for given tickers."""
+    async def fetch_data_async(self, tickers: List[Tuple[str, float]]) -> List[Dict]:
+        """Fetch quotes for all tickers concurrently, keeping partial results on timeout."""
+        async def fetch(item):
+            ticker, quantity = item
+            quote = await quote_service.get_quote(ticker)
+            return self._structure_quote(ticker, quantity, quote)
+
+        results = await gather_with_deadline(tickers, fetch, REPORT_MAX_CONCURRENCY, REPORT_QUOTE_TIMEOUT)
+
         data = []
-        
-        for ticker, quantity in tickers:
-            try:
-                stock_data = self._fetch_from_nse_api(ticker, quantity)
-                if stock_data:
-                    data.append(stock_data)
-                else:
-                    # Create error entry if API fails
-                    data.append({
-                        'ticker': ticker,
-                        'quantity': quantity,
-                        'lastPrice': 0,
-                        'change': 0,
-                        'pChange': 0,
-                        'error': 'Unable to fetch data from NSE API'
-                    })
-                        
-            except Exception as e:
-                logger.error(f"Error fetching data for {ticker}: {str(e)}")
+        for (ticker, quantity), result in zip(tickers, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching data for {ticker}: {str(result) or type(result).__name__}")
                 data.append({
                     'ticker': ticker,
                     'quantity': quantity,
                     'lastPrice': 0,
                     'change': 0,
                     'pChange': 0,
-                    'error': str(e)
+                    'error': str(result) or 'Unable to fetch data from NSE API'
                 })
-        
+            else:
+                data.append(result)
         return data
     
-    def _fetch_from_nse_api(self, ticker: str, quantity: float) -> Optional[Dict]:
-        """Fetch data from your NSE API endpoint."""
-        try:
-            data = nse.stock_quote(ticker)
-            api_data=data['priceInfo']
-            # Extract and structure data according to your API response format
-            return {
-                'ticker': ticker,
-                'quantity': quantity,
-                'lastPrice': api_data.get('lastPrice', 0),
-                'change': api_data.get('change', 0),
-                'pChange': api_data.get('pChange', 0),
-                'previousClose': api_data.get('previousClose', 0),
-                'open': api_data.get('open', 0),
-                'close': api_data.get('close', 0),
-                'vwap': api_data.get('vwap', 0),
-                'lowerCP': api_data.get('lowerCP', 'N/A'),
-                'upperCP': api_data.get('upperCP', 'N/A'),
-                'basePrice': api_data.get('basePrice', 0),
-                'intraDayHigh': api_data.get('intraDayHighLow', {}).get('max', 0),
-                'intraDayLow': api_data.get('intraDayHighLow', {}).get('min', 0),
-                'intraDayValue': api_data.get('intraDayHighLow', {}).get('value', 0),
-                'weekHigh': api_data.get('weekHighLow', {}).get('max', 0),
-                'weekLow': api_data.get('weekHighLow', {}).get('min', 0),
-                'weekHighDate': api_data.get('weekHighLow', {}).get('maxDate', 'N/A'),
-                'weekLowDate': api_data.get('weekHighLow', {}).get('minDate', 'N/A'),
-                'priceBand': api_data.get('pPriceBand', 'N/A'),
-                'tickSize': api_data.get('tickSize', 0),
-                'timestamp': int(time.time() * 1000)
-            }
-            
-        except requests.RequestException as e:
-            logger.warning(f"NSE API request failed for {ticker}: {str(e)}")
-            return None
-        except (KeyError, ValueError) as e:
-            logger.warning(f"NSE API response parsing failed for {ticker}: {str(e)}")
+    def _structure_quote(self, ticker: str, quantity: float, data: Dict) -> Dict:
+        """Structure a raw NSE quote into a report entry."""
+        api_data=data['priceInfo']
+        # Extract and structure data according to your API response format
+        return {
+            'ticker': ticker,
+            'quantity': quantity,
+            'lastPrice': api_data.get('lastPrice', 0),
+            'change': api_data.get('change', 0),
+            'pChange': api_data.get('pChange', 0),
+            'previousClose': api_data.get('previousClose', 0),
+            'open': api_data.get('open', 0),
+            'close': api_data.get('close', 0),
+            'vwap': api_data.get('vwap', 0),
+            'lowerCP': api_data.get('lowerCP', 'N/A'),
+            'upperCP': api_data.get('upperCP', 'N/A'),
+            'basePrice': api_data.get('basePrice', 0),
+            'intraDayHigh': api_data.get('intraDayHighLow', {}).get('max', 0),
+            'intraDayLow': api_data.get('intraDayHighLow', {}).get('min', 0),
+            'intraDayValue': api_data.get('intraDayHighLow', {}).get('value', 0),
+            'weekHigh': api_data.get('weekHighLow', {}).get('max', 0),
+            'weekLow': api_data.get('weekHighLow', {}).get('min', 0),
+            'weekHighDate': api_data.get('weekHighLow', {}).get('maxDate', 'N/A'),
+            'weekLowDate': api_data.get('weekHighLow', {}).get('minDate', 'N/A'),
+            'priceBand': api_data.get('pPriceBand', 'N/A'),
+            'tickSize': api_data.get('tickSize', 0),
+            'timestamp': int(market_time() * 1000)
+        }
+
+class NewsFeedStore:
+    """Shared market RSS feeds with an inverted index from tokens to entries.
+
+    Each feed is downloaded with a conditional GET (ETag/Last-Modified) at
+    most once per ``refresh_interval`` and parsed once. Entries accumulate
+    across refreshes up to ``max_entries``, so lookups see far more than the
+    latest page of a feed and never touch the network.
+    """
+
+    STOPWORDS = {
+        "ltd", "limited", "the", "and", "of", "india", "indian", "co", "company",
+        "corporation", "corp", "industries", "inc", "services", "&",
+    }
+
+    def __init__(self, feeds: Dict[str, str], refresh_interval: int = FEED_REFRESH_INTERVAL,
+                 max_entries: int = FEED_MAX_ENTRIES):
+        self.feeds = feeds
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()  # oldest first
+        self.index: Dict[str, Set[str]] = {}
+        self.validators: Dict[str, Dict[str, str]] = {}
+        self.last_refresh = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return re.findall(r"[a-z0-9&]+", re.sub(r"<[^>]+>", " ", text or "").lower())
+
+    def _download(self, url: str) -> Optional[List[Any]]:
+        """Conditionally GET and parse one feed. Returns None when unchanged."""
+        headers = {}
+        validator = self.validators.get(url, {})
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("modified"):
+            headers["If-Modified-Since"] = validator["modified"]
+
+        response = timed_call("feed.rss", self.session.get, url, headers=headers, timeout=10)
+        if response.status_code == 304:
             return None
+        response.raise_for_status()
+
+        self.validators[url] = {
+            "etag": response.headers.get("ETag"),
+            "modified": response.headers.get("Last-Modified"),
+        }
+        return feedparser.parse(response.content).entries
+
+    async def refresh(self):
+        """Refresh every feed concurrently and merge new entries into the index."""
+        loop = asyncio.get_running_loop()
+        sources = list(self.feeds.items())
+        results = await asyncio.gather(
+            *(loop.run_in_executor(report_executor, self._download, url) for _, url in sources),
+            return_exceptions=True,
+        )
+
+        added = 0
+        for (source, url), result in zip(sources, results):
+            if isinstance(result, Exception):
+                logger.warning(f"News feed refresh failed for {source}: {str(result)}")
+                continue
+            for entry in result or []:
+                added += self._add_entry(source, entry)
+
+        self.last_refresh = time.time()
+        if added:
+            logger.info(f"News feeds refreshed: {added} new entries, {len(self.entries)} indexed")
+
+    async def ensure_fresh(self):
+        """Refresh if the feeds are older than the interval, sharing one refresh between callers."""
+        if time.time() - self.last_refresh < self.refresh_interval:
+            return
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self.refresh())
+            self._refreshing.add_done_callback(lambda _: setattr(self, "_refreshing", None))
+        await asyncio.shield(self._refreshing)
+
+    def _add_entry(self, source: str, entry) -> int:
+        title = entry.get("title", "")
+        key = entry.get("id") or entry.get("link") or title
+        if not key or key in self.entries:
+            return 0
+
+        published = entry.get("published_parsed") or entry.get("updated_parsed")
+        tokens = frozenset(self.tokenize(title) + self.tokenize(entry.get("summary", "")))
+        self.entries[key] = {
+            "title": title,
+            "source": source,
+            "published": entry.get("published", "")[:10],
+            "published_ts": time.mktime(published) if published else 0.0,
+            "tokens": tokens,
+        }
+        for token in tokens:
+            self.index.setdefault(token, set()).add(key)
+
+        while len(self.entries) > self.max_entries:
+            self._evict_oldest()
+        return 1
+
+    def _evict_oldest(self):
+        key, entry = self.entries.popitem(last=False)
+        for token in entry["tokens"]:
+            postings = self.index.get(token)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self.index[token]
+
+    def _match(self, tokens: List[str]) -> Set[str]:
+        """Entries containing every token."""
+        if not tokens:
+            return set()
+        postings = [self.index.get(token, set()) for token in tokens]
+        postings.sort(key=len)
+        return set.intersection(*postings) if postings[0] else set()
+
+    def lookup(self, ticker: str, company_name: Optional[str] = None, limit: int = 3) -> List[str]:
+        """Latest indexed headlines that mention the ticker or the company name."""
+        keys = self._match(self.tokenize(ticker))
+        if company_name:
+            name_tokens = [t for t in self.tokenize(company_name) if t not in self.STOPWORDS]
+            keys |= self._match(name_tokens)
+
+        matches = sorted((self.entries[key] for key in keys), key=lambda e: e["published_ts"], reverse=True)
+        return [
+            f"{entry['title']} - {entry['source']} ({entry['published']})"
+            for entry in matches[:limit]
+        ]
+
+
+news_feed_store = NewsFeedStore(MARKET_NEWS_FEEDS)
+
+async def news_refresh_loop():
+    """Background task to keep the shared news feeds warm"""
+    while True:
+        try:
+            await news_feed_store.ensure_fresh()
+        except Exception as e:
+            logger.error(f"Error in news refresh loop: {str(e)}")
+        await asyncio.sleep(FEED_REFRESH_INTERVAL)
 
 class NSENewsAgent:
     """Agent to fetch real-time news using various sources."""
@@ -210,33 +1015,40 @@ class NSENewsAgent:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         })
     
-    def fetch_news(self, tickers: List[Tuple[str, float]]) -> Dict[str, List[str]]:
-        """Fetch real-time news for given tickers."""
+    async def fetch_news_async(self, tickers: List[Tuple[str, float]]) -> Dict[str, List[str]]:
+        """Fetch news for all tickers concurrently, keeping partial results on timeout."""
+        symbols = [ticker for ticker, _ in tickers]
+        results = await gather_with_deadline(symbols, self._fetch_ticker_news, REPORT_MAX_CONCURRENCY, REPORT_NEWS_TIMEOUT)
+
         news_data = {}
-        
-        for ticker, quantity in tickers:
-            try:
-                news_items = []
-                
-                # Try NewsAPI first if available
-                if self.newsapi:
-                    news_items.extend(self._fetch_from_newsapi(ticker))
-                
-                # Add RSS feed news from Indian financial sources
-                news_items.extend(self._fetch_from_indian_rss(ticker))
-                
-                # Add Google News for NSE/Indian market
-                news_items.extend(self._fetch_from_google_news(ticker))
-                
-                # Remove duplicates and limit to top 5
-                unique_news = list(dict.fromkeys(news_items))[:5]
-                news_data[ticker] = unique_news if unique_news else [f"No recent news found for {ticker}"]
-                
-            except Exception as e:
-                logger.error(f"Error fetching news for {ticker}: {str(e)}")
-                news_data[ticker] = [f"Error fetching news for {ticker}: {str(e)}"]
-        
+        for ticker, result in zip(symbols, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error fetching news for {ticker}: {str(result) or type(result).__name__}")
+                news_data[ticker] = [f"Error fetching news for {ticker}: {str(result) or type(result).__name__}"]
+            else:
+                news_data[ticker] = result
         return news_data
+
+    async def _fetch_ticker_news(self, ticker: str) -> List[str]:
+        """Query every news source for one ticker at the same time."""
+        # Indian RSS feeds are a shared in-memory index; only per-ticker searches hit the network
+        await news_feed_store.ensure_fresh()
+        rss_items = self._fetch_from_indian_rss(ticker)
+
+        loop = asyncio.get_running_loop()
+        google_items = loop.run_in_executor(report_executor, self._fetch_from_google_news, ticker)
+        if self.newsapi:
+            newsapi_items, google_items = await asyncio.gather(
+                loop.run_in_executor(report_executor, self._fetch_from_newsapi, ticker),
+                google_items,
+            )
+        else:
+            newsapi_items, google_items = [], await google_items
+        news_items = newsapi_items + rss_items + google_items
+
+        # Remove duplicates and limit to top 5
+        unique_news = list(dict.fromkeys(news_items))[:5]
+        return unique_news if unique_news else [f"No recent news found for {ticker}"]
     
     def _fetch_from_newsapi(self, ticker: str) -> List[str]:
         """Fetch news from NewsAPI."""
@@ -245,7 +1057,8 @@ class NSENewsAgent:
         
         try:
             # Search for Indian stock market news
-            articles = self.newsapi.get_everything(
+            articles = timed_call(
+                "feed.newsapi", self.newsapi.get_everything,
                 q=f"{ticker} NSE India stock",
                 language='en',
                 sort_by='publishedAt',
@@ -264,28 +1077,26 @@ class NSENewsAgent:
     def _fetch_from_indian_rss(self, ticker: str) -> List[str]:
         """Fetch news from Indian financial RSS feeds."""
         try:
-            # Economic Times RSS feed
-            rss_url = f"https://economictimes.indiatimes.com/markets/stocks/rssfeeds/2146842.cms"
-            feed = feedparser.parse(rss_url)
-            
-            # Filter for ticker-related news
-            relevant_news = []
-            for entry in feed.entries[:10]:  # Check more entries
-                if ticker.lower() in entry.title.lower() or ticker.lower() in entry.summary.lower():
-                    relevant_news.append(f"{entry.title} - Economic Times ({entry.published[:10]})")
-            
-            return relevant_news[:3]
+            return news_feed_store.lookup(ticker, self._company_name(ticker))
             
         except Exception as e:
-            logger.warning(f"Indian RSS feed request failed for {ticker}: {str(e)}")
+            logger.warning(f"Indian RSS feed lookup failed for {ticker}: {str(e)}")
             return []
+
+    def _company_name(self, ticker: str) -> Optional[str]:
+        """Company name from the symbol master, or the last quote we saw for the ticker."""
+        name = symbol_master.name(ticker)
+        if name:
+            return name
+        quote = quote_cache.get(ticker) or {}
+        return quote.get("info", {}).get("companyName")
     
     def _fetch_from_google_news(self, ticker: str) -> List[str]:
         """Fetch news from Google News for Indian market."""
         try:
             # Google News RSS feed with Indian market focus
             rss_url = f"https://news.google.com/rss/search?q={ticker}+NSE+India+stock&hl=en-IN&gl=IN&ceid=IN:en"
-            feed = feedparser.parse(rss_url)
+            feed = timed_call("feed.google_news", feedparser.parse, rss_url)
             
             return [
                 f"{entry.title} - {entry.published[:10]}"
@@ -334,56 +1145,85 @@ class NSEPortfolioAgent:
         self.news_agent = NSENewsAgent(news_api_key)
         self.web_agent = NSEWebAgent()
     
-    def generate_report(self, tickers: List[Tuple[str, float]]) -> str:
-        """Generate comprehensive real-time NSE portfolio report."""
+    async def build_report(self, tickers: List[Tuple[str, float]]) -> Dict:
+        """Fetch everything for a portfolio and return the structured report."""
         logger.info("Starting NSE real-time portfolio report generation...")
         
-        # Fetch data from all agents
-        real_time_data = self.stock_agent.fetch_data(tickers)
+        # Fetch data from all agents at once; each source has its own deadline
+        real_time_data, news_data = await asyncio.gather(
+            self.stock_agent.fetch_data_async(tickers),
+            self.news_agent.fetch_news_async(tickers),
+        )
         web_info = self.web_agent.fetch_info(tickers)
-        news_data = self.news_agent.fetch_news(tickers)
+
+        return self._build_report(real_time_data, web_info, news_data)
+
+    async def generate_report(self, tickers: List[Tuple[str, float]]) -> str:
+        """Generate comprehensive real-time NSE portfolio report."""
+        return self.render_text(await self.build_report(tickers))
+
+    def _build_report(self, real_time_data: List[Dict], web_info: Dict[str, str],
+                      news_data: Dict[str, List[str]]) -> Dict:
+        """Assemble fetched data into the report model, computing holding values and totals."""
+        positions = []
+        total_value = 0
+        total_change_value = 0
+        
+        for item in real_time_data:
+            position = dict(item)
+            quantity = item['quantity']
+            if 'error' not in item and quantity > 0:
+                position['holding_value'] = item['lastPrice'] * quantity
+                position['day_pnl'] = item['change'] * quantity
+                total_value += position['holding_value']
+                total_change_value += position['day_pnl']
+            positions.append(position)
+        
+        summary = None
+        if total_value > 0:
+            summary = {
+                'total_value': total_value,
+                'total_day_pnl': total_change_value,
+                'day_change_pct': (total_change_value / (total_value - total_change_value)) * 100
+            }
         
-        # Build the report
+        return {
+            'generated_at': datetime.now().isoformat(),
+            'market': 'National Stock Exchange (NSE) - India',
+            'positions': positions,
+            'summary': summary,
+            'company_info': web_info,
+            'news': news_data
+        }
+
+    @staticmethod
+    def render_text(report: Dict) -> str:
+        """Render a report model as the text report."""
         report_lines = []
         report_lines.append("🔴 NSE REAL-TIME PORTFOLIO REPORT")
         report_lines.append("=" * 50)
-        report_lines.append(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        report_lines.append(f"Market: National Stock Exchange (NSE) - India")
+        report_lines.append(f"Generated on: {datetime.fromisoformat(report['generated_at']).strftime('%Y-%m-%d %H:%M:%S')}")
+        report_lines.append(f"Market: {report['market']}")
         report_lines.append("")
         
-        # Calculate portfolio summary
-        total_value = 0
-        total_change_value = 0
-        
         # Real-Time NSE Stock Data Section
         report_lines.append("📊 REAL-TIME NSE STOCK DATA:")
         report_lines.append("-" * 35)
         
-        for item in real_time_data:
+        for item in report['positions']:
             ticker = item['ticker']
-            quantity = item['quantity']
             
             if 'error' in item:
                 report_lines.append(f"❌ {ticker}: ERROR - {item['error']}")
                 report_lines.append("")
                 continue
             
-            lastPrice = item['lastPrice']
             change = item['change']
-            pChange = item['pChange']
-            
             status_emoji = "🟢" if change >= 0 else "🔴"
             
-            # Calculate holding value
-            holding_value = lastPrice * quantity if quantity > 0 else 0
-            change_value = change * quantity if quantity > 0 else 0
-            
-            total_value += holding_value
-            total_change_value += change_value
-            
             report_lines.append(f"{status_emoji} {ticker}:")
-            report_lines.append(f"    Last Price: ₹{lastPrice:.2f}")
-            report_lines.append(f"    Change: ₹{change:+.2f} ({pChange:+.2f}%)")
+            report_lines.append(f"    Last Price: ₹{item['lastPrice']:.2f}")
+            report_lines.append(f"    Change: ₹{change:+.2f} ({item['pChange']:+.2f}%)")
             report_lines.append(f"    Previous Close: ₹{item['previousClose']:.2f}")
             report_lines.append(f"    Open: ₹{item['open']:.2f}")
             report_lines.append(f"    VWAP: ₹{item['vwap']:.2f}")
@@ -392,35 +1232,34 @@ class NSEPortfolioAgent:
             report_lines.append(f"    Circuit Limits: ₹{item['lowerCP']} - ₹{item['upperCP']}")
             report_lines.append(f"    Price Band: {item['priceBand']}")
             
-            if quantity > 0:
-                report_lines.append(f"    Holdings: {quantity} shares")
-                report_lines.append(f"    Holding Value: ₹{holding_value:.2f}")
-                report_lines.append(f"    Day P&L: ₹{change_value:+.2f}")
+            if 'holding_value' in item:
+                report_lines.append(f"    Holdings: {item['quantity']} shares")
+                report_lines.append(f"    Holding Value: ₹{item['holding_value']:.2f}")
+                report_lines.append(f"    Day P&L: ₹{item['day_pnl']:+.2f}")
             
             report_lines.append("")
         
         # Portfolio Summary
-        if total_value > 0:
+        summary = report['summary']
+        if summary:
             report_lines.append("💰 PORTFOLIO SUMMARY:")
             report_lines.append("-" * 20)
-            report_lines.append(f"Total Portfolio Value: ₹{total_value:.2f}")
-            report_lines.append(f"Total Day P&L: ₹{total_change_value:+.2f}")
-            if total_value > 0:
-                portfolio_pchange = (total_change_value / (total_value - total_change_value)) * 100
-                report_lines.append(f"Portfolio Day Change: {portfolio_pchange:+.2f}%")
+            report_lines.append(f"Total Portfolio Value: ₹{summary['total_value']:.2f}")
+            report_lines.append(f"Total Day P&L: ₹{summary['total_day_pnl']:+.2f}")
+            report_lines.append(f"Portfolio Day Change: {summary['day_change_pct']:+.2f}%")
             report_lines.append("")
         
         # Company Information Section
         report_lines.append("🏢 COMPANY INFORMATION:")
         report_lines.append("-" * 25)
-        for ticker, info in web_info.items():
+        for ticker, info in report['company_info'].items():
             report_lines.append(f"• {ticker}: {info}")
         report_lines.append("")
         
         # News Section
         report_lines.append("📰 LATEST NEWS:")
         report_lines.append("-" * 15)
-        for ticker, news_items in news_data.items():
+        for ticker, news_items in report['news'].items():
             report_lines.append(f"• {ticker}:")
             for news_item in news_items:
                 report_lines.append(f"    - {news_item}")
@@ -431,61 +1270,264 @@ class NSEPortfolioAgent:
         
         return "\n".join(report_lines)
 
-def load_portfolio_from_dataframe(df: pd.DataFrame) -> List[Tuple[str, float]]:
-    """Load portfolio data from dataframe format."""
-    try:
-        # Extract ticker and quantity pairs
-        portfolio = []
-        
-        # Find ticker column (assuming 'Ticker' from your MongoDB structure)
-        ticker_col = 'Ticker'
-        quantity_col = 'quantity'
-        
-        # Validate columns exist
-        if ticker_col not in df.columns or quantity_col not in df.columns:
-            logger.error(f"Required columns not found. Expected: {ticker_col}, {quantity_col}")
-            return []
-        
-        # Convert to list of tuples
-        for _, row in df.iterrows():
-            ticker = str(row[ticker_col]).strip()
-            try:
-                quantity = float(row[quantity_col])
-            except (ValueError, TypeError):
-                quantity = 0.0
-            
-            portfolio.append((ticker, quantity))
-        
-        return portfolio
-        
-    except Exception as e:
-        logger.error(f"Error loading portfolio from dataframe: {str(e)}")
-        return []
-    
+def load_portfolio(holdings: List[dict]) -> List[Tuple[str, float]]:
+    """(ticker, quantity) pairs for the report agents."""
+    portfolio = []
+    for item in holdings:
+        try:
+            quantity = float(item.get('quantity', 0))
+        except (ValueError, TypeError):
+            quantity = 0.0
+        portfolio.append((str(item['symbol']).strip(), quantity))
+    return portfolio
+
+
+def holdings_content_hash(holdings: List[dict]) -> str:
+    """Stable digest of a holding document's positions, independent of their order."""
+    content = sorted((str(h['symbol']), h.get('quantity', 0), h.get('price', 0)) for h in holdings)
+    return hashlib.sha256(json.dumps(content, default=str).encode()).hexdigest()
+
+
+class MarketClock:
+    """NSE session calendar plus a cached, periodically refreshed market status.
+
+    The calendar (sessions, weekends, holidays) decides the session phase
+    without any network call. The cached ``nse.market_status()`` payload, when
+    fresh, wins for whether the Capital Market is open, which covers special
+    sessions the calendar does not know about.
+    """
+
+    def __init__(self, holidays_file: str = NSE_HOLIDAYS_FILE):
+        self.holidays: Dict[date, str] = {}
+        self.status: Optional[dict] = None
+        self.status_at = 0.0
+        self.live_open: Optional[bool] = None
+        try:
+            with open(holidays_file, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    self.holidays[date.fromisoformat(row["date"].strip())] = row.get("description", "").strip()
+        except Exception as e:
+            logger.error(f"Error loading NSE holidays from {holidays_file}: {str(e)}")
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(market_time(), IST)
+
+    def is_trading_day(self, day: date) -> bool:
+        return day.weekday() < 5 and day not in self.holidays
+
+    def session(self, at: Optional[datetime] = None) -> str:
+        """Calendar phase: pre_open, open, closing, closed, weekend or holiday."""
+        at = at or self.now()
+        day = at.date()
+        if day.weekday() >= 5:
+            return "weekend"
+        if day in self.holidays:
+            return "holiday"
+        clock = at.time()
+        for name, start, end in MARKET_SESSIONS:
+            if start <= clock < end:
+                return name
+        return "closed"
+
+    def next_open(self, at: Optional[datetime] = None) -> datetime:
+        at = at or self.now()
+        day = at.date()
+        open_time = MARKET_SESSIONS[1][1]
+        if at.time() >= open_time or not self.is_trading_day(day):
+            day += timedelta(days=1)
+            while not self.is_trading_day(day):
+                day += timedelta(days=1)
+        return datetime.combine(day, open_time, tzinfo=IST)
+
+    def last_close(self, at: Optional[datetime] = None) -> datetime:
+        """End of the most recent session; quotes fetched after it carry the closing prices."""
+        at = at or self.now()
+        close_time = MARKET_SESSIONS[-1][2]
+        day = at.date()
+        if at.time() < close_time:
+            day -= timedelta(days=1)
+        while not self.is_trading_day(day):
+            day -= timedelta(days=1)
+        return datetime.combine(day, close_time, tzinfo=IST)
+
+    def status_is_fresh(self) -> bool:
+        return self.status is not None and time.time() - self.status_at < 2 * self.refresh_interval()
+
+    def is_open(self) -> bool:
+        """Whether the Capital Market is open, from cache only."""
+        if self.status_is_fresh() and self.live_open is not None:
+            return self.live_open
+        return self.session() == "open"
+
+    def prices_moving(self) -> bool:
+        """Whether quotes can change, i.e. live polling is worth it."""
+        return self.is_open() or self.session() in ("pre_open", "open", "closing")
+
+    def refresh_interval(self) -> int:
+        return MARKET_STATUS_REFRESH if self.session() in ("pre_open", "open", "closing") else MARKET_STATUS_REFRESH_CLOSED
+
+    async def refresh(self):
+        """Fetch nse.market_status() off the event loop and cache it."""
+        loop = asyncio.get_running_loop()
+        status = await loop.run_in_executor(quote_executor, timed_call, "nse.market_status", nse.market_status)
+        self.status = status
+        self.status_at = time.time()
+        self.live_open = any(
+            market.get('market') == 'Capital Market' and market.get('marketStatus') == 'Open'
+            for market in status.get('marketState', [])
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            'marketState': (self.status or {}).get('marketState', []),
+            'isOpen': self.is_open(),
+            'session': self.session(),
+            'nextOpen': self.next_open().isoformat(),
+            'statusAge': round(time.time() - self.status_at, 1) if self.status is not None else None
+        }
+
+
+market_clock = MarketClock()
+
+async def market_clock_loop():
+    """Background task to keep the cached market status fresh"""
+    global market_open
+    while True:
+        try:
+            await market_clock.refresh()
+        except Exception as e:
+            logger.error(f"Error checking market status: {e}")
+        was_open, market_open = market_open, market_clock.is_open()
+        if was_open != market_open:
+            logger.info(f"Market status: {'Open' if market_open else 'Closed'}")
+        await asyncio.sleep(market_clock.refresh_interval())
+
 def check_market_status():
-    """Check if the market is currently open"""
+    """Check if the market is currently open (cached, never calls NSE)"""
+    return market_clock.is_open()
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+class CompressionMiddleware:
+    """Compress complete responses with br or gzip once they pass ``minimum_size``.
+
+    Streamed responses (NDJSON exports, anything sent with ``more_body``) and
+    304s pass through untouched, so nothing is buffered beyond a single body.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    @staticmethod
+    def negotiate(scope) -> Optional[str]:
+        accepted = set()
+        for part in Headers(scope=scope).get("accept-encoding", "").split(","):
+            token, _, params = part.strip().partition(";")
+            if params.replace(" ", "") not in ("q=0", "q=0.0"):
+                accepted.add(token.strip().lower())
+        if BROTLI_AVAILABLE and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def compressible(self, start: dict, body: bytes) -> bool:
+        headers = Headers(raw=start["headers"])
+        return (
+            len(body) >= self.minimum_size
+            and start["status"] not in (204, 304)
+            and "content-encoding" not in headers
+            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+        )
+
+    async def __call__(self, scope, receive, send):
+        encoding = self.negotiate(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        pending_start = None
+
+        async def compressing_send(message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                pending_start = message
+                return
+            if pending_start is None:
+                await send(message)
+                return
+            start, pending_start = pending_start, None
+            body = message.get("body", b"")
+            if message.get("more_body") or not self.compressible(start, body):
+                await send(start)
+                await send(message)
+                return
+            if encoding == "br":
+                body = brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+            else:
+                body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, compressing_send)
+
+app.add_middleware(CompressionMiddleware, minimum_size=RESPONSE_COMPRESS_MIN_SIZE)
+
+def encode_cursor(doc: dict) -> str:
+    """Opaque keyset cursor pointing just past ``doc`` in ORDERS_SORT order."""
+    raw = json.dumps({"t": doc['created_at'].isoformat(), "id": str(doc['_id'])})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    """Turn a cursor into the filter that selects everything after it."""
     try:
-        status = nse.market_status()
-        market_states = status['marketState']
-        for market in market_states:
-            if market['market'] == 'Capital Market' and market['marketStatus'] == 'Open':
-                return True
-        return False
-    except Exception as e:
-        logger.error(f"Error checking market status: {e}")
-        return False
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        created_at, last_id = datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return {'$or': [
+        {'created_at': {'$lt': created_at}},
+        {'created_at': created_at, '_id': {'$lt': last_id}},
+    ]}
+
+def order_projection(fields: Optional[str]) -> Optional[dict]:
+    """Projection for a comma-separated field list; the cursor keys are always kept."""
+    if not fields:
+        return None
+    projection = {field.strip(): 1 for field in fields.split(",") if field.strip()}
+    projection.update({'created_at': 1, '_id': 1})
+    return projection
 
-def serialize_doc(doc):
-    """Convert MongoDB document to JSON serializable format"""
-    if not doc:
-        return doc
-    doc_copy = doc.copy()
-    for key, value in doc_copy.items():
-        if isinstance(value, ObjectId):
-            doc_copy[key] = str(value)
-        elif isinstance(value, datetime):
-            doc_copy[key] = value.isoformat()
-    return doc_copy
+def page_query(query: dict, cursor: Optional[str]) -> dict:
+    if not cursor:
+        return query
+    return {'$and': [query, decode_cursor(cursor)]} if query else decode_cursor(cursor)
+
+async def fetch_orders_page(query: dict, cursor: Optional[str], limit: int,
+                            projection: Optional[dict]) -> Tuple[List[dict], Optional[str]]:
+    """One page of orders, newest first, and the cursor for the next page."""
+    limit = max(1, min(limit, ORDERS_PAGE_MAX))
+    docs = await async_orders.find(page_query(query, cursor), projection, sort=ORDERS_SORT, limit=limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+async def stream_orders_ndjson(query: dict, projection: Optional[dict]):
+    """Yield every matching order as NDJSON, one keyset batch in memory at a time."""
+    cursor = None
+    while True:
+        docs = await async_orders.find(page_query(query, cursor), projection,
+                                       sort=ORDERS_SORT, limit=ORDERS_EXPORT_BATCH)
+        if not docs:
+            return
+        yield b"".join(dumps_json(doc) + b"\n" for doc in docs)
+        if len(docs) < ORDERS_EXPORT_BATCH:
+            return
+        cursor = encode_cursor(docs[-1])
 
 # WebSocket Functions
 async def format_stock_data(symbol, quote):
@@ -544,7 +1586,7 @@ async def format_stock_data(symbol, quote):
             "indexSymbol": security_info.get("index", ""),
             
             # Timestamp
-            "timestamp": int(time.time() * 1000)
+            "timestamp": int(market_time() * 1000)
         }
     except Exception as e:
         logger.error(f"Error formatting stock data for {symbol}: {str(e)}")
@@ -554,20 +1596,646 @@ async def format_stock_data(symbol, quote):
             "message": f"Error formatting data: {str(e)}"
         }
 
-async def fetch_price(symbol):
-    """Fetch and cache price data for a symbol"""
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance, giving up with ``limit + 1`` once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+class PrefixTrie:
+    """Prefix trie that keeps the best ``hits`` values on every node.
+
+    Values are stored along the whole path at insert time, so a lookup is a
+    walk down ``len(prefix)`` nodes with no subtree traversal.
+    """
+
+    def __init__(self, hits: int = 20):
+        self.hits = hits
+        self.root: Dict[str, Any] = {"": []}
+
+    def insert(self, key: str, value: str):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {"": []})
+            if len(node[""]) < self.hits and value not in node[""]:
+                node[""].append(value)
+
+    def search(self, prefix: str) -> List[str]:
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node[""]
+
+class FuzzyIndex:
+    """Symmetric-delete index (SymSpell style) for typo-tolerant term lookup.
+
+    Every term is stored under all strings reachable by deleting up to
+    ``max_distance`` characters. A query only has to generate its own deletes
+    and check the few candidates that share one, instead of scanning terms.
+    """
+
+    def __init__(self, max_distance: int = 2):
+        self.max_distance = max_distance
+        self.deletes: Dict[str, Set[str]] = {}
+
+    @staticmethod
+    def _variants(term: str, depth: int) -> Set[str]:
+        variants, frontier = {term}, {term}
+        for _ in range(depth):
+            frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+            variants |= frontier
+        return variants
+
+    def add(self, term: str):
+        for variant in self._variants(term, self.max_distance):
+            self.deletes.setdefault(variant, set()).add(term)
+
+    def search(self, term: str, max_distance: int) -> List[Tuple[int, str]]:
+        max_distance = min(max_distance, self.max_distance)
+        candidates: Set[str] = set()
+        for variant in self._variants(term, max_distance):
+            candidates |= self.deletes.get(variant, set())
+        matches = [(edit_distance(term, candidate, max_distance), candidate) for candidate in candidates]
+        return sorted(match for match in matches if match[0] <= max_distance)
+
+class SymbolMaster:
+    """In-process list of NSE equity symbols and their company names.
+
+    Search is answered locally from a prefix trie over symbols, a prefix trie
+    over company names (and each word of them), and a delete index for typos.
+    ``authoritative`` is only set for a complete exchange list; until then a
+    symbol missing from the master may still be valid and is checked live.
+    """
+
+    NAME_NOISE = {"LIMITED", "LTD", "THE", "OF", "AND", "&", "INDIA", "(INDIA)", "(I)"}
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+        self.authoritative = False
+        self.symbol_trie = PrefixTrie()
+        self.name_trie = PrefixTrie()
+        self.fuzzy = FuzzyIndex()
+        self.fuzzy_terms: Dict[str, Set[str]] = {}
+        self.loaded_at: Optional[datetime] = None
+
+    def load(self, path: str = SYMBOL_MASTER_FILE, authoritative: bool = False):
+        with open(path, newline="", encoding="utf-8") as f:
+            self.load_rows(csv.DictReader(f), authoritative)
+
+    def load_rows(self, rows, authoritative: bool = False):
+        names = {}
+        for row in rows:
+            row = {(k or "").strip().upper(): (v or "").strip() for k, v in row.items()}
+            symbol = row.get("SYMBOL", "").upper()
+            if symbol:
+                names[symbol] = row.get("NAME OF COMPANY") or symbol
+
+        # Build the new indexes aside and swap them in at once
+        symbol_trie, name_trie, fuzzy, fuzzy_terms = PrefixTrie(), PrefixTrie(), FuzzyIndex(), {}
+        for symbol in sorted(names, key=lambda s: (len(s), s)):
+            name = names[symbol].upper()
+            symbol_trie.insert(symbol, symbol)
+            name_trie.insert(name, symbol)
+            words = [word for word in name.split() if word not in self.NAME_NOISE]
+            for word in words:
+                name_trie.insert(word, symbol)
+            for term in [symbol] + words:
+                fuzzy_terms.setdefault(term, set()).add(symbol)
+        for term in fuzzy_terms:
+            fuzzy.add(term)
+
+        self.names = names
+        self.symbol_trie, self.name_trie = symbol_trie, name_trie
+        self.fuzzy, self.fuzzy_terms = fuzzy, fuzzy_terms
+        self.authoritative = authoritative
+        self.loaded_at = datetime.now()
+        logger.info(f"Symbol master loaded with {len(names)} symbols")
+
+    def refresh(self, url: str = SYMBOL_MASTER_URL):
+        """Reload the master from the full NSE equity list (blocking)."""
+        response = requests.get(url, timeout=15, headers={
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        response.raise_for_status()
+        self.load_rows(csv.DictReader(StringIO(response.text)), authoritative=True)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, str]]:
+        """Exact symbol, then symbol prefixes, then name prefixes, then close spellings."""
+        query = " ".join(query.upper().split())
+        if not query:
+            return []
+
+        found: List[str] = []
+        if query in self.names:
+            found.append(query)
+        found.extend(self.symbol_trie.search(query))
+        found.extend(self.name_trie.search(query))
+
+        if len(set(found)) < limit:
+            max_distance = 1 if len(query) <= 4 else 2
+            for _, term in self.fuzzy.search(query, max_distance):
+                found.extend(sorted(self.fuzzy_terms[term]))
+
+        results = []
+        for symbol in dict.fromkeys(found):
+            results.append({"symbol": symbol, "name": self.names[symbol]})
+            if len(results) >= limit:
+                break
+        return results
+
+    def name(self, symbol: str) -> Optional[str]:
+        return self.names.get(symbol)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+symbol_master = SymbolMaster()
+try:
+    symbol_master.load()
+except Exception as e:
+    logger.error(f"Error loading symbol master from {SYMBOL_MASTER_FILE}: {str(e)}")
+
+async def symbol_master_refresh_loop():
+    """Background task loading the full NSE equity list over the bundled partial one"""
+    while True:
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(report_executor, symbol_master.refresh)
+        except Exception as e:
+            logger.error(f"Error refreshing symbol master: {str(e)}")
+        await asyncio.sleep(SYMBOL_MASTER_REFRESH_INTERVAL if symbol_master.authoritative
+                            else SYMBOL_MASTER_RETRY_INTERVAL)
+
+def upstream_search_results(response) -> List[Dict[str, str]]:
+    """Normalize an nse.search_stock response to the symbol master's result rows."""
+    rows = response.get("symbols", []) if isinstance(response, dict) else response or []
+    results = []
+    for row in rows:
+        if isinstance(row, dict) and row.get("symbol"):
+            symbol = str(row["symbol"]).upper()
+            results.append({"symbol": symbol, "name": row.get("symbol_info") or row.get("name") or symbol})
+    return results
+
+class TickHistory:
+    """Fixed-size ring buffer of (timestamp, price) ticks for one symbol.
+
+    Backed by two preallocated NumPy arrays, so memory per symbol is fixed
+    and appends never allocate.
+    """
+
+    __slots__ = ("timestamps", "prices", "capacity", "head", "size")
+
+    def __init__(self, capacity: int = TICK_HISTORY_SIZE):
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.prices = np.zeros(capacity, dtype=np.float64)
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+
+    def append(self, timestamp: int, price: float):
+        last = (self.head - 1) % self.capacity
+        if self.size and self.timestamps[last] >= timestamp:
+            return  # Same quote seen twice, or out of order
+        self.timestamps[self.head] = timestamp
+        self.prices[self.head] = price
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def series(self, since: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Ticks in time order, optionally only those at or after ``since`` (ms)."""
+        if self.size < self.capacity:
+            timestamps, prices = self.timestamps[:self.size], self.prices[:self.size]
+        else:
+            timestamps = np.concatenate((self.timestamps[self.head:], self.timestamps[:self.head]))
+            prices = np.concatenate((self.prices[self.head:], self.prices[:self.head]))
+        if since is not None:
+            start = int(np.searchsorted(timestamps, since, side="left"))
+            timestamps, prices = timestamps[start:], prices[start:]
+        return timestamps, prices
+
+
+tick_history: LRUCache = LRUCache(maxsize=TICK_HISTORY_SYMBOLS)
+
+def record_tick(symbol: str, data: dict):
+    """Fold a freshly fetched quote into the tick history and the candle aggregator."""
+    price = data.get("lastPrice")
+    if data.get("T") != "q" or not price:
+        return
+    timestamp = int(data["timestamp"])
+    history = tick_history.get(symbol)
+    if history is None:
+        history = tick_history[symbol] = TickHistory()
+    history.append(timestamp, float(price))
+
+    day_range = data.get("intraDayHighLow", {})
+    closed = candle_aggregator.add_tick(
+        symbol, timestamp, float(price),
+        day_high=day_range.get("max"),
+        day_low=day_range.get("min"),
+    )
+    for interval, candle in closed:
+        publish_candle_close(symbol, interval, candle)
+
+def traded_volume(trade_info: Optional[dict]) -> Optional[float]:
+    """Cumulative traded volume for the day from a trade_info response, if it has one.
+
+    stock_quote does not carry volume; NSE only reports it in the separate
+    ``section=trade_info`` call.
+    """
+    volume = (((trade_info or {}).get("marketDeptOrderBook") or {}).get("tradeInfo") or {}).get("totalTradedVolume")
+    return float(volume) if isinstance(volume, (int, float)) else None
+
+def fetch_trade_info(symbol: str) -> Optional[dict]:
+    """nse.trade_info on an executor thread; None when it fails, leaving candle volume unknown."""
+    fetch = getattr(nse, "trade_info", None)
+    if fetch is None:
+        return None
+    try:
+        return timed_call("nse.trade_info", fetch, symbol)
+    except Exception as e:
+        logger.warning(f"Error fetching trade info for {symbol}: {str(e)}")
+        return None
+
+volume_inflight: Set[str] = set()  # symbols with a trade_info fetch running
+
+def has_candle_subscribers(symbol: str) -> bool:
+    return any((symbol, interval) in candle_subscribers for interval in CANDLE_INTERVALS)
+
+async def refresh_traded_volume(symbol: str):
+    """Fold the symbol's cumulative traded volume into its open candles."""
     try:
-        # Cache hit
+        loop = asyncio.get_running_loop()
+        volume = traded_volume(await loop.run_in_executor(quote_executor, fetch_trade_info, symbol))
+        if volume is not None:
+            candle_aggregator.add_volume(symbol, volume)
+    except Exception as e:
+        logger.error(f"Error updating traded volume for {symbol}: {str(e)}")
+    finally:
+        volume_inflight.discard(symbol)
+
+def schedule_volume_refresh(symbol: str):
+    """Start a trade_info fetch for a symbol someone watches candles for.
+
+    Runs after the quote has been served, so quote latency and the upstream
+    calls for unwatched symbols are unchanged.
+    """
+    if CANDLE_TRADE_INFO and symbol not in volume_inflight and has_candle_subscribers(symbol):
+        volume_inflight.add(symbol)
+        asyncio.create_task(refresh_traded_volume(symbol))
+
+class CandleAggregator:
+    """Folds ticks into rolling OHLCV candles for every interval in O(1) per tick.
+
+    Volume comes separately through ``add_volume`` as the increase in
+    cumulative traded volume between readings, credited to the candles open
+    when the reading arrives; it stays None for candles no reading reached. High
+    and low also take in any move of the day's high/low since the previous
+    quote, so a spike between two polls still lands in the candle.
+
+    State is kept for at most ``symbols`` symbols, like ``tick_history``; the
+    least recently ticked ones are evicted.
+    """
+
+    def __init__(self, intervals: Dict[str, int] = CANDLE_INTERVALS, history: int = CANDLE_HISTORY,
+                 symbols: int = TICK_HISTORY_SYMBOLS):
+        self.intervals = intervals
+        self.history = history
+        self.open: LRUCache = LRUCache(maxsize=symbols * len(intervals))  # (symbol, interval) -> candle
+        self.closed: LRUCache = LRUCache(maxsize=symbols * len(intervals))  # (symbol, interval) -> deque
+        self.last: LRUCache = LRUCache(maxsize=symbols)  # symbol -> (day high, day low)
+        self.volumes: LRUCache = LRUCache(maxsize=symbols)  # symbol -> last cumulative traded volume
+
+    def add_tick(self, symbol: str, timestamp: int, price: float, day_high: Optional[float] = None,
+                 day_low: Optional[float] = None) -> List[Tuple[str, Dict]]:
+        """Apply one tick; returns the (interval, candle) pairs it closed."""
+        high = low = price
+        previous = self.last.get(symbol)
+        if previous is not None:
+            prev_high, prev_low = previous
+            if day_high and prev_high and day_high > prev_high:
+                high = max(price, day_high)
+            if day_low and prev_low and day_low < prev_low:
+                low = min(price, day_low)
+        self.last[symbol] = (day_high, day_low)
+
+        closed = []
+        for interval, length in self.intervals.items():
+            key = (symbol, interval)
+            start = timestamp - timestamp % length
+            candle = self.open.get(key)
+            if candle is not None and candle["t"] != start:
+                if start < candle["t"]:
+                    continue  # Late tick for a candle that already closed
+                closed.append((interval, self._close(key)))
+                candle = None
+            if candle is None:
+                self.open[key] = {"t": start, "o": price, "h": high, "l": low, "c": price, "v": None, "n": 1}
+            else:
+                candle["h"] = max(candle["h"], high)
+                candle["l"] = min(candle["l"], low)
+                candle["c"] = price
+                candle["n"] += 1
+        return closed
+
+    def add_volume(self, symbol: str, cum_volume: float):
+        """Credit the volume traded since the previous reading to the symbol's open candles."""
+        previous = self.volumes.get(symbol)
+        self.volumes[symbol] = cum_volume
+        if previous is None or cum_volume < previous:
+            return  # First reading, or a new session reset the count
+        for interval in self.intervals:
+            candle = self.open.get((symbol, interval))
+            if candle is not None:
+                candle["v"] = (candle["v"] or 0.0) + (cum_volume - previous)
+
+    def flush(self, now_ms: int) -> List[Tuple[str, str, Dict]]:
+        """Close candles whose interval has ended without a new tick."""
+        closed = []
+        for key in [key for key, candle in self.open.items() if now_ms >= candle["t"] + self.intervals[key[1]]]:
+            closed.append((key[0], key[1], self._close(key)))
+        return closed
+
+    def _close(self, key: Tuple[str, str]) -> Dict:
+        candle = self.open.pop(key)
+        candles = self.closed.get(key)
+        if candles is None:
+            candles = self.closed[key] = deque(maxlen=self.history)
+        candles.append(candle)
+        return candle
+
+    def candles(self, symbol: str, interval: str, start: Optional[int] = None,
+                end: Optional[int] = None, limit: int = 100) -> List[Dict]:
+        """Closed candles plus the one still forming, oldest first."""
+        key = (symbol, interval)
+        candles = [{**candle, "closed": True} for candle in self.closed.get(key, ())]
+        if key in self.open:
+            candles.append({**self.open[key], "closed": False})
+        if start is not None:
+            candles = [c for c in candles if c["t"] >= start]
+        if end is not None:
+            candles = [c for c in candles if c["t"] < end]
+        return candles[-limit:] if limit else candles
+
+
+candle_aggregator = CandleAggregator()
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Buckets downsampling to ``threshold`` points."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    xf = x.astype(np.float64)
+    sampled = np.empty(threshold, dtype=np.int64)
+    sampled[0], sampled[-1] = 0, n - 1
+    bucket_size = (n - 2) / (threshold - 2)
+
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        if end >= next_end:
+            avg_x, avg_y = xf[n - 1], y[n - 1]
+        else:
+            avg_x, avg_y = xf[end:next_end].mean(), y[end:next_end].mean()
+
+        # Pick the point in this bucket forming the largest triangle with the
+        # previously selected point and the average of the next bucket
+        area = np.abs((xf[a] - avg_x) * (y[start:end] - y[a]) - (xf[a] - xf[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        sampled[i + 1] = a
+
+    return x[sampled], y[sampled]
+
+class QuoteService:
+    """Non-blocking, single-flight front for nse.stock_quote.
+
+    Upstream calls run on ``quote_executor`` and concurrent cache misses for
+    the same symbol share one in-flight request. Every completed fetch feeds
+    both ``quote_cache`` (raw) and ``price_cache`` (formatted). While the
+    market is closed, the last quote seen for a symbol is served instead of
+    going upstream if it was fetched after the last session closed, since it
+    cannot change until the next session; an older one is fetched once more.
+    """
+
+    def __init__(self, executor: ThreadPoolExecutor, last_close_size: int = 5000):
+        self.executor = executor
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.last_quotes: LRUCache = LRUCache(maxsize=last_close_size)  # symbol -> (quote, data, fetched at)
+
+    def closing_quote(self, symbol: str) -> Optional[Tuple[dict, dict, float]]:
+        """The last quote for a symbol if the market is closed and it postdates the close."""
+        entry = self.last_quotes.get(symbol)
+        if entry is None or market_clock.prices_moving():
+            return None
+        if entry[2] < market_clock.last_close().timestamp():
+            return None  # Fetched during an earlier session
+        return entry
+
+    async def get_quote(self, symbol: str) -> dict:
+        """Return the raw NSE quote for a symbol, fetching it at most once per miss."""
+        if symbol in quote_cache:
+            cache_requests.inc("quote", "hit")
+            return quote_cache[symbol]
+        entry = self.closing_quote(symbol)
+        if entry is not None:
+            cache_requests.inc("quote", "last_close")
+            return entry[0]
+        cache_requests.inc("quote", "miss")
+
+        task = self._inflight.get(symbol)
+        if task is None:
+            task = asyncio.create_task(self._fetch(symbol))
+            self._inflight[symbol] = task
+        # Shield so a cancelled waiter does not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+    async def get_price(self, symbol: str) -> dict:
+        """Return the formatted price data for a symbol."""
         if symbol in price_cache:
+            cache_requests.inc("price", "hit")
             return price_cache[symbol]
-
-        # Live fetch
-        quote = nse.stock_quote(symbol)
-        data = await format_stock_data(symbol, quote)
-        
-        # Cache the data
-        price_cache[symbol] = data
+        entry = self.closing_quote(symbol)
+        if entry is not None:
+            cache_requests.inc("price", "last_close")
+            return entry[1]
+        cache_requests.inc("price", "miss")
+        quote = await self.get_quote(symbol)
+        data = price_cache.get(symbol)
+        if data is None:
+            data = await format_stock_data(symbol, quote)
+            price_cache[symbol] = data
         return data
+
+    async def _fetch(self, symbol: str) -> dict:
+        try:
+            loop = asyncio.get_running_loop()
+            fetched_at = market_time()
+            quote = await loop.run_in_executor(self.executor, timed_call, "nse.stock_quote", nse.stock_quote, symbol)
+            quote_cache[symbol] = quote
+            data = await format_stock_data(symbol, quote)
+            price_cache[symbol] = data
+            self.last_quotes[symbol] = (quote, data, fetched_at)
+            record_tick(symbol, data)
+            schedule_volume_refresh(symbol)
+            return quote
+        finally:
+            self._inflight.pop(symbol, None)
+
+
+quote_service = QuoteService(quote_executor)
+
+def cached_price(symbol: str) -> Optional[dict]:
+    """Latest formatted price for a symbol without going upstream."""
+    data = price_cache.get(symbol)
+    if data is None and symbol in quote_service.last_quotes:
+        data = quote_service.last_quotes[symbol][1]
+    return data
+
+
+def nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    """Convert an array to JSON-friendly floats, with NaN as None."""
+    return [None if v != v else v for v in np.round(values, 2).tolist()]
+
+
+class ValuationEngine:
+    """Marks any number of holding documents to market in one vectorized pass.
+
+    Positions from every document are flattened in one pass into parallel
+    arrays (owner, symbol code, quantity, average price). Prices are looked
+    up once per distinct symbol and broadcast back to positions, and per-portfolio
+    totals are summed with ``np.bincount``, so the cost is a few array
+    operations over all positions rather than a Python loop per position.
+    Positions without a cached price are reported as unpriced and left out
+    of the totals.
+    """
+
+    def flatten(self, docs: List[dict]):
+        holding_ids, owner, codes, quantity, avg_price = [], [], [], [], []
+        universe: Dict[str, int] = {}  # symbol -> code, in first-seen order
+        for index, doc in enumerate(docs):
+            holding_ids.append(doc['HoldingId'])
+            for h in doc.get('Holdings', []):
+                owner.append(index)
+                codes.append(universe.setdefault(h['symbol'], len(universe)))
+                quantity.append(h['quantity'])
+                avg_price.append(h.get('price', 0))
+        return (holding_ids, list(universe), np.array(owner, dtype=np.intp), np.array(codes, dtype=np.intp),
+                np.array(quantity, dtype=np.float64), np.array(avg_price, dtype=np.float64))
+
+    def price_vectors(self, universe: List[str], prices: Dict[str, dict]) -> Tuple[np.ndarray, np.ndarray]:
+        """Last price and day change per distinct symbol (NaN when unknown)."""
+        last = np.full(len(universe), np.nan)
+        change = np.full(len(universe), np.nan)
+        for i, symbol in enumerate(universe):
+            data = prices.get(symbol)
+            if data and data.get("T") == "q" and data.get("lastPrice"):
+                last[i] = data["lastPrice"]
+                change[i] = data.get("change") or 0.0
+        return last, change
+
+    def value(self, docs: List[dict], prices: Dict[str, dict], include_positions: bool = False) -> List[dict]:
+        holding_ids, universe, owner, codes, quantity, avg_price = self.flatten(docs)
+        last, change = self.price_vectors(universe, prices)
+
+        ltp = last[codes]
+        priced = ~np.isnan(ltp)
+        market_value = quantity * ltp
+        cost = quantity * avg_price
+        unrealized = market_value - cost
+        day_pnl = quantity * change[codes]
+
+        count = len(holding_ids)
+
+        def per_portfolio(values):
+            return np.bincount(owner, weights=np.where(priced, values, 0.0), minlength=count)
+
+        total_value = per_portfolio(market_value)
+        total_cost = per_portfolio(cost)
+        total_unrealized = per_portfolio(unrealized)
+        total_day = per_portfolio(day_pnl)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.where(priced, market_value / total_value[owner] * 100, np.nan)
+            unrealized_pct = np.where(total_cost > 0, total_unrealized / total_cost * 100, np.nan)
+            opening_value = total_value - total_day
+            day_pct = np.where(opening_value > 0, total_day / opening_value * 100, np.nan)
+
+        results = [
+            {
+                "HoldingId": holding_id,
+                "market_value": value,
+                "cost_basis": cost_basis,
+                "unrealized_pnl": pnl,
+                "unrealized_pnl_pct": pnl_pct,
+                "day_pnl": day,
+                "day_pnl_pct": pct,
+                "unpriced": [],
+            }
+            for holding_id, value, cost_basis, pnl, pnl_pct, day, pct in zip(
+                holding_ids, nan_to_none(total_value), nan_to_none(total_cost), nan_to_none(total_unrealized),
+                nan_to_none(unrealized_pct), nan_to_none(total_day), nan_to_none(day_pct)
+            )
+        ]
+        for i in np.flatnonzero(~priced).tolist():
+            results[owner[i]]["unpriced"].append(universe[codes[i]])
+
+        if include_positions:
+            for result in results:
+                result["positions"] = []
+            columns = zip(
+                owner.tolist(), [universe[code] for code in codes.tolist()], quantity.tolist(), nan_to_none(avg_price), nan_to_none(ltp),
+                nan_to_none(market_value), nan_to_none(unrealized), nan_to_none(day_pnl), nan_to_none(weight)
+            )
+            for o, symbol, qty, avg, price, value, pnl, day, w in columns:
+                results[o]["positions"].append({
+                    "symbol": symbol,
+                    "quantity": qty,
+                    "avg_price": avg,
+                    "last_price": price,
+                    "market_value": value,
+                    "unrealized_pnl": pnl,
+                    "day_pnl": day,
+                    "weight": w,
+                })
+        return results
+
+
+valuation_engine = ValuationEngine()
+
+
+async def value_holdings(docs: List[dict], include_positions: bool) -> List[dict]:
+    """Value holding documents, first fetching quotes for symbols not in cache."""
+    symbols = sorted({h['symbol'] for doc in docs for h in doc.get('Holdings', [])})
+    prices = {symbol: cached_price(symbol) for symbol in symbols}
+    missing = [symbol for symbol, data in prices.items() if data is None]
+    fetched = await gather_with_deadline(missing, quote_service.get_price, REPORT_MAX_CONCURRENCY, REPORT_QUOTE_TIMEOUT)
+    for symbol, data in zip(missing, fetched):
+        if isinstance(data, Exception):
+            logger.error(f"Error pricing {symbol} for valuation: {str(data)}")
+        else:
+            prices[symbol] = data
+    return valuation_engine.value(docs, prices, include_positions)
+
+
+async def fetch_price(symbol):
+    """Fetch and cache price data for a symbol"""
+    try:
+        return await quote_service.get_price(symbol)
     except Exception as e:
         logger.error(f"Error fetching price for {symbol}: {str(e)}")
         return {
@@ -576,158 +2244,967 @@ async def fetch_price(symbol):
             "message": f"Error fetching data: {str(e)}"
         }
 
-async def price_broadcast_loop():
-    """Background task to broadcast price updates to WebSocket clients"""
-    while True:
-        try:
-            for symbol, clients in list(symbol_subscribers.items()):
-                if not clients:
-                    continue
-                
-                data = await fetch_price(symbol)
-                disconnected = []
-                
-                for client in clients:
-                    try:
-                        await client.send_json(data)
-                    except Exception as e:
-                        logger.error(f"Error sending to client: {str(e)}")
-                        disconnected.append(client)
-                
-                # Remove disconnected clients
-                for dc in disconnected:
-                    clients.discard(dc)
-                
-                # Clean up empty subscriptions
-                if not clients:
-                    del symbol_subscribers[symbol]
-                    
-            await asyncio.sleep(3)  # Update every 3 seconds
-            
-        except Exception as e:
-            logger.error(f"Error in price broadcast loop: {str(e)}")
-            await asyncio.sleep(1)  # Wait before retrying
+def encode_message(data: dict) -> str:
+    """Encode a WebSocket message the same way ``send_json`` does, once."""
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
 
-# API Models (for documentation)
-class OrderRequest(BaseModel):
-    symbol: str
-    quantity: int
-    order_type: str
-    target_price: float
-    Email: str
-    OrderId: str
-    HoldingId: str
+def encode_binary(data: dict) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
 
-# WebSocket Endpoints
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time stock data"""
-    await websocket.accept()
-    active_connections.add(websocket)
-    
-    try:
-        while True:
-            data = await websocket.receive_json()
-            action = data.get("action")
-            symbol = data.get("symbol", "").upper()
+# Short wire keys for protocol v2, mapped to their path in format_stock_data output
+COMPACT_FIELDS = {
+    "lp": ("lastPrice",),
+    "o": ("open",),
+    "c": ("close",),
+    "ch": ("change",),
+    "pc": ("pChange",),
+    "pv": ("previousClose",),
+    "vw": ("vwap",),
+    "dh": ("intraDayHighLow", "max"),
+    "dl": ("intraDayHighLow", "min"),
+    "wh": ("weekHighLow", "max"),
+    "wl": ("weekHighLow", "min"),
+    "whd": ("weekHighLow", "maxDate"),
+    "wld": ("weekHighLow", "minDate"),
+    "ucp": ("upperCP",),
+    "lcp": ("lowerCP",),
+    "pb": ("pPriceBand",),
+    "bp": ("basePrice",),
+    "ieq": ("ieq",),
+    "nav": ("iNavValue",),
+    "ts": ("tickSize",),
+    "sic": ("stockIndClosePrice",),
+    "cnav": ("checkINAV",),
+    "ms": ("marketStatus",),
+    "adv": ("advances",),
+    "dec": ("declines",),
+    "unc": ("unchanged",),
+    "n": ("name",),
+    "ix": ("indexSymbol",),
+    "t": ("timestamp",),
+}
 
-            if action == "subscribe" and symbol:
-                # Validate the stock symbol
-                try:
-                    quote = nse.stock_quote(symbol)
-                    if quote and "priceInfo" in quote:
-                        # Create subscription entry if it doesn't exist
-                        if symbol not in symbol_subscribers:
-                            symbol_subscribers[symbol] = set()
-                        
-                        symbol_subscribers[symbol].add(websocket)
-                        await websocket.send_json({"message": f"Subscribed to {symbol}"})
-                        
-                        # Send initial data immediately
-                        initial_data = await format_stock_data(symbol, quote)
-                        await websocket.send_json(initial_data)
-                    else:
-                        await websocket.send_json({"error": f"Invalid stock symbol: {symbol}"})
-                except Exception as e:
-                    logger.error(f"Error subscribing to {symbol}: {str(e)}")
-                    await websocket.send_json({"error": f"Error subscribing to {symbol}: {str(e)}"})
+def compact_quote(data: dict) -> dict:
+    compact = {}
+    for key, path in COMPACT_FIELDS.items():
+        value = data
+        for part in path:
+            value = value.get(part) if isinstance(value, dict) else None
+        compact[key] = value
+    return compact
 
-            elif action == "unsubscribe" and symbol:
-                if symbol in symbol_subscribers:
-                    symbol_subscribers[symbol].discard(websocket)
-                    await websocket.send_json({"message": f"Unsubscribed from {symbol}"})
-                    
-                    # Remove empty subscription sets to save memory
-                    if not symbol_subscribers[symbol]:
-                        del symbol_subscribers[symbol]
+class TickFrame:
+    """One update for a symbol, encoded lazily at most once per wire format.
 
-    except WebSocketDisconnect:
-        logger.info("WebSocket disconnected")
-        active_connections.discard(websocket)
-        for symbol, subscribers in list(symbol_subscribers.items()):
-            subscribers.discard(websocket)
-            if not subscribers:
-                del symbol_subscribers[symbol]
-    except Exception as e:
-        logger.error(f"WebSocket error: {str(e)}")
-        active_connections.discard(websocket)
+    Quote frames are chained per symbol: ``base_seq`` is the sequence of the
+    previous frame, and ``delta`` holds only the compact fields that changed
+    since then. Any other payload (errors) is passed through unchanged.
+    """
 
-# REST API Endpoints
-@app.get("/report_generation/{holding_id}")
-async def generate_report(holding_id: str):
-    """Generate NSE portfolio report for given holding ID."""
-    try:
-        if not holding_id:
-            raise HTTPException(status_code=400, detail="No holding_id provided")
+    def __init__(self, symbol: str, data: dict, previous: Optional["TickFrame"] = None):
+        self.symbol = symbol
+        self.data = data
+        self.is_quote = data.get("T") == "q"
+        self.seq = previous.seq + 1 if previous else 1
+        self.base_seq = previous.seq if previous else None
+        self.compact = compact_quote(data) if self.is_quote else {}
+        if previous is not None and previous.is_quote:
+            self.delta = {k: v for k, v in self.compact.items() if previous.compact.get(k) != v}
+        else:
+            self.delta = None
+        self._encoded: Dict[Tuple[str, bool], Any] = {}
 
-        holdings_df = fetch_holdings_from_db(holding_id)
+    def encode(self, kind: str, binary: bool = False):
+        key = (kind, binary)
+        if key not in self._encoded:
+            if kind == "snapshot":
+                message = {"T": "s", "S": self.symbol, "q": self.seq, **self.compact}
+            elif kind == "delta":
+                message = {"T": "d", "S": self.symbol, "q": self.seq, **self.delta}
+            else:
+                message = self.data
+            self._encoded[key] = encode_binary(message) if binary else encode_message(message)
+        return self._encoded[key]
 
-        if holdings_df is None or holdings_df.empty:
-            raise HTTPException(
-                status_code=404, 
-                detail={
-                    'error': 'No holdings found',
-                    'message': f'No holdings found for holding_id: {holding_id}'
-                }
-            )
+def publish_frame(symbol: str, data: dict) -> TickFrame:
+    """Wrap fresh data for a symbol in a frame chained to the previous one."""
+    latest = symbol_frames.get(symbol)
+    if latest is not None and latest.data is data:
+        return latest  # Same cached quote as last tick
+    frame = TickFrame(symbol, data, latest)
+    if frame.is_quote:
+        symbol_frames[symbol] = frame
+    return frame
 
-        portfolio = load_portfolio_from_dataframe(holdings_df)
-        if not portfolio:
-            raise HTTPException(status_code=500, detail="Invalid portfolio data")
+class QuoteBatch:
+    """An encoded batch message plus the v2 sequence it delivers per symbol."""
 
-        portfolio_agent = NSEPortfolioAgent(
-            api_base_url=None,
-            news_api_key=None
-        )
+    __slots__ = ("payload", "seqs")
 
-        report = portfolio_agent.generate_report(portfolio)
+    def __init__(self, payload, seqs: Dict[str, int]):
+        self.payload = payload
+        self.seqs = seqs
 
-        return {
-            'success': True,
-            'holding_id': holding_id,
-            'report': report,
-            'portfolio_count': len(portfolio),
-            'holdings_data': holdings_df.to_dict('records'),
-            'generated_at': datetime.now().isoformat()
-        }
+class ClientConnection:
+    """A WebSocket client with its own bounded, coalescing send queue.
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Error generating report: {str(e)}")
-        raise HTTPException(status_code=500, detail={'error': 'Internal Server Error', 'message': str(e)})
-    
-@app.get("/")
-async def root():
-    """Root endpoint that returns a simple HTML page"""
-    try:
-        return HTMLResponse(content="""
-        <html>
-            <head>
-                <title>NSE Stock API</title>
-            </head>
-            <body>
-                <h1>NSE Stock API</h1>
+    Messages are queued under a key. A newer message for a key that is still
+    waiting replaces it (latest price wins), and once ``max_pending`` keys are
+    queued the oldest is dropped. A dedicated writer task drains the queue,
+    so a slow socket only ever delays itself. ``sent_seq`` only advances once
+    a frame has been written, so a dropped frame is never used as a delta base.
+    """
+
+    def __init__(self, websocket: WebSocket, max_pending: int = WS_MAX_PENDING,
+                 protocol: int = PROTOCOL_V1, binary: bool = False):
+        self.websocket = websocket
+        self.max_pending = max_pending
+        self.protocol = protocol
+        self.binary = binary
+        self.pending: "OrderedDict[Any, Any]" = OrderedDict()
+        self.sent_seq: Dict[str, int] = {}  # last v2 frame delivered per symbol
+        self.symbols: Set[str] = set()
+        self.candle_keys: Set[Tuple[str, str]] = set()
+        self.email: Optional[str] = None  # account whose order fills this client receives
+        self.portfolios: Set[str] = set()  # HoldingIds with live P&L subscriptions
+        self.closed = False
+        self.coalesced = 0
+        self.dropped = 0
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._writer = asyncio.create_task(self._drain())
+
+    def enqueue(self, key, payload) -> bool:
+        """Queue an encoded payload or a TickFrame without blocking. Returns False once the client is gone."""
+        if self.closed:
+            return False
+        if key in self.pending:
+            self.coalesced += 1
+        elif len(self.pending) >= self.max_pending:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[key] = payload
+        self._wakeup.set()
+        return True
+
+    def send(self, message: dict) -> bool:
+        """Queue a one-off message (ack, error) that is never coalesced."""
+        return self.send_encoded(self.encode(message))
+
+    def send_encoded(self, payload) -> bool:
+        """Queue an already encoded one-off message."""
+        self._seq += 1
+        return self.enqueue(("msg", self._seq), payload)
+
+    def encode(self, message: dict):
+        return encode_binary(message) if self.binary else encode_message(message)
+
+    def send_batch(self, frames: List[TickFrame]) -> bool:
+        """Queue one snapshot message covering several symbols."""
+        quotes, seqs = [], {}
+        for frame in frames:
+            # Anything queued for these symbols is superseded by the batch
+            self.pending.pop(frame.symbol, None)
+            if self.protocol == PROTOCOL_V2:
+                quotes.append({"S": frame.symbol, "q": frame.seq, **frame.compact})
+                seqs[frame.symbol] = frame.seq
+            else:
+                quotes.append(frame.data)
+        self._seq += 1
+        return self.enqueue(("msg", self._seq), QuoteBatch(self.encode({"T": "b", "quotes": quotes}), seqs))
+
+    def render(self, frame: TickFrame):
+        """Pick the shared encoding of a frame this client needs, or None if it is up to date."""
+        if self.protocol == PROTOCOL_V1 or not frame.is_quote:
+            return frame.encode("full", self.binary)
+
+        sent = self.sent_seq.get(frame.symbol)
+        if sent == frame.seq:
+            return None
+        if sent is not None and sent == frame.base_seq:
+            return frame.encode("delta", self.binary)
+        # First message for the symbol, or an update was coalesced away: resync
+        return frame.encode("snapshot", self.binary)
+
+    async def _drain(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self.pending:
+                    _, payload = self.pending.popitem(last=False)
+                    delivered = None
+                    if isinstance(payload, TickFrame):
+                        frame, payload = payload, self.render(payload)
+                        if payload is None:
+                            continue
+                        if self.protocol == PROTOCOL_V2 and frame.is_quote:
+                            delivered = {frame.symbol: frame.seq}
+                    elif isinstance(payload, QuoteBatch):
+                        payload, delivered = payload.payload, payload.seqs
+                    if isinstance(payload, bytes):
+                        await asyncio.wait_for(self.websocket.send_bytes(payload), WS_SEND_TIMEOUT)
+                    else:
+                        await asyncio.wait_for(self.websocket.send_text(payload), WS_SEND_TIMEOUT)
+                    if delivered:
+                        for symbol, seq in delivered.items():
+                            if symbol in self.symbols:  # Not unsubscribed while the frame was in flight
+                                self.sent_seq[symbol] = seq
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Dropping WebSocket client: {str(e) or type(e).__name__}")
+            asyncio.create_task(self._close_socket())
+        finally:
+            self.closed = True
+            self.pending.clear()
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.websocket.close(), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        self._writer.cancel()
+
+def subscribe_client(conn: ClientConnection, symbol: str):
+    symbol_subscribers.setdefault(symbol, set()).add(conn)
+    conn.symbols.add(symbol)
+
+def unsubscribe_client(conn: ClientConnection, symbol: str):
+    subscribers = symbol_subscribers.get(symbol)
+    if subscribers is not None:
+        subscribers.discard(conn)
+        # Remove empty subscription sets to save memory
+        if not subscribers:
+            del symbol_subscribers[symbol]
+            symbol_frames.pop(symbol, None)
+    conn.symbols.discard(symbol)
+    conn.sent_seq.pop(symbol, None)
+
+def subscribe_candles(conn: ClientConnection, symbol: str, interval: str):
+    candle_subscribers.setdefault((symbol, interval), set()).add(conn)
+    conn.candle_keys.add((symbol, interval))
+
+def unsubscribe_candles(conn: ClientConnection, symbol: str, interval: str):
+    subscribers = candle_subscribers.get((symbol, interval))
+    if subscribers is not None:
+        subscribers.discard(conn)
+        if not subscribers:
+            del candle_subscribers[(symbol, interval)]
+    conn.candle_keys.discard((symbol, interval))
+
+def remove_client(conn: ClientConnection):
+    """Forget a connection everywhere and stop its writer."""
+    if active_connections.pop(conn.websocket, None) is not None:
+        ws_retired["coalesced"] += conn.coalesced
+        ws_retired["dropped"] += conn.dropped
+    for symbol in list(conn.symbols):
+        unsubscribe_client(conn, symbol)
+    for symbol, interval in list(conn.candle_keys):
+        unsubscribe_candles(conn, symbol, interval)
+    unsubscribe_orders(conn)
+    indices_subscribers.pop(conn, None)
+    for holding_id in list(conn.portfolios):
+        portfolio_tracker.unsubscribe(conn, holding_id)
+    conn.close()
+
+def subscribe_orders(conn: ClientConnection, email: str):
+    unsubscribe_orders(conn)
+    user_connections.setdefault(email, set()).add(conn)
+    conn.email = email
+
+def unsubscribe_orders(conn: ClientConnection):
+    if conn.email is None:
+        return
+    clients = user_connections.get(conn.email)
+    if clients is not None:
+        clients.discard(conn)
+        if not clients:
+            del user_connections[conn.email]
+    conn.email = None
+
+def publish_candle_close(symbol: str, interval: str, candle: Dict):
+    """Push a closed candle to its channel subscribers, encoded once."""
+    clients = candle_subscribers.get((symbol, interval))
+    if not clients:
+        return
+    frame = TickFrame(symbol, {"T": "c", "S": symbol, "i": interval, **candle})
+    for conn in list(clients):
+        if not conn.enqueue(("c", symbol, interval, candle["t"]), frame):
+            remove_client(conn)
+
+def polled_symbols() -> List[str]:
+    """Every symbol the broadcast loop has to keep fetching."""
+    symbols = {symbol for symbol, clients in symbol_subscribers.items() if clients}
+    symbols.update(symbol for symbol, _ in candle_subscribers)
+    # Resting limit orders and live portfolios need ticks even when nobody is watching the symbol
+    symbols.update(order_book.symbols())
+    symbols.update(portfolio_tracker.symbols())
+    return list(symbols)
+
+def fan_out(symbol: str, data: dict) -> int:
+    """Queue one symbol update for every subscriber; each wire format is encoded once."""
+    clients = symbol_subscribers.get(symbol)
+    if not clients:
+        return 0
+
+    frame = publish_frame(symbol, data)
+    for conn in list(clients):
+        if not conn.enqueue(symbol, frame):
+            remove_client(conn)
+    return len(clients)
+
+class LivePortfolio:
+    """Running P&L totals for one holding document.
+
+    Each position remembers its last price, so a tick only swaps that
+    position's contribution out of the totals instead of re-summing the
+    whole portfolio.
+    """
+
+    def __init__(self, holding_id: str):
+        self.holding_id = holding_id
+        self.positions: Dict[str, Dict[str, Any]] = {}
+        self.market_value = 0.0
+        self.day_pnl = 0.0
+        self.cost_basis = 0.0  # of priced positions only, so unrealized P&L compares like with like
+        self.subscribers: Set[ClientConnection] = set()
+
+    def load(self, holdings: List[dict]):
+        self.positions = {}
+        self.market_value = self.day_pnl = self.cost_basis = 0.0
+        for h in holdings:
+            position = self.positions.setdefault(h['symbol'], {
+                "symbol": h['symbol'], "quantity": 0, "avg_price": 0.0, "last_price": None, "change": 0.0
+            })
+            position["quantity"] += h['quantity']
+            position["avg_price"] = h.get('price', 0)
+
+    def apply(self, symbol: str, last_price: float, change: float) -> bool:
+        """Re-mark one position. Returns False when the price did not move it."""
+        position = self.positions[symbol]
+        if position["last_price"] == last_price and position["change"] == change:
+            return False
+        quantity = position["quantity"]
+        if position["last_price"] is None:
+            self.cost_basis += quantity * position["avg_price"]
+        else:
+            self.market_value -= quantity * position["last_price"]
+            self.day_pnl -= quantity * position["change"]
+        position["last_price"] = last_price
+        position["change"] = change
+        self.market_value += quantity * last_price
+        self.day_pnl += quantity * change
+        return True
+
+    def totals(self) -> dict:
+        unrealized = self.market_value - self.cost_basis
+        opening_value = self.market_value - self.day_pnl
+        return {
+            "HoldingId": self.holding_id,
+            "market_value": round(self.market_value, 2),
+            "cost_basis": round(self.cost_basis, 2),
+            "unrealized_pnl": round(unrealized, 2),
+            "unrealized_pnl_pct": round(unrealized / self.cost_basis * 100, 2) if self.cost_basis > 0 else None,
+            "day_pnl": round(self.day_pnl, 2),
+            "day_pnl_pct": round(self.day_pnl / opening_value * 100, 2) if opening_value > 0 else None,
+        }
+
+    def position(self, symbol: str) -> dict:
+        position = self.positions[symbol]
+        last_price = position["last_price"]
+        quantity = position["quantity"]
+        return {
+            "symbol": symbol,
+            "quantity": quantity,
+            "avg_price": position["avg_price"],
+            "last_price": last_price,
+            "market_value": round(quantity * last_price, 2) if last_price is not None else None,
+            "unrealized_pnl": round(quantity * (last_price - position["avg_price"]), 2) if last_price is not None else None,
+            "day_pnl": round(quantity * position["change"], 2) if last_price is not None else None,
+        }
+
+    def snapshot(self) -> dict:
+        return {"T": "P", **self.totals(), "positions": [self.position(symbol) for symbol in self.positions]}
+
+
+class PortfolioTracker:
+    """Live P&L for subscribed portfolios, driven by the price stream.
+
+    A symbol -> HoldingIds reverse index means a tick only touches the
+    portfolios that hold that symbol. Subscribers get a ``P`` snapshot on
+    subscribe, then ``p`` messages with fresh totals and ``pp`` messages
+    with the position that moved; both are coalesced per portfolio (and
+    symbol) in the client's queue, so a slow client just sees the latest.
+    """
+
+    def __init__(self):
+        self.portfolios: Dict[str, LivePortfolio] = {}
+        self.holders: Dict[str, Set[str]] = {}
+
+    def symbols(self) -> List[str]:
+        return list(self.holders)
+
+    async def subscribe(self, conn: ClientConnection, holding_id: str) -> Optional[LivePortfolio]:
+        portfolio = self.portfolios.get(holding_id)
+        if portfolio is None:
+            doc = await async_holdings.find_one({'HoldingId': holding_id}, {'Holdings': 1})
+            if not doc:
+                return None
+            # Another subscriber may have loaded it while we waited on Mongo
+            portfolio = self.portfolios.get(holding_id)
+            if portfolio is None:
+                portfolio = self.portfolios[holding_id] = LivePortfolio(holding_id)
+                self._load(portfolio, doc.get('Holdings', []))
+        portfolio.subscribers.add(conn)
+        conn.portfolios.add(holding_id)
+        return portfolio
+
+    def unsubscribe(self, conn: ClientConnection, holding_id: str):
+        conn.portfolios.discard(holding_id)
+        portfolio = self.portfolios.get(holding_id)
+        if portfolio is None:
+            return
+        portfolio.subscribers.discard(conn)
+        if not portfolio.subscribers:
+            self._unindex(portfolio)
+            del self.portfolios[holding_id]
+
+    def on_tick(self, symbol: str, data: dict):
+        """Re-mark the positions a tick affects and push their portfolios' new totals."""
+        holders = self.holders.get(symbol)
+        if not holders or data.get("T") != "q" or not data.get("lastPrice"):
+            return
+        for holding_id in list(holders):
+            portfolio = self.portfolios[holding_id]
+            if portfolio.apply(symbol, data["lastPrice"], data.get("change") or 0.0):
+                self._push(portfolio, ("p", holding_id), {"T": "p", **portfolio.totals()})
+                self._push(portfolio, ("pp", holding_id, symbol),
+                           {"T": "pp", "HoldingId": holding_id, **portfolio.position(symbol)})
+
+    def refresh(self, holding_id: str):
+        """Reload a tracked portfolio after its holdings changed (an order executed)."""
+        if holding_id in self.portfolios:
+            asyncio.create_task(self._reload(holding_id))
+
+    async def _reload(self, holding_id: str):
+        try:
+            doc = await async_holdings.find_one({'HoldingId': holding_id}, {'Holdings': 1})
+        except Exception as e:
+            logger.error(f"Error reloading portfolio {holding_id}: {str(e)}")
+            return
+        portfolio = self.portfolios.get(holding_id)
+        if portfolio is None:
+            return
+        self._unindex(portfolio)
+        self._load(portfolio, (doc or {}).get('Holdings', []))
+        self._push(portfolio, ("P", holding_id), portfolio.snapshot())
+
+    def _load(self, portfolio: LivePortfolio, holdings: List[dict]):
+        portfolio.load(holdings)
+        for symbol in portfolio.positions:
+            self.holders.setdefault(symbol, set()).add(portfolio.holding_id)
+            data = cached_price(symbol)
+            if data and data.get("T") == "q" and data.get("lastPrice"):
+                portfolio.apply(symbol, data["lastPrice"], data.get("change") or 0.0)
+
+    def _unindex(self, portfolio: LivePortfolio):
+        for symbol in portfolio.positions:
+            holders = self.holders.get(symbol)
+            if holders is not None:
+                holders.discard(portfolio.holding_id)
+                if not holders:
+                    del self.holders[symbol]
+
+    def _push(self, portfolio: LivePortfolio, key, message: dict):
+        for conn in list(portfolio.subscribers):
+            if not conn.enqueue(key, conn.encode(message)):
+                remove_client(conn)
+
+
+portfolio_tracker = PortfolioTracker()
+
+async def price_broadcast_loop():
+    """Background task to broadcast price updates to WebSocket clients"""
+    while True:
+        try:
+            started = time.perf_counter()
+            symbols = polled_symbols()
+            
+            # Quotes are fetched concurrently; fan-out itself never awaits a socket
+            updates = await asyncio.gather(*(fetch_price(symbol) for symbol in symbols))
+            for symbol, data in zip(symbols, updates):
+                fan_out(symbol, data)
+                match_orders(symbol, data)
+                portfolio_tracker.on_tick(symbol, data)
+
+            # Close candles for intervals that ended without a tick
+            for symbol, interval, candle in candle_aggregator.flush(int(market_time() * 1000)):
+                publish_candle_close(symbol, interval, candle)
+            broadcast_cycle_seconds.observe(time.perf_counter() - started)
+                    
+            # Poll live while prices can move; otherwise idle and re-serve the last close
+            await asyncio.sleep(live_poll_interval() if market_clock.prices_moving() else CLOSED_POLL_INTERVAL)
+            
+        except Exception as e:
+            logger.error(f"Error in price broadcast loop: {str(e)}")
+            await asyncio.sleep(1)  # Wait before retrying
+
+# API Models (for documentation)
+class OrderRequest(BaseModel):
+    symbol: str
+    quantity: int
+    order_type: str
+    target_price: float
+    Email: str
+    OrderId: str
+    HoldingId: str
+
+def requested_symbols(data: dict) -> Tuple[List[str], bool]:
+    """Symbols named in a WS action and whether they came as a ``symbols`` list."""
+    symbols = data.get("symbols")
+    if isinstance(symbols, list):
+        cleaned = [str(symbol).strip().upper() for symbol in symbols if str(symbol).strip()]
+        return list(dict.fromkeys(cleaned)), True
+    symbol = str(data.get("symbol") or "").strip().upper()
+    return ([symbol] if symbol else []), False
+
+async def validate_symbols(symbols: List[str]) -> Tuple[List[str], List[str]]:
+    """Split symbols into valid and invalid, going to NSE only for ones the master does not know."""
+    unknown = [symbol for symbol in symbols if symbol not in symbol_master]
+    valid = set(symbols) - set(unknown)
+    if unknown and not symbol_master.authoritative:
+        quotes = await asyncio.gather(*(quote_service.get_quote(symbol) for symbol in unknown), return_exceptions=True)
+        for symbol, quote in zip(unknown, quotes):
+            if isinstance(quote, Exception):
+                logger.error(f"Error validating {symbol}: {str(quote)}")
+            elif quote and "priceInfo" in quote:
+                valid.add(symbol)
+    return [s for s in symbols if s in valid], [s for s in symbols if s not in valid]
+
+async def subscribe_symbols(conn: ClientConnection, symbols: List[str], batch: bool):
+    """Subscribe a connection and answer with the current quotes from cache."""
+    valid, invalid = await validate_symbols(symbols)
+
+    # Cache hits resolve immediately; misses share single-flight upstream calls
+    prices = await asyncio.gather(*(quote_service.get_price(symbol) for symbol in valid), return_exceptions=True)
+    frames = []
+    for symbol, data in zip(valid, prices):
+        if isinstance(data, Exception):
+            logger.error(f"Error subscribing to {symbol}: {str(data)}")
+            invalid.append(symbol)
+            continue
+        subscribe_client(conn, symbol)
+        frames.append(symbol_frames.get(symbol) or publish_frame(symbol, data))
+    subscribed = [frame.symbol for frame in frames]
+
+    if not batch:
+        # Single-symbol requests keep the original ack + quote messages
+        symbol = symbols[0]
+        if frames:
+            conn.send({"message": f"Subscribed to {symbol}"})
+            conn.enqueue(symbol, frames[0])
+        else:
+            conn.send({"error": f"Invalid stock symbol: {symbol}"})
+        return
+
+    conn.send({
+        "message": f"Subscribed to {len(subscribed)} symbols",
+        "subscribed": subscribed,
+        "invalid": invalid,
+    })
+    if frames:
+        conn.send_batch(frames)
+
+def negotiate_protocol(conn: ClientConnection, protocol, encoding):
+    """Switch a connection's wire protocol and confirm what was agreed."""
+    try:
+        conn.protocol = PROTOCOL_V2 if int(protocol or PROTOCOL_V1) >= PROTOCOL_V2 else PROTOCOL_V1
+    except (TypeError, ValueError):
+        conn.protocol = PROTOCOL_V1
+    conn.sent_seq.clear()
+    conn.binary = encoding == "msgpack" and MSGPACK_AVAILABLE and conn.protocol == PROTOCOL_V2
+
+    reply = {
+        "T": "hello",
+        "protocol": conn.protocol,
+        "encoding": "msgpack" if conn.binary else "json",
+    }
+    if encoding == "msgpack" and not conn.binary:
+        reply["message"] = ("msgpack is not available on this server, using json" if not MSGPACK_AVAILABLE
+                            else "msgpack requires protocol 2, using json")
+    if conn.protocol == PROTOCOL_V2:
+        reply["fields"] = {key: ".".join(path) for key, path in COMPACT_FIELDS.items()}
+    conn.send(reply)
+
+# WebSocket Endpoints
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    """WebSocket endpoint for real-time stock data
+
+    Clients may negotiate the compact protocol with ``?protocol=2`` (and
+    ``&encoding=msgpack`` for binary frames) or a ``hello`` action.
+    """
+    await websocket.accept()
+    conn = ClientConnection(websocket)
+    active_connections[websocket] = conn
+    if websocket.query_params.get("protocol"):
+        negotiate_protocol(conn, websocket.query_params.get("protocol"), websocket.query_params.get("encoding"))
+    
+    try:
+        while True:
+            data = await websocket.receive_json()
+            action = data.get("action")
+
+            if action == "hello":
+                negotiate_protocol(conn, data.get("protocol"), data.get("encoding"))
+
+            elif action == "subscribe":
+                symbols, batch = requested_symbols(data)
+                if symbols:
+                    await subscribe_symbols(conn, symbols, batch)
+
+            elif action == "unsubscribe":
+                symbols, batch = requested_symbols(data)
+                removed = [symbol for symbol in symbols if symbol in conn.symbols]
+                for symbol in removed:
+                    unsubscribe_client(conn, symbol)
+                if batch:
+                    conn.send({"message": f"Unsubscribed from {len(removed)} symbols", "unsubscribed": removed})
+                elif removed:
+                    conn.send({"message": f"Unsubscribed from {removed[0]}"})
+
+            elif action in ("subscribe_candles", "unsubscribe_candles"):
+                symbols, _ = requested_symbols(data)
+                intervals = data.get("intervals") or list(CANDLE_INTERVALS)
+                unknown = [i for i in intervals if i not in CANDLE_INTERVALS]
+                if unknown:
+                    conn.send({"error": f"Unknown candle intervals: {unknown}"})
+                    continue
+                if action == "subscribe_candles":
+                    symbols, invalid = await validate_symbols(symbols)
+                    for symbol in symbols:
+                        for interval in intervals:
+                            subscribe_candles(conn, symbol, interval)
+                    conn.send({"message": f"Subscribed to candles for {len(symbols)} symbols",
+                               "subscribed": symbols, "invalid": invalid, "intervals": intervals})
+                else:
+                    for symbol in symbols:
+                        for interval in intervals:
+                            unsubscribe_candles(conn, symbol, interval)
+                    conn.send({"message": f"Unsubscribed from candles for {len(symbols)} symbols"})
+
+            elif action == "subscribe_orders":
+                email = str(data.get("Email") or "").strip()
+                if not email:
+                    conn.send({"error": "Email is required to receive order updates"})
+                    continue
+                subscribe_orders(conn, email)
+                conn.send({"message": f"Subscribed to order updates for {email}"})
+
+            elif action == "subscribe_portfolio":
+                holding_id = str(data.get("HoldingId") or "").strip()
+                if not holding_id:
+                    conn.send({"error": "HoldingId is required to follow a portfolio"})
+                    continue
+                portfolio = await portfolio_tracker.subscribe(conn, holding_id)
+                if portfolio is None:
+                    conn.send({"error": f"Holding not found: {holding_id}"})
+                    continue
+                conn.send({"message": f"Subscribed to portfolio {holding_id}"})
+                conn.send(portfolio.snapshot())
+
+            elif action == "unsubscribe_portfolio":
+                holding_id = str(data.get("HoldingId") or "").strip()
+                portfolio_tracker.unsubscribe(conn, holding_id)
+                conn.send({"message": f"Unsubscribed from portfolio {holding_id}"})
+
+            elif action == "subscribe_indices":
+                selection = parse_index_selection(data.get("indices"))
+                try:
+                    snapshot = await indices_snapshot.get()
+                except Exception as e:
+                    conn.send({"error": f"Indices unavailable: {str(e)}"})
+                    continue
+                indices_subscribers[conn] = selection
+                rows = select_indices(snapshot.get('data', []), selection)
+                conn.send({"message": f"Subscribed to {len(rows)} indices"})
+                conn.send({"T": "i", "indices": rows})
+
+            elif action == "unsubscribe_indices":
+                indices_subscribers.pop(conn, None)
+                conn.send({"message": "Unsubscribed from indices"})
+
+            elif action == "unsubscribe_orders":
+                unsubscribe_orders(conn)
+                conn.send({"message": "Unsubscribed from order updates"})
+
+    except WebSocketDisconnect:
+        logger.info("WebSocket disconnected")
+    except Exception as e:
+        logger.error(f"WebSocket error: {str(e)}")
+    finally:
+        remove_client(conn)
+
+# REST API Endpoints
+async def portfolio_report(holdings: List[dict], with_text: bool, refresh: bool = False) -> Dict:
+    """Report for these holdings, reused while the holdings and quote window are unchanged.
+
+    The cache key is the holdings content hash plus the current
+    ``REPORT_FRESHNESS`` window, so refreshes within the window cost one
+    Mongo read and anything that changes the positions gets a new report.
+    ``refresh`` skips the cached entry and replaces it.
+    """
+    key = (holdings_content_hash(holdings), int(time.time() // REPORT_FRESHNESS))
+    entry = None if refresh else report_cache.get(key)
+    if entry is None:
+        portfolio_agent = NSEPortfolioAgent(
+            api_base_url=None,
+            news_api_key=None
+        )
+        entry = {"report": await portfolio_agent.build_report(load_portfolio(holdings))}
+        report_cache[key] = entry
+    if with_text and "text" not in entry:
+        entry["text"] = NSEPortfolioAgent.render_text(entry["report"])
+    return entry
+
+class ReportJob:
+    """One report generation run for a holding."""
+
+    def __init__(self, holding_id: str, holdings: List[dict], content_hash: str, refresh: bool = False):
+        self.id = uuid.uuid4().hex
+        self.holding_id = holding_id
+        self.holdings = holdings
+        self.content_hash = content_hash
+        self.refresh = refresh
+        self.status = "queued"
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.done = asyncio.Event()
+
+    def describe(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "holding_id": self.holding_id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error,
+            "status_url": f"/report_generation/jobs/{self.id}"
+        }
+
+
+class ReportJobQueue:
+    """Report generation on a fixed pool of background workers.
+
+    At most ``workers`` reports run at once, whatever the request rate. A
+    holding has at most one live job: submitting again while its job is
+    queued or running, or within ``REPORT_FRESHNESS`` of it finishing for the
+    same holdings content, returns that job, so double-clicks and refreshes
+    share one run. Older finished reports are rebuilt, since their prices
+    have moved on; ``ttl`` only bounds how long a job can be polled.
+    """
+
+    def __init__(self, workers: int, ttl: int):
+        self.workers = workers
+        self.jobs: TTLCache = TTLCache(maxsize=10000, ttl=ttl)  # job id -> job
+        self.latest: TTLCache = TTLCache(maxsize=10000, ttl=ttl)  # HoldingId -> most recent job
+        self.queue: Optional[asyncio.Queue] = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        for _ in range(self.workers):
+            asyncio.create_task(self._work())
+
+    def submit(self, holding_id: str, holdings: List[dict], refresh: bool = False) -> ReportJob:
+        content_hash = holdings_content_hash(holdings)
+        job = self.latest.get(holding_id)
+        if job is not None and job.content_hash == content_hash and job.status != "failed":
+            if job.status != "done":
+                return job
+            if not refresh and datetime.now() - job.finished_at < timedelta(seconds=REPORT_FRESHNESS):
+                return job
+
+        job = ReportJob(holding_id, holdings, content_hash, refresh)
+        self.jobs[job.id] = job
+        self.latest[holding_id] = job
+        self.queue.put_nowait(job)
+        logger.info(f"Queued report job {job.id} for {holding_id} ({self.queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        return self.jobs.get(job_id)
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.started_at = datetime.now()
+            try:
+                job.result = await portfolio_report(job.holdings, with_text=True, refresh=job.refresh)
+                job.status = "done"
+            except Exception as e:
+                logger.error(f"Report job {job.id} for {job.holding_id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = datetime.now()
+                job.done.set()
+                self.queue.task_done()
+
+
+report_jobs = ReportJobQueue(REPORT_WORKERS, REPORT_JOB_TTL)
+
+
+def report_response(job: ReportJob, view: str) -> Dict:
+    """The /report_generation payload for a finished job."""
+    report = job.result['report']
+    response = {
+        'success': True,
+        'holding_id': job.holding_id,
+        'job_id': job.id,
+        'data': report,
+        'portfolio_count': len(job.holdings),
+        'holdings_data': [{'Ticker': h['symbol'], 'quantity': h['quantity']} for h in job.holdings],
+        'generated_at': report['generated_at']
+    }
+    if view == "text":
+        response['report'] = job.result['text']
+    return response
+
+
+async def submit_report(holding_id: str, view: str, refresh: bool) -> ReportJob:
+    if not holding_id:
+        raise HTTPException(status_code=400, detail="No holding_id provided")
+    if view not in ("text", "json"):
+        raise HTTPException(status_code=400, detail="view must be 'text' or 'json'")
+
+    holdings = await fetch_holdings_from_db(holding_id)
+
+    if not holdings:
+        raise HTTPException(
+            status_code=404, 
+            detail={
+                'error': 'No holdings found',
+                'message': f'No holdings found for holding_id: {holding_id}'
+            }
+        )
+    return report_jobs.submit(holding_id, holdings, refresh)
+
+
+@app.get("/report_generation/{holding_id}")
+async def generate_report(holding_id: str, view: str = "text", refresh: bool = False, poll: bool = False):
+    """Generate NSE portfolio report for given holding ID.
+
+    Runs as a background job and waits for it to finish. With ``poll=true``
+    it waits at most ``REPORT_WAIT_TIMEOUT``, and slower reports answer 202
+    with the job to poll. The structured report is returned under ``data``;
+    the default ``text`` view also renders it as the text ``report``,
+    ``view=json`` leaves that out.
+    """
+    try:
+        job = await submit_report(holding_id, view, refresh)
+        try:
+            # Shielded so a client giving up does not cancel the wait for others
+            await asyncio.wait_for(asyncio.shield(job.done.wait()), REPORT_WAIT_TIMEOUT if poll else None)
+        except asyncio.TimeoutError:
+            return JSONResponse(status_code=202, content=job.describe())
+
+        if job.status == "failed":
+            raise HTTPException(status_code=500, detail={'error': 'Internal Server Error', 'message': job.error})
+        return report_response(job, view)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating report: {str(e)}")
+        raise HTTPException(status_code=500, detail={'error': 'Internal Server Error', 'message': str(e)})
+
+@app.post("/report_generation/{holding_id}")
+async def enqueue_report(holding_id: str, refresh: bool = False):
+    """Queue report generation for a holding and return the job to poll."""
+    try:
+        job = await submit_report(holding_id, "text", refresh)
+        return JSONResponse(status_code=200 if job.status == "done" else 202, content=job.describe())
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing report: {str(e)}")
+        raise HTTPException(status_code=500, detail={'error': 'Internal Server Error', 'message': str(e)})
+
+@app.get("/report_generation/jobs/{job_id}")
+async def get_report_job(job_id: str, view: str = "text"):
+    """Status of a report job, with the report once it is done."""
+    job = report_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found or expired")
+    if view not in ("text", "json"):
+        raise HTTPException(status_code=400, detail="view must be 'text' or 'json'")
+    status = job.describe()
+    if job.status == "done":
+        status["result"] = report_response(job, view)
+    return status
+    
+class ValuationRequest(BaseModel):
+    HoldingIds: Optional[List[str]] = None  # all holding documents when omitted
+    include_positions: bool = False
+
+
+@app.get("/api/valuation/{holding_id}")
+async def get_valuation(holding_id: str):
+    """Mark one portfolio to market, with per-position figures"""
+    try:
+        doc = await async_holdings.find_one({'HoldingId': holding_id}, {'HoldingId': 1, 'Holdings': 1})
+        if not doc:
+            return JSONResponse(status_code=404, content={"error": "Holding not found"})
+        valuations = await value_holdings([doc], include_positions=True)
+        return FastJSONResponse(valuations[0])
+    except Exception as e:
+        logger.error(f"Error valuing holding {holding_id}: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Error valuing holding: {str(e)}"}
+        )
+
+@app.post("/api/valuations")
+async def get_valuations(request: ValuationRequest):
+    """Mark many portfolios to market in one pass"""
+    try:
+        query = {'HoldingId': {'$in': request.HoldingIds}} if request.HoldingIds is not None else {}
+        docs = await async_holdings.find(query, {'HoldingId': 1, 'Holdings': 1})
+        started = time.perf_counter()
+        valuations = await value_holdings(docs, request.include_positions)
+        return FastJSONResponse({
+            "valuations": valuations,
+            "count": len(valuations),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+            "valued_at": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error valuing holdings: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Error valuing holdings: {str(e)}"}
+        )
+
+@app.get("/")
+async def root():
+    """Root endpoint that returns a simple HTML page"""
+    try:
+        return HTMLResponse(content="""
+        <html>
+            <head>
+                <title>NSE Stock API</title>
+            </head>
+            <body>
+                <h1>NSE Stock API</h1>
                 <p>API Documentation is available at <a href="/docs">/docs</a></p>
             </body>
         </html>
@@ -736,102 +3213,606 @@ async def root():
         logger.error(f"Error serving root page: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
-@app.get("/api/search/{query}")
-async def search_stocks(query: str):
-    """Search for stocks by query string"""
-    try:
-        search_results = nse.search_stock(query.upper())
-        return {"results": search_results}
-    except Exception as e:
-        logger.error(f"Error searching stocks: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error searching stocks: {str(e)}")
+@app.get("/api/search/{query}")
+async def search_stocks(query: str, limit: int = 10):
+    """Search for stocks by query string"""
+    try:
+        limit = max(1, min(limit, 50))
+        search_results = symbol_master.search(query, limit=limit)
+        if not symbol_master.authoritative and len(search_results) < limit:
+            # Only the bundled partial list is loaded so far: NSE may know more
+            try:
+                loop = asyncio.get_running_loop()
+                response = await loop.run_in_executor(
+                    quote_executor, timed_call, "nse.search_stock", nse.search_stock, query.upper()
+                )
+                seen = {row["symbol"] for row in search_results}
+                for row in upstream_search_results(response):
+                    if row["symbol"] not in seen and len(search_results) < limit:
+                        seen.add(row["symbol"])
+                        search_results.append(row)
+            except Exception as e:
+                logger.warning(f"Upstream search for {query} failed: {str(e)}")
+        return {"results": search_results}
+    except Exception as e:
+        logger.error(f"Error searching stocks: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error searching stocks: {str(e)}")
+
+@app.post("/api/symbols/refresh")
+async def refresh_symbols():
+    """Reload the symbol master from the full NSE equity list"""
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(report_executor, symbol_master.refresh)
+        return {
+            "count": len(symbol_master),
+            "authoritative": symbol_master.authoritative,
+            "loaded_at": symbol_master.loaded_at.isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Error refreshing symbol master: {str(e)}")
+        return JSONResponse(
+            status_code=502,
+            content={"error": f"Error refreshing symbol master: {str(e)}"}
+        )
+
+@app.get("/api/validate/{symbol}")
+async def validate_stock(symbol: str):
+    """Validate if a stock symbol exists"""
+    try:
+        symbol = symbol.upper()
+        if symbol in symbol_master:
+            return {"valid": True, "symbol": symbol}
+        if symbol_master.authoritative:
+            return {"valid": False}
+
+        # Not in the bundled list, which is partial: ask NSE
+        quote = await quote_service.get_quote(symbol)
+        if quote and "priceInfo" in quote:
+            return {"valid": True, "symbol": symbol}
+        return {"valid": False}
+    except Exception as e:
+        logger.error(f"Error validating stock {symbol}: {str(e)}")
+        return {"valid": False}
+
+@app.get("/api/graph-data/{symbol}")
+async def get_graph_data(symbol: str, points: int = 300, minutes: Optional[int] = None):
+    """Get intraday graph data for a stock, downsampled to at most ``points`` points"""
+    try:
+        symbol = symbol.upper()
+        history = tick_history.get(symbol)
+        if history is None or not history.size:
+            # Nothing streamed for this symbol yet: the fetch records the first tick
+            await quote_service.get_quote(symbol)
+            history = tick_history.get(symbol)
+            if history is None:
+                return []
+
+        since = int((market_time() - minutes * 60) * 1000) if minutes else None
+        timestamps, prices = history.series(since)
+        timestamps, prices = lttb(timestamps, prices, max(3, min(points, 2000)))
+        return FastJSONResponse([[t, p] for t, p in zip(timestamps.tolist(), prices.tolist())])
+    except Exception as e:
+        logger.error(f"Error fetching graph data for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching graph data: {str(e)}")
+@app.get("/api/candles/{symbol}")
+async def get_candles(symbol: str, interval: str = "1m", limit: int = 100,
+                      start: Optional[int] = None, end: Optional[int] = None):
+    """Get OHLCV candles for a stock built from the live quote stream"""
+    if interval not in CANDLE_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {list(CANDLE_INTERVALS)}")
+    try:
+        symbol = symbol.upper()
+        return {
+            "symbol": symbol,
+            "interval": interval,
+            "candles": candle_aggregator.candles(symbol, interval, start, end, max(1, min(limit, CANDLE_HISTORY)))
+        }
+    except Exception as e:
+        logger.error(f"Error fetching candles for {symbol}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error fetching candles: {str(e)}")
+
+class OrderRequest(BaseModel):
+    symbol: str
+    quantity: int
+    order_type: str
+    target_price: float
+    Email: str
+    OrderId: str
+    HoldingId: str
+    order_kind: str = 'MARKET'
+    
+    @field_validator('symbol')
+    def validate_symbol(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Symbol cannot be empty')
+        return v.strip().upper()
+    
+    @field_validator('quantity')
+    def validate_quantity(cls, v):
+        if v <= 0:
+            raise ValueError('Quantity must be positive')
+        return v
+    
+    @field_validator('target_price')
+    def validate_price(cls, v):
+        if v <= 0:
+            raise ValueError('Price must be positive')
+        return v
+    
+    @field_validator('order_type')
+    def validate_order_type(cls, v):
+        if v.upper() not in ['BUY', 'SELL']:
+            raise ValueError('Order type must be BUY or SELL')
+        return v.upper()
+    
+    @field_validator('Email')
+    def validate_email(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Email cannot be empty')
+        return v.strip()
+    
+    @field_validator('OrderId')
+    def validate_order_id(cls, v):
+        if not v or not v.strip():
+            raise ValueError('OrderId cannot be empty')
+        return v.strip()
+    
+    @field_validator('HoldingId')
+    def validate_holding_id(cls, v):
+        if not v or not v.strip():
+            raise ValueError('HoldingId cannot be empty')
+        return v.strip()
+
+    @field_validator('order_kind')
+    def validate_order_kind(cls, v):
+        if v.upper() not in ['MARKET', 'LIMIT']:
+            raise ValueError('Order kind must be MARKET or LIMIT')
+        return v.upper()
+
+def new_order(data: dict) -> dict:
+    """Build the order document for a validated ``OrderRequest``."""
+    return {
+        'OrderId': str(uuid.uuid4()),
+        'symbol': data['symbol'],
+        'quantity': data['quantity'],
+        'order_type': data['order_type'],
+        'target_price': data['target_price'],
+        'Email': data['Email'],
+        'HoldingId': data['HoldingId'],
+        'created_at': datetime.now(),
+        # Market orders execute instantly at target_price; limit orders rest in the book
+        'order_kind': data.get('order_kind', 'MARKET'),
+        'status': 'PENDING' if data.get('order_kind') == 'LIMIT' else 'EXECUTED',
+        'total_amount': data['quantity'] * data['target_price']
+    }
+
+
+def order_summary(order: dict) -> dict:
+    """Client-facing view of an order document."""
+    summary = {
+        "OrderId": order['OrderId'],
+        "symbol": order['symbol'],
+        "quantity": order['quantity'],
+        "order_type": order['order_type'],
+        "order_kind": order.get('order_kind', 'MARKET'),
+        "target_price": order['target_price'],
+        "total_amount": order['total_amount'],
+        "status": order['status'],
+        "created_at": order['created_at'].isoformat()
+    }
+    if 'fill_price' in order:
+        summary["fill_price"] = order['fill_price']
+        summary["filled_at"] = order['filled_at'].isoformat()
+    return summary
+
+
+def holding_update_pipeline(deltas: Dict[str, Tuple[int, float, int]]) -> List[dict]:
+    """Build an update pipeline that applies share deltas to ``Holdings`` atomically.
+
+    ``deltas`` maps symbol -> (shares bought, cost of those shares, shares sold).
+    Bought shares fold into the weighted average price, sold shares leave the
+    price alone, unseen symbols are appended and positions that reach zero are
+    dropped, all inside a single server-side write.
+    """
+    branches = []
+    new_positions = []
+    for symbol, (bought, cost, sold) in deltas.items():
+        quantity = {'$add': ['$$h.quantity', bought - sold]}
+        price = '$$h.price'
+        if bought:
+            price = {'$divide': [
+                {'$add': [{'$multiply': ['$$h.quantity', '$$h.price']}, cost]},
+                {'$add': ['$$h.quantity', bought]}
+            ]}
+        branches.append({
+            'case': {'$eq': ['$$h.symbol', {'$literal': symbol}]},
+            'then': {'$mergeObjects': ['$$h', {'quantity': quantity, 'price': price}]}
+        })
+        if bought > sold:
+            new_positions.append({'$cond': [
+                {'$in': [{'$literal': symbol}, {'$ifNull': ['$Holdings.symbol', []]}]},
+                [],
+                [{'symbol': {'$literal': symbol}, 'quantity': bought - sold, 'price': cost / bought}]
+            ]})
+
+    updated = {'$map': {
+        'input': {'$ifNull': ['$Holdings', []]},
+        'as': 'h',
+        'in': {'$switch': {'branches': branches, 'default': '$$h'}}
+    }}
+    return [{'$set': {'Holdings': {'$filter': {
+        'input': {'$concatArrays': [updated] + new_positions},
+        'as': 'h',
+        'cond': {'$gt': ['$$h.quantity', 0]}
+    }}}}]
+
+
+async def compensate(description: str, operation) -> None:
+    """Best-effort rollback of an already applied leg of an order."""
+    try:
+        await operation
+    except Exception as e:
+        logger.critical(f"Compensation failed ({description}): {str(e)}")
+
+
+async def execute_buy(order: dict) -> Optional[JSONResponse]:
+    """Debit the balance, record the order and credit the shares.
+
+    The debit is a single ``$inc`` guarded by ``Balance >= cost`` so concurrent
+    orders can never overdraw the account; later legs undo earlier ones if
+    they fail. A PENDING limit order stops after recording, the debit being
+    its reservation. Returns an error response, or None on success.
+    """
+    email, holding_id, symbol = order['Email'], order['HoldingId'], order['symbol']
+    quantity, total_cost = order['quantity'], order['total_amount']
+
+    user = await async_users.find_one_and_update(
+        {'Email': email, 'Balance': {'$gte': total_cost}},
+        {'$inc': {'Balance': -total_cost}},
+        projection={'Balance': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not user:
+        user = await async_users.find_one({'Email': email}, {'Balance': 1})
+        if not user:
+            logger.error(f"User not found for email: {email}")
+            return JSONResponse(status_code=404, content={"error": "User not found"})
+        user_balance = float(user.get('Balance', 0))
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Insufficient balance. Required: ${total_cost:.2f}, Available: ${user_balance:.2f}"}
+        )
+    logger.info(f"Debited {total_cost} from {email}, new balance {user['Balance']}")
+
+    refund = {'$inc': {'Balance': total_cost}}
+    try:
+        result = await async_orders.insert_one(order)
+    except Exception:
+        await compensate(f"refund {email}", async_users.update_one({'_id': user['_id']}, refund))
+        raise
+    order['_id'] = result.inserted_id
+    logger.info(f"Order created with ID: {result.inserted_id}")
+    if order['status'] == 'PENDING':
+        return None
+
+    try:
+        await async_holdings.update_one(
+            {'HoldingId': holding_id},
+            holding_update_pipeline({symbol: (quantity, total_cost, 0)}),
+            upsert=True
+        )
+    except Exception:
+        await compensate(f"refund {email}", async_users.update_one({'_id': user['_id']}, refund))
+        await compensate(f"fail order {order['OrderId']}",
+                         async_orders.update_one({'_id': order['_id']}, {'$set': {'status': 'FAILED'}}))
+        raise
+    logger.info(f"Added {quantity} shares of {symbol} to holding {holding_id}")
+    return None
+
+
+async def execute_sell(order: dict) -> Optional[JSONResponse]:
+    """Remove the shares, record the order and credit the proceeds.
+
+    The share decrement only matches a holding with enough quantity of the
+    symbol, so concurrent sells can never oversell a position. A PENDING
+    limit order keeps the shares reserved and is credited when it fills.
+    """
+    email, holding_id, symbol = order['Email'], order['HoldingId'], order['symbol']
+    quantity, total_cost = order['quantity'], order['total_amount']
+
+    before = await async_holdings.find_one_and_update(
+        {'HoldingId': holding_id, 'Holdings': {'$elemMatch': {'symbol': symbol, 'quantity': {'$gte': quantity}}}},
+        holding_update_pipeline({symbol: (0, 0.0, quantity)}),
+        projection={'Holdings': 1},
+        return_document=ReturnDocument.BEFORE
+    )
+    if not before:
+        holding = await async_holdings.find_one({'HoldingId': holding_id}, {'Holdings': 1})
+        if not holding:
+            logger.error(f"Holding not found for HoldingId: {holding_id}")
+            return JSONResponse(status_code=404, content={"error": "Holding not found"})
+        existing_holding = next((h for h in holding.get('Holdings', []) if h['symbol'] == symbol), None)
+        if not existing_holding:
+            return JSONResponse(status_code=400, content={"error": f"No holdings found for symbol {symbol}"})
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Insufficient holdings. Available: {existing_holding['quantity']}, Requested: {quantity}"}
+        )
+
+    position = next(h for h in before['Holdings'] if h['symbol'] == symbol)
+    # Selling never moves the average price, so buying the shares back at it restores the position
+    restore = holding_update_pipeline({symbol: (quantity, quantity * position['price'], 0)})
+    logger.info(f"Sold {quantity} shares of {symbol}, remaining: {position['quantity'] - quantity}")
+    if order['status'] == 'PENDING':
+        order['reserved_price'] = position['price']
+
+    try:
+        result = await async_orders.insert_one(order)
+    except Exception:
+        await compensate(f"restore {holding_id}", async_holdings.update_one({'HoldingId': holding_id}, restore, upsert=True))
+        raise
+    order['_id'] = result.inserted_id
+    logger.info(f"Order created with ID: {result.inserted_id}")
+
+    if order['status'] == 'EXECUTED':
+        async def rollback():
+            await compensate(f"restore {holding_id}", async_holdings.update_one({'HoldingId': holding_id}, restore, upsert=True))
+            await compensate(f"fail order {order['OrderId']}",
+                             async_orders.update_one({'_id': order['_id']}, {'$set': {'status': 'FAILED'}}))
+
+        try:
+            user = await async_users.find_one_and_update(
+                {'Email': email},
+                {'$inc': {'Balance': total_cost}},
+                projection={'Balance': 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception:
+            await rollback()
+            raise
+        if not user:
+            await rollback()
+            logger.error(f"User not found for email: {email}")
+            return JSONResponse(status_code=404, content={"error": "User not found"})
+        logger.info(f"Credited {total_cost} to {email}, new balance {user['Balance']}")
+
+    if len(before['Holdings']) == 1 and position['quantity'] == quantity:
+        # Guarded on emptiness so a buy racing in between keeps its document
+        await async_holdings.delete_one({'HoldingId': holding_id, 'Holdings': {'$size': 0}})
+        logger.info(f"Deleted empty holding document for HoldingId: {holding_id}")
+    return None
+
+
+class RestingOrder:
+    """The part of a PENDING limit order the matching engine needs."""
+
+    __slots__ = ("order_id", "email", "symbol", "side", "quantity", "limit_price")
+
+    def __init__(self, order: dict):
+        self.order_id = order['OrderId']
+        self.email = order['Email']
+        self.symbol = order['symbol']
+        self.side = order['order_type']
+        self.quantity = order['quantity']
+        self.limit_price = order['target_price']
+
+
+class OrderBook:
+    """Resting limit orders in one price-sorted heap per symbol and side.
+
+    Buys sit in a max-heap on limit price and sells in a min-heap, so a tick
+    only looks at the top of each heap: a tick that crosses nothing costs
+    O(1) and every crossed order comes off in O(log n), however many orders
+    rest. Cancels are lazy; the heap entry is skipped when it surfaces and a
+    symbol's heaps are rebuilt once stale entries outnumber live orders.
+    Orders at the same price fill in arrival order.
+    """
+
+    def __init__(self):
+        self.orders: Dict[str, RestingOrder] = {}
+        self.bids: Dict[str, List[Tuple[float, int, str]]] = {}
+        self.asks: Dict[str, List[Tuple[float, int, str]]] = {}
+        self.live: Dict[str, int] = {}  # resting orders per symbol
+        self.stale: Dict[str, int] = {}  # cancelled entries still in a symbol's heaps
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def symbols(self) -> List[str]:
+        return list(self.live)
+
+    def add(self, resting: RestingOrder):
+        self._seq += 1
+        if resting.side == 'BUY':
+            heapq.heappush(self.bids.setdefault(resting.symbol, []), (-resting.limit_price, self._seq, resting.order_id))
+        else:
+            heapq.heappush(self.asks.setdefault(resting.symbol, []), (resting.limit_price, self._seq, resting.order_id))
+        self.orders[resting.order_id] = resting
+        self.live[resting.symbol] = self.live.get(resting.symbol, 0) + 1
+
+    def cancel(self, order_id: str) -> Optional[RestingOrder]:
+        resting = self.orders.pop(order_id, None)
+        if resting is None:
+            return None
+        symbol = resting.symbol
+        if self._release(symbol):
+            self.stale[symbol] = self.stale.get(symbol, 0) + 1
+            if self.stale[symbol] > self.live[symbol]:
+                self._compact(symbol)
+        return resting
+
+    def match(self, symbol: str, price: float) -> List[RestingOrder]:
+        """Take every order the traded price crosses out of the book.
+
+        Buys limited at or above ``price`` and sells limited at or below it.
+        """
+        if symbol not in self.live or not price or price <= 0:
+            return []
+        crossed = []
+        bids = self.bids.get(symbol)
+        while bids and -bids[0][0] >= price:
+            self._take(symbol, heapq.heappop(bids)[2], crossed)
+        asks = self.asks.get(symbol)
+        while asks and asks[0][0] <= price:
+            self._take(symbol, heapq.heappop(asks)[2], crossed)
+        for _ in crossed:
+            self._release(symbol)
+        return crossed
+
+    def _take(self, symbol: str, order_id: str, crossed: List[RestingOrder]):
+        resting = self.orders.pop(order_id, None)
+        if resting is None:
+            self.stale[symbol] = max(0, self.stale.get(symbol, 0) - 1)
+        else:
+            crossed.append(resting)
+
+    def _release(self, symbol: str) -> bool:
+        """Count one order off a symbol; drop its heaps when none rest. Returns whether any remain."""
+        self.live[symbol] -= 1
+        if self.live[symbol]:
+            return True
+        del self.live[symbol]
+        self.bids.pop(symbol, None)
+        self.asks.pop(symbol, None)
+        self.stale.pop(symbol, None)
+        return False
+
+    def _compact(self, symbol: str):
+        for heaps in (self.bids, self.asks):
+            heap = heaps.get(symbol)
+            if heap:
+                heap[:] = [entry for entry in heap if entry[2] in self.orders]
+                heapq.heapify(heap)
+        self.stale[symbol] = 0
+
+
+order_book = OrderBook()
+settlement_queue: Optional[asyncio.Queue] = None  # (RestingOrder, fill price), created at startup
+
+
+def match_orders(symbol: str, data: dict) -> int:
+    """Hand every resting order a tick crosses to the settlement workers.
+
+    Runs inline in the broadcast loop, so it only touches the in-memory book;
+    the Mongo writes happen on the workers.
+    """
+    if settlement_queue is None or data.get("T") != "q" or not market_clock.is_open():
+        return 0
+    price = data.get("lastPrice")
+    crossed = order_book.match(symbol, price)
+    for resting in crossed:
+        settlement_queue.put_nowait((resting, price))
+    return len(crossed)
+
+
+async def apply_once(collection: AsyncCollection, key: str, value: str, update, marker: str,
+                     upsert: bool = False) -> None:
+    """Apply one settlement leg unless ``marker`` shows an earlier attempt already did."""
+    result = await collection.update_one({key: value, 'AppliedBatches': {'$ne': marker}}, update)
+    if result.matched_count or not upsert:
+        return
+    if await collection.find_one({key: value}, {'_id': 1}):
+        return  # the document exists, so the marker was there: already applied
+    await collection.update_one({key: value}, update, upsert=True)
+
+
+async def finish_settlement(order: dict):
+    """Apply the money and holdings legs of a SETTLING order, then mark it EXECUTED.
+
+    Each leg carries a marker on its document, so re-running this after a
+    failure part-way through never applies a leg twice.
+    """
+    marker = f"fill:{order['OrderId']}"
+    quantity, total = order['quantity'], order['total_amount']
+    push_marker = {'$push': {'AppliedBatches': {'$each': [marker], '$slice': -ORDERS_BATCH_MARKERS}}}
+
+    if order['order_type'] == 'BUY':
+        pipeline = holding_update_pipeline({order['symbol']: (quantity, total, 0)}) + [{'$set': {'AppliedBatches': {'$slice': [
+            {'$concatArrays': [{'$ifNull': ['$AppliedBatches', []]}, [{'$literal': marker}]]},
+            -ORDERS_BATCH_MARKERS
+        ]}}}]
+        await apply_once(async_holdings, 'HoldingId', order['HoldingId'], pipeline, marker, upsert=True)
+        # Buys reserved quantity * limit at placement; filling below the limit refunds the difference
+        refund = quantity * order['target_price'] - total
+        if refund > 0:
+            await apply_once(async_users, 'Email', order['Email'], {'$inc': {'Balance': refund}, **push_marker}, marker)
+    else:
+        # Sells reserved their shares at placement and are credited the proceeds
+        await apply_once(async_users, 'Email', order['Email'], {'$inc': {'Balance': total}, **push_marker}, marker)
+
+    order = await async_orders.find_one_and_update(
+        {'OrderId': order['OrderId'], 'status': 'SETTLING'},
+        {'$set': {'status': 'EXECUTED'}},
+        return_document=ReturnDocument.AFTER
+    ) or order
+    logger.info(f"Filled {order['order_type']} {quantity} {order['symbol']} @ {order['fill_price']} (order {order['OrderId']})")
+    notify_order(order)
+    portfolio_tracker.refresh(order['HoldingId'])
+
+
+async def settle_fill(resting: RestingOrder, price: float):
+    """Execute a crossed limit order at the traded price and notify its owner.
+
+    The order is first claimed as SETTLING with its fill price, so a cancel
+    can no longer take it; ``finish_settlement`` then moves the money and
+    shares and only afterwards marks it EXECUTED.
+    """
+    total = resting.quantity * price
+    order = await async_orders.find_one_and_update(
+        {'OrderId': resting.order_id, 'status': 'PENDING'},
+        {'$set': {'status': 'SETTLING', 'fill_price': price, 'total_amount': total, 'filled_at': datetime.now()}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not order:
+        return  # cancelled or settled elsewhere
+    await finish_settlement(order)
+
+
+def notify_order(order: dict):
+    """Push an order update to every connection listening for its owner."""
+    clients = user_connections.get(order['Email'])
+    if not clients:
+        return
+    message = {"T": "order", "order": order_summary(order)}
+    for conn in list(clients):
+        if not conn.send(message):
+            remove_client(conn)
+
+
+async def settlement_worker():
+    while True:
+        resting, price = await settlement_queue.get()
+        try:
+            await settle_fill(resting, price)
+        except Exception as e:
+            # A claimed order stays SETTLING in Mongo and load_order_book finishes it on restart
+            logger.critical(f"Settlement failed for order {resting.order_id} at {price}: {str(e)}")
+        finally:
+            settlement_queue.task_done()
+
 
-@app.get("/api/validate/{symbol}")
-async def validate_stock(symbol: str):
-    """Validate if a stock symbol exists"""
-    try:
-        quote = nse.stock_quote(symbol.upper())
-        if quote and "priceInfo" in quote:
-            return {"valid": True, "symbol": symbol.upper()}
-        return {"valid": False}
-    except Exception as e:
-        logger.error(f"Error validating stock {symbol}: {str(e)}")
-        return {"valid": False}
+async def load_order_book():
+    """Rebuild the book from PENDING limit orders and finish fills left SETTLING."""
+    settling = await async_orders.find({'status': 'SETTLING'}, sort=[('filled_at', 1)])
+    for order in settling:
+        try:
+            await finish_settlement(order)
+        except Exception as e:
+            logger.critical(f"Settlement still failing for order {order['OrderId']}: {str(e)}")
+    if settling:
+        logger.info(f"Finished {len(settling)} interrupted limit order settlements")
+
+    pending = await async_orders.find(
+        {'status': 'PENDING', 'order_kind': 'LIMIT'},
+        {'OrderId': 1, 'Email': 1, 'symbol': 1, 'order_type': 1, 'quantity': 1, 'target_price': 1},
+        sort=[('created_at', 1)]
+    )
+    for order in pending:
+        order_book.add(RestingOrder(order))
+    logger.info(f"Loaded {len(pending)} resting limit orders")
 
-@app.get("/api/graph-data/{symbol}")
-async def get_graph_data(symbol: str):
-    """Get graph data for a stock"""
-    try:
-        # This is a placeholder - you'll need to implement the actual historical data fetching
-        current_time = int(time.time() * 1000)
-        one_day_ago = current_time - (24 * 60 * 60 * 1000)
-        
-        # Get current price for reference
-        quote = nse.stock_quote(symbol.upper())
-        current_price = quote.get("priceInfo", {}).get("lastPrice", 100)
-        
-        # Generate some price movements around the current price
-        import random
-        data_points = []
-        for i in range(100):
-            timestamp = one_day_ago + (i * 14.4 * 60 * 1000)  # 14.4 minutes intervals
-            price = current_price * (0.9 + 0.2 * random.random())  # ±10% variation
-            data_points.append([timestamp, price])
-        
-        return data_points
-    except Exception as e:
-        logger.error(f"Error fetching graph data for {symbol}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Error fetching graph data: {str(e)}")
-class OrderRequest(BaseModel):
-    symbol: str
-    quantity: int
-    order_type: str
-    target_price: float
-    Email: str
-    OrderId: str
-    HoldingId: str
-    
-    @field_validator('symbol')
-    def validate_symbol(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Symbol cannot be empty')
-        return v.strip().upper()
-    
-    @field_validator('quantity')
-    def validate_quantity(cls, v):
-        if v <= 0:
-            raise ValueError('Quantity must be positive')
-        return v
-    
-    @field_validator('target_price')
-    def validate_price(cls, v):
-        if v <= 0:
-            raise ValueError('Price must be positive')
-        return v
-    
-    @field_validator('order_type')
-    def validate_order_type(cls, v):
-        if v.upper() not in ['BUY', 'SELL']:
-            raise ValueError('Order type must be BUY or SELL')
-        return v.upper()
-    
-    @field_validator('Email')
-    def validate_email(cls, v):
-        if not v or not v.strip():
-            raise ValueError('Email cannot be empty')
-        return v.strip()
-    
-    @field_validator('OrderId')
-    def validate_order_id(cls, v):
-        if not v or not v.strip():
-            raise ValueError('OrderId cannot be empty')
-        return v.strip()
-    
-    @field_validator('HoldingId')
-    def validate_holding_id(cls, v):
-        if not v or not v.strip():
-            raise ValueError('HoldingId cannot be empty')
-        return v.strip()
 
 @app.post("/api/place-order")
 async def place_order(order_data: OrderRequest):
@@ -859,178 +3840,26 @@ async def place_order(order_data: OrderRequest):
         #         content={"error": "Market is closed. Cannot place orders."}
         #     )
 
-        # Fetch user data
-        user = users.find_one({'Email': email})
-        if not user:
-            logger.error(f"User not found for email: {email}")
-            return JSONResponse(
-                status_code=404, 
-                content={"error": "User not found"}
-            )
-
-        # Check user balance
-        user_balance = float(user.get('Balance', 0))
-        logger.info(f"User balance: {user_balance}")
-
-        # Validate holdings for SELL orders
-        if order_type == 'SELL':
-            holding = holdings.find_one({'HoldingId': holding_id})
-            if not holding:
-                logger.error(f"Holding not found for HoldingId: {holding_id}")
-                return JSONResponse(
-                    status_code=404, 
-                    content={"error": "Holding not found"}
-                )
-
-            existing_holding = next((h for h in holding.get('Holdings', []) if h['symbol'] == symbol), None)
-            if not existing_holding:
-                return JSONResponse(
-                    status_code=400,
-                    content={"error": f"No holdings found for symbol {symbol}"}
-                )
-            
-            if existing_holding['quantity'] < quantity:
-                return JSONResponse(
-                    status_code=400,
-                    content={"error": f"Insufficient holdings. Available: {existing_holding['quantity']}, Requested: {quantity}"}
-                )
-
-        # Check balance for BUY orders
-        total_cost = quantity * target_price
-        if order_type == 'BUY' and user_balance < total_cost:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Insufficient balance. Required: ${total_cost:.2f}, Available: ${user_balance:.2f}"}
-            )
-
-        # Generate unique order ID
-        import uuid
-        unique_order_id = str(uuid.uuid4())
-
-        # Create order object
-        order = {
-            'OrderId': unique_order_id,
-            'symbol': symbol,
-            'quantity': quantity,
-            'order_type': order_type,
-            'target_price': target_price,
-            'Email': email,
-            'HoldingId': holding_id,
-            'created_at': datetime.now(),
-            'status': 'EXECUTED',  # Assume instant execution for simplicity
-            'total_amount': total_cost
-        }
-
-        # Insert order into collection
-        result = orders_collection.insert_one(order)
-        order['_id'] = result.inserted_id
-        logger.info(f"Order created with ID: {result.inserted_id}")
+        order = new_order(data)
 
-        # Process BUY order
         if order_type == 'BUY':
-            # Update user balance
-            new_balance = user_balance - total_cost
-            users.update_one(
-                {'_id': user['_id']}, 
-                {'$set': {'Balance': new_balance}}
-            )
-            logger.info(f"Updated user balance from {user_balance} to {new_balance}")
-
-            # Update holdings
-            holding = holdings.find_one({'HoldingId': holding_id})
-            if not holding:
-                # Create new holding document
-                holding = {
-                    'HoldingId': holding_id,
-                    'Holdings': []
-                }
-                holdings.insert_one(holding)
-                logger.info(f"Created new holding for HoldingId: {holding_id}")
-
-            # Find existing holding for this symbol
-            existing_holding_index = -1
-            for i, h in enumerate(holding.get('Holdings', [])):
-                if h['symbol'] == symbol:
-                    existing_holding_index = i
-                    break
-
-            if existing_holding_index >= 0:
-                # Update existing holding
-                existing_holding = holding['Holdings'][existing_holding_index]
-                total_qty = existing_holding['quantity'] + quantity
-                avg_price = ((existing_holding['quantity'] * existing_holding['price']) +
-                           (quantity * target_price)) / total_qty
-
-                holding['Holdings'][existing_holding_index] = {
-                    'symbol': symbol,
-                    'quantity': total_qty,
-                    'price': avg_price
-                }
-                logger.info(f"Updated existing holding for {symbol}: quantity={total_qty}, avg_price={avg_price}")
-            else:
-                # Add new holding
-                holding['Holdings'].append({
-                    'symbol': symbol,
-                    'quantity': quantity,
-                    'price': target_price
-                })
-                logger.info(f"Added new holding for {symbol}: quantity={quantity}, price={target_price}")
-
-            # Update holding document
-            holdings.update_one(
-                {'HoldingId': holding_id}, 
-                {'$set': {'Holdings': holding['Holdings']}}
-            )
-
-        # Process SELL order
+            error = await execute_buy(order)
         else:
-            # Update user balance
-            new_balance = user_balance + total_cost
-            users.update_one(
-                {'_id': user['_id']}, 
-                {'$set': {'Balance': new_balance}}
-            )
-            logger.info(f"Updated user balance from {user_balance} to {new_balance}")
+            error = await execute_sell(order)
+        if error:
+            return error
 
-            # Update holdings
-            holding = holdings.find_one({'HoldingId': holding_id})
-            updated_holdings = []
-            
-            for h in holding.get('Holdings', []):
-                if h['symbol'] == symbol:
-                    remaining_quantity = h['quantity'] - quantity
-                    if remaining_quantity > 0:
-                        h['quantity'] = remaining_quantity
-                        updated_holdings.append(h)
-                    # If quantity becomes 0, don't add to updated_holdings
-                    logger.info(f"Sold {quantity} shares of {symbol}, remaining: {remaining_quantity}")
-                else:
-                    updated_holdings.append(h)
-
-            # Update or delete holding document
-            if updated_holdings:
-                holdings.update_one(
-                    {'HoldingId': holding_id}, 
-                    {'$set': {'Holdings': updated_holdings}}
-                )
-            else:
-                holdings.delete_one({'HoldingId': holding_id})
-                logger.info(f"Deleted empty holding document for HoldingId: {holding_id}")
+        portfolio_tracker.refresh(holding_id)
+        message = f"{order_type} order placed successfully"
+        if order['status'] == 'PENDING':
+            order_book.add(RestingOrder(order))
+            message = f"{order_type} limit order placed, waiting for price {target_price}"
 
         # Return success response
         response_data = {
-            "message": f"{order_type} order placed successfully",
+            "message": message,
             "order_id": str(order['_id']),
-            "order": {
-                "OrderId": order['OrderId'],
-                "symbol": order['symbol'],
-                "quantity": order['quantity'],
-                "order_type": order['order_type'],
-                "target_price": order['target_price'],
-                "total_amount": order['total_amount'],
-                "status": order['status'],
-                "created_at": order['created_at'].isoformat()
-            }
+            "order": order_summary(order)
         }
         
         logger.info(f"Order processed successfully: {response_data}")
@@ -1052,20 +3881,468 @@ async def place_order(order_data: OrderRequest):
             content={"error": f"An error occurred while processing your order: {str(e)}"}
         )
 
-@app.get("/api/gainer-losers")
-async def get_gainers_and_losers():
-    """Get top gainers and losers for the day"""
+class CancelOrderRequest(BaseModel):
+    Email: str
+
+
+@app.post("/api/orders/{order_id}/cancel")
+async def cancel_order(order_id: str, request: CancelOrderRequest):
+    """Cancel a resting limit order and release its reserved funds or shares"""
     try:
-        gainers = nse_get_top_gainers()
-        losers = nse_get_top_losers()
+        email = request.Email.strip()
+        resting = order_book.orders.get(order_id)
+        if resting is None or resting.email != email:
+            order = await async_orders.find_one({'OrderId': order_id, 'Email': email}, {'status': 1})
+            if not order:
+                return JSONResponse(status_code=404, content={"error": "Order not found"})
+            status = "being filled" if order['status'] == 'PENDING' else f"already {order['status']}"
+            return JSONResponse(status_code=409, content={"error": f"Order is {status}"})
 
-        gainers_df = pd.DataFrame(gainers)
-        losers_df = pd.DataFrame(losers)
-        
-        return {
-            "gainers": gainers_df.to_dict(orient="records"),
-            "losers": losers_df.to_dict(orient="records")
+        order_book.cancel(order_id)
+        try:
+            order = await async_orders.find_one_and_update(
+                {'OrderId': order_id, 'status': 'PENDING'},
+                {'$set': {'status': 'CANCELLED', 'cancelled_at': datetime.now()}},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception:
+            order_book.add(resting)
+            raise
+        if not order:
+            return JSONResponse(status_code=409, content={"error": "Order is no longer pending"})
+
+        if resting.side == 'BUY':
+            await async_users.update_one(
+                {'Email': email},
+                {'$inc': {'Balance': resting.quantity * resting.limit_price}}
+            )
+        else:
+            await async_holdings.update_one(
+                {'HoldingId': order['HoldingId']},
+                holding_update_pipeline({resting.symbol: (
+                    resting.quantity, resting.quantity * order.get('reserved_price', resting.limit_price), 0
+                )}),
+                upsert=True
+            )
+        logger.info(f"Cancelled order {order_id}")
+        notify_order(order)
+        portfolio_tracker.refresh(order['HoldingId'])
+        return {"message": "Order cancelled", "order": order_summary(order)}
+
+    except Exception as e:
+        logger.error(f"Order cancel error: {str(e)}", exc_info=True)
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"An error occurred while cancelling your order: {str(e)}"}
+        )
+
+class OrderBatchRequest(BaseModel):
+    orders: List[OrderRequest]
+
+    @field_validator('orders')
+    def validate_orders(cls, v):
+        if not v:
+            raise ValueError('Batch must contain at least one order')
+        if len(v) > ORDERS_BATCH_MAX:
+            raise ValueError(f'Batch cannot contain more than {ORDERS_BATCH_MAX} orders')
+        if any(order.order_kind == 'LIMIT' for order in v):
+            raise ValueError('Limit orders must be placed one at a time')
+        return v
+
+
+async def load_accounts(orders: List[dict]) -> Tuple[Dict[str, float], Dict[str, Dict[str, int]]]:
+    """Snapshot balances and positions for every account touched by a batch (two parallel reads)."""
+    emails = sorted({o['Email'] for o in orders})
+    holding_ids = sorted({o['HoldingId'] for o in orders})
+    found_users, found_holdings = await asyncio.gather(
+        async_users.find({'Email': {'$in': emails}}, {'Email': 1, 'Balance': 1}),
+        async_holdings.find({'HoldingId': {'$in': holding_ids}}, {'HoldingId': 1, 'Holdings': 1})
+    )
+    balances = {u['Email']: float(u.get('Balance', 0)) for u in found_users}
+    positions = {
+        h['HoldingId']: {p['symbol']: p['quantity'] for p in h.get('Holdings', [])}
+        for h in found_holdings
+    }
+    return balances, positions
+
+
+def simulate_orders(entries: List[Tuple[int, dict]], balances: Dict[str, float],
+                    positions: Dict[str, Dict[str, int]]):
+    """Replay orders in submission order against an account snapshot.
+
+    Each order sees the effect of the ones before it, exactly as if they had
+    been placed one by one. Returns the accepted entries grouped per
+    (Email, HoldingId) and an error result for every rejected one.
+    """
+    accepted: Dict[Tuple[str, str], List[Tuple[int, dict]]] = {}
+    rejected: Dict[int, dict] = {}
+    for index, order in entries:
+        email, holding_id, symbol = order['Email'], order['HoldingId'], order['symbol']
+        quantity, total_cost = order['quantity'], order['total_amount']
+        error = None
+        if email not in balances:
+            error = (404, "User not found")
+        elif order['order_type'] == 'BUY':
+            if balances[email] < total_cost:
+                error = (400, f"Insufficient balance. Required: ${total_cost:.2f}, Available: ${balances[email]:.2f}")
+            else:
+                balances[email] -= total_cost
+                held = positions.setdefault(holding_id, {})
+                held[symbol] = held.get(symbol, 0) + quantity
+        else:
+            held = positions.get(holding_id)
+            if held is None:
+                error = (404, "Holding not found")
+            elif held.get(symbol, 0) <= 0:
+                error = (400, f"No holdings found for symbol {symbol}")
+            elif held[symbol] < quantity:
+                error = (400, f"Insufficient holdings. Available: {held[symbol]}, Requested: {quantity}")
+            else:
+                held[symbol] -= quantity
+                balances[email] += total_cost
+        if error:
+            rejected[index] = {"index": index, "status": "REJECTED", "status_code": error[0], "error": error[1]}
+        else:
+            accepted.setdefault((email, holding_id), []).append((index, order))
+    return accepted, rejected
+
+
+def net_account_writes(email: str, holding_id: str, orders: List[dict], marker: str):
+    """Net one account's accepted orders into a single guarded write per document.
+
+    The balance moves by the net cash flow and each symbol by its net share
+    count (buys are folded into the average price before sells are taken
+    out). Guards only require what the net change needs, so the writes fail
+    cleanly if another writer got there first. ``marker`` is pushed onto both
+    documents so the caller can tell which writes of a bulk actually matched.
+    """
+    balance_delta = 0.0
+    deltas: Dict[str, Tuple[int, float, int]] = {}
+    for order in orders:
+        bought, cost, sold = deltas.get(order['symbol'], (0, 0.0, 0))
+        if order['order_type'] == 'BUY':
+            balance_delta -= order['total_amount']
+            deltas[order['symbol']] = (bought + order['quantity'], cost + order['total_amount'], sold)
+        else:
+            balance_delta += order['total_amount']
+            deltas[order['symbol']] = (bought, cost, sold + order['quantity'])
+
+    user_filter = {'Email': email}
+    if balance_delta < 0:
+        user_filter['Balance'] = {'$gte': -balance_delta}
+    user_write = UpdateOne(user_filter, {
+        '$inc': {'Balance': balance_delta},
+        '$push': {'AppliedBatches': {'$each': [marker], '$slice': -ORDERS_BATCH_MARKERS}}
+    })
+
+    shortfalls = [
+        {'Holdings': {'$elemMatch': {'symbol': symbol, 'quantity': {'$gte': sold - bought}}}}
+        for symbol, (bought, _, sold) in deltas.items() if sold > bought
+    ]
+    holding_filter = {'HoldingId': holding_id}
+    if shortfalls:
+        holding_filter['$and'] = shortfalls
+    pipeline = holding_update_pipeline(deltas) + [{'$set': {'AppliedBatches': {'$slice': [
+        {'$concatArrays': [{'$ifNull': ['$AppliedBatches', []]}, [{'$literal': marker}]]},
+        -ORDERS_BATCH_MARKERS
+    ]}}}]
+    # Never upsert past a guard: a missing document there means the shares are gone
+    holding_write = UpdateOne(holding_filter, pipeline, upsert=not shortfalls)
+    return user_write, holding_write, balance_delta
+
+
+async def applied_markers(collection: AsyncCollection, key: str, writes: Dict[str, Tuple[str, UpdateOne]]) -> Set[str]:
+    """Markers of ``writes`` that are present on their documents."""
+    docs = await collection.find(
+        {key: {'$in': sorted({value for value, _ in writes.values()})}, 'AppliedBatches': {'$in': list(writes)}},
+        {'AppliedBatches': 1}
+    )
+    return {marker for doc in docs for marker in doc.get('AppliedBatches', []) if marker in writes}
+
+
+async def apply_guarded(collection: AsyncCollection, key: str, writes: Dict[str, Tuple[str, UpdateOne]]) -> Set[str]:
+    """Run guarded writes as one ordered bulk and return the markers that matched.
+
+    Ordered execution keeps writes to the same document sequential, so each
+    guard sees the effect of the write before it. The read-back only happens
+    when some guard missed.
+    """
+    if not writes:
+        return set()
+    try:
+        result = await collection.bulk_write([write for _, write in writes.values()])
+        if result.matched_count + result.upserted_count == len(writes):
+            return set(writes)
+    except BulkWriteError as e:
+        logger.warning(f"Bulk write on {key} stopped early: {e.details.get('writeErrors', [])[:1]}")
+    return await applied_markers(collection, key, writes)
+
+
+async def undo_balances(user_writes: Dict[str, Tuple[str, UpdateOne]], deltas: Dict[str, float], markers: Set[str]) -> None:
+    """Reverse the balance legs of accounts whose holdings leg did not apply."""
+    if markers:
+        await async_users.bulk_write([
+            UpdateOne({'Email': user_writes[marker][0]}, {'$inc': {'Balance': -deltas[marker]}})
+            for marker in markers
+        ])
+
+
+async def execute_order_batch(entries: List[Tuple[int, dict]]) -> Dict[int, dict]:
+    """Execute a batch of orders with a fixed number of round-trips.
+
+    Orders are validated against one snapshot of every touched account, then
+    each account's accepted orders are netted and written with one guarded
+    update per user and holding document via ``bulk_write``. Accounts whose
+    guards lost a race to a concurrent writer are rolled back and re-run
+    against a fresh snapshot, up to ``ORDERS_BATCH_RETRIES`` times.
+    """
+    results: Dict[int, dict] = {}
+    pending = entries
+    for attempt in range(ORDERS_BATCH_RETRIES + 1):
+        if not pending:
+            break
+        balances, positions = await load_accounts([order for _, order in pending])
+        accepted, rejected = simulate_orders(pending, balances, positions)
+        results.update(rejected)
+        if not accepted:
+            break
+
+        batch_id = uuid.uuid4().hex
+        accounts: Dict[str, List[Tuple[int, dict]]] = {}
+        user_writes: Dict[str, Tuple[str, UpdateOne]] = {}
+        holding_writes: Dict[str, Tuple[str, UpdateOne]] = {}
+        balance_deltas: Dict[str, float] = {}
+        for n, ((email, holding_id), items) in enumerate(accepted.items()):
+            marker = f"{batch_id}:{n}"
+            user_write, holding_write, balance_deltas[marker] = net_account_writes(
+                email, holding_id, [order for _, order in items], marker
+            )
+            accounts[marker] = items
+            user_writes[marker] = (email, user_write)
+            holding_writes[marker] = (holding_id, holding_write)
+
+        # Orders are recorded first so a failed account only has to delete them
+        await async_orders.insert_many([order for items in accounts.values() for _, order in items])
+
+        users_applied: Set[str] = set()
+        holdings_applied: Set[str] = set()
+        try:
+            users_applied = await apply_guarded(async_users, 'Email', user_writes)
+            holdings_applied = await apply_guarded(
+                async_holdings, 'HoldingId', {m: w for m, w in holding_writes.items() if m in users_applied}
+            )
+        except Exception:
+            async def rollback():
+                applied_users = await applied_markers(async_users, 'Email', user_writes)
+                applied_holdings = await applied_markers(async_holdings, 'HoldingId', holding_writes)
+                await undo_balances(user_writes, balance_deltas, applied_users - applied_holdings)
+                await async_orders.delete_many({'_id': {'$in': [
+                    order['_id'] for marker, items in accounts.items()
+                    if marker not in applied_holdings for _, order in items
+                ]}})
+            await compensate(f"batch {batch_id}", rollback())
+            raise
+
+        failed = set(accounts) - holdings_applied
+        if failed:
+            await undo_balances(user_writes, balance_deltas, users_applied - holdings_applied)
+            await async_orders.delete_many({'_id': {'$in': [
+                order['_id'] for marker in failed for _, order in accounts[marker]
+            ]}})
+            logger.info(f"Order batch {batch_id}: {len(failed)} account(s) lost a race, retrying")
+
+        emptied = {
+            holding_writes[marker][0] for marker in holdings_applied
+            if not any(positions.get(holding_writes[marker][0], {}).values())
+        }
+        if emptied:
+            await async_holdings.delete_many({'HoldingId': {'$in': sorted(emptied)}, 'Holdings': {'$size': 0}})
+
+        for marker in holdings_applied:
+            for index, order in accounts[marker]:
+                results[index] = {
+                    "index": index,
+                    "status": "EXECUTED",
+                    "order_id": str(order['_id']),
+                    "order": order_summary(order)
+                }
+
+        pending = []
+        for marker in failed:
+            for index, order in accounts[marker]:
+                order.pop('_id', None)
+                pending.append((index, order))
+        pending.sort(key=lambda entry: entry[0])
+
+    for index, _ in pending:
+        results[index] = {
+            "index": index,
+            "status": "FAILED",
+            "status_code": 409,
+            "error": "Order conflicted with concurrent updates, please retry"
         }
+    return results
+
+
+@app.post("/api/place-orders")
+async def place_orders(batch: OrderBatchRequest):
+    """Place a batch of buy and sell orders.
+
+    Orders are checked in submission order, netted per user and holding and
+    applied with a handful of bulk round-trips regardless of batch size.
+    Every order gets its own result; one rejected order does not fail the
+    rest of the batch.
+    """
+    try:
+        entries = [(index, new_order(order.model_dump())) for index, order in enumerate(batch.orders)]
+        logger.info(f"Processing batch of {len(entries)} orders")
+
+        results = await execute_order_batch(entries)
+        ordered = [results[index] for index, _ in entries]
+        for holding_id in {order['HoldingId'] for index, order in entries if results[index]["status"] == "EXECUTED"}:
+            portfolio_tracker.refresh(holding_id)
+        executed = sum(1 for result in ordered if result["status"] == "EXECUTED")
+
+        return JSONResponse(
+            status_code=200,
+            content={
+                "message": f"{executed} of {len(ordered)} orders executed",
+                "executed": executed,
+                "results": ordered
+            }
+        )
+
+    except Exception as e:
+        logger.error(f"Batch order placement error: {str(e)}", exc_info=True)
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"An error occurred while processing your orders: {str(e)}"}
+        )
+
+def records(value) -> List[dict]:
+    """Rows from an upstream table (list of dicts or DataFrame) with NaN as None."""
+    rows = value.to_dict(orient="records") if hasattr(value, "to_dict") else list(value or [])
+    return [
+        {key: (None if isinstance(item, float) and item != item else item) for key, item in row.items()}
+        for row in rows
+    ]
+
+
+ENTITY_TAG = re.compile(r'(?:W/)?("[^"]*")')  # captures the opaque tag
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check per RFC 9110: ``*`` or any listed tag, by weak comparison."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return opaque in ENTITY_TAG.findall(if_none_match)
+
+class SnapshotCache:
+    """An upstream payload refreshed in the background and served from memory.
+
+    Readers always get the last good snapshot straight away. Once it is
+    older than the refresh interval a single revalidation starts in the
+    background (stale-while-revalidate), and a failed refresh keeps serving
+    the previous snapshot. Upstream load therefore depends only on the
+    interval, never on how many clients are reading. The JSON body is
+    encoded once per change and carries a content ETag for 304s.
+    ``on_change(previous, current)`` is called whenever the payload changes.
+    """
+
+    def __init__(self, name: str, fetch, live_interval: float, closed_interval: float, on_change=None):
+        self.name = name
+        self.fetch = fetch  # blocking callable returning the payload dict
+        self.on_change = on_change
+        self.live_interval = live_interval
+        self.closed_interval = closed_interval
+        self.data: Optional[dict] = None
+        self.body: bytes = b""
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+
+    def interval(self) -> float:
+        return self.live_interval if market_clock.prices_moving() else self.closed_interval
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    async def get(self) -> dict:
+        """Current snapshot; only the very first call waits for upstream."""
+        if self.data is None:
+            await self.refresh()
+        elif self.age() >= self.interval():
+            self.refresh_in_background()
+        return self.data
+
+    def refresh_in_background(self):
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._refresh())
+
+    async def refresh(self):
+        if self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._refresh())
+        await asyncio.shield(self._refreshing)
+
+    async def _refresh(self):
+        try:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(quote_executor, self.fetch)
+            body = dumps_json(data)
+            if body != self.body:
+                previous = self.data
+                self.data = data
+                self.body = body
+                self.etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+                if previous is not None and self.on_change:
+                    self.on_change(previous, data)
+            self.fetched_at = time.time()
+        except Exception as e:
+            if self.data is None:
+                raise
+            logger.error(f"Error refreshing {self.name}, serving {self.age():.0f}s old snapshot: {str(e)}")
+        finally:
+            self._refreshing = None
+
+    def response(self, request: Request, view=None) -> Response:
+        """The snapshot (or ``view(snapshot)``) as a response, or 304 when the client already has it."""
+        body, etag = self.body, self.etag
+        if view is not None:
+            body = dumps_json(view(self.data))
+            etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Age": str(int(self.age()))}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def run(self):
+        """Background task keeping the snapshot warm."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing {self.name}: {str(e)}")
+            await asyncio.sleep(self.interval())
+
+
+def fetch_gainers_and_losers() -> dict:
+    return {
+        "gainers": records(timed_call("nsepython.top_gainers", nse_get_top_gainers)),
+        "losers": records(timed_call("nsepython.top_losers", nse_get_top_losers))
+    }
+
+
+gainers_snapshot = SnapshotCache("gainers/losers", fetch_gainers_and_losers,
+                                 GAINERS_REFRESH_INTERVAL, MARKET_STATUS_REFRESH_CLOSED)
+
+@app.get("/api/gainer-losers")
+async def get_gainers_and_losers(request: Request):
+    """Get top gainers and losers for the day"""
+    try:
+        await gainers_snapshot.get()
+        return gainers_snapshot.response(request)
     except Exception as e:
         logger.error(f"Error fetching gainers and losers: {str(e)}")
         return JSONResponse(
@@ -1074,8 +4351,14 @@ async def get_gainers_and_losers():
         )
 
 @app.get("/api/orders")
-async def get_orders(status: Optional[str] = None, symbol: Optional[str] = None):
-    """Get all orders with optional filtering"""
+async def get_orders(status: Optional[str] = None, symbol: Optional[str] = None,
+                     limit: int = ORDERS_PAGE_SIZE, cursor: Optional[str] = None,
+                     fields: Optional[str] = None, format: str = "json"):
+    """Get orders with optional filtering, newest first, one page per call
+
+    Pass ``next_cursor`` back as ``cursor`` for the following page, or use
+    ``format=ndjson`` to stream every matching order.
+    """
     try:
         # Build query
         query = {}
@@ -1083,19 +4366,25 @@ async def get_orders(status: Optional[str] = None, symbol: Optional[str] = None)
             query['status'] = status.upper()
         if symbol:
             query['symbol'] = symbol.upper()
+        projection = order_projection(fields)
+
+        if format == "ndjson":
+            return StreamingResponse(stream_orders_ndjson(query, projection), media_type="application/x-ndjson")
         
         # Get orders
-        orders_cursor = orders_collection.find(query).sort('created_at', -1)
-        orders = []
+        orders, next_cursor = await fetch_orders_page(query, cursor, limit, projection)
         
-        for order in orders_cursor:
-            orders.append(serialize_doc(order))
-        
-        return {
+        return FastJSONResponse({
             "orders": orders,
             "count": len(orders),
+            "next_cursor": next_cursor,
             "market_open": check_market_status()
-        }
+        })
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": str(e)}
+        )
     except Exception as e:
         logger.error(f"Error fetching orders: {str(e)}")
         return JSONResponse(
@@ -1104,21 +4393,34 @@ async def get_orders(status: Optional[str] = None, symbol: Optional[str] = None)
         )
 
 @app.get("/api/orders/{id}")
-async def get_order(id: str):
-    """Get all orders for an ExchangeId"""
+async def get_order(id: str, limit: int = ORDERS_PAGE_SIZE, cursor: Optional[str] = None,
+                    fields: Optional[str] = None, format: str = "json"):
+    """Get orders for an email, newest first, one page per call"""
     try:
-        # Find all orders for the email
-        orders = list(orders_collection.find({'Email': id}).sort('created_at', -1))
-        if orders:
-            return {
-                "orders": [serialize_doc(order) for order in orders],
-                "count": len(orders)
-            }
+        # Find orders for the email
+        query = {'Email': id}
+        projection = order_projection(fields)
+
+        if format == "ndjson":
+            return StreamingResponse(stream_orders_ndjson(query, projection), media_type="application/x-ndjson")
+
+        orders, next_cursor = await fetch_orders_page(query, cursor, limit, projection)
+        if orders or cursor:
+            return FastJSONResponse({
+                "orders": orders,
+                "count": len(orders),
+                "next_cursor": next_cursor
+            })
             
         return JSONResponse(
             status_code=404,
             content={"error": "No orders found"}
         )
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={"error": str(e)}
+        )
     except Exception as e:
         logger.error(f"Error fetching orders for {id}: {str(e)}")
         return JSONResponse(
@@ -1126,16 +4428,26 @@ async def get_order(id: str):
             content={"error": f"Error fetching orders: {str(e)}"}
         )
 
+async def event_loop_lag_monitor():
+    """Sample how late the event loop wakes a sleeping task; sustained lag means something is blocking it."""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        loop_lag_seconds.observe(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/api/market-status")
 async def api_market_status():
     """Get current market status"""
     try:
-        status = nse.market_status()
-        is_open = check_market_status()
-        return {
-            'marketState': status['marketState'],
-            'isOpen': is_open
-        }
+        if market_clock.status is None:
+            # Nothing cached yet (startup refresh failed): try once more
+            await market_clock.refresh()
+        return market_clock.snapshot()
     except Exception as e:
         logger.error(f"Error fetching market status: {str(e)}")
         return JSONResponse(
@@ -1147,7 +4459,7 @@ async def api_market_status():
 async def api_stock_quote(symbol: str):
     """Get current stock quote"""
     try:
-        quote = nse.stock_quote(symbol.upper())
+        quote = await quote_service.get_quote(symbol.upper())
         return quote['priceInfo']
     except Exception as e:
         logger.error(f"Error fetching stock quote for {symbol}: {str(e)}")
@@ -1156,12 +4468,64 @@ async def api_stock_quote(symbol: str):
             content={"error": f"Error fetching stock quote: {str(e)}"}
         )
 
+def parse_index_selection(value) -> Optional[Set[str]]:
+    """Index names from a comma-separated string or a list; None means all indices."""
+    if not value:
+        return None
+    names = value.split(",") if isinstance(value, str) else value
+    selection = {str(name).strip().upper() for name in names if str(name).strip()}
+    return selection or None
+
+
+def select_indices(rows: List[dict], selection: Optional[Set[str]]) -> List[dict]:
+    """Rows of ``nse.all_indices()`` data matching a selection by name or symbol."""
+    if selection is None:
+        return rows
+    return [
+        row for row in rows
+        if str(row.get('index', '')).upper() in selection or str(row.get('indexSymbol', '')).upper() in selection
+    ]
+
+
+def publish_indices(previous: dict, current: dict):
+    """Push only the indices that changed to indices subscribers, encoded once per selection and format."""
+    if not indices_subscribers:
+        return
+    before = {row.get('index'): row for row in previous.get('data', [])}
+    changed = [row for row in current.get('data', []) if before.get(row.get('index')) != row]
+    if not changed:
+        return
+
+    encoded = {}
+    for conn, selection in list(indices_subscribers.items()):
+        rows = select_indices(changed, selection)
+        if not rows:
+            continue
+        key = (frozenset(selection) if selection else None, conn.binary)
+        if key not in encoded:
+            encoded[key] = conn.encode({"T": "i", "indices": rows})
+        if not conn.send_encoded(encoded[key]):
+            remove_client(conn)
+
+
+def fetch_indices() -> dict:
+    return timed_call("nse.all_indices", nse.all_indices)
+
+
+indices_snapshot = SnapshotCache("indices", fetch_indices, INDICES_REFRESH_INTERVAL,
+                                 MARKET_STATUS_REFRESH_CLOSED, on_change=publish_indices)
+
 @app.get("/api/indices")
-async def api_indices():
-    """Get current indices data"""
+async def api_indices(request: Request, indices: Optional[str] = None):
+    """Get current indices data, optionally only the comma-separated ``indices``"""
     try:
-        indices = nse.all_indices()
-        return indices
+        await indices_snapshot.get()
+        selection = parse_index_selection(indices)
+        if selection is None:
+            return indices_snapshot.response(request)
+        return indices_snapshot.response(
+            request, lambda data: {**data, 'data': select_indices(data.get('data', []), selection)}
+        )
     except Exception as e:
         logger.error(f"Error fetching indices: {str(e)}")
         return JSONResponse(
@@ -1175,16 +4539,44 @@ async def startup_event():
     """Run on application startup"""
     logger.info("Starting NSE Stock API")
     global market_open
+    try:
+        await market_clock.refresh()
+    except Exception as e:
+        logger.error(f"Error checking market status: {e}")
     market_open = check_market_status()
-    logger.info(f"Market status: {'Open' if market_open else 'Closed'}")
+    logger.info(f"Market status: {'Open' if market_open else 'Closed'} ({market_clock.session()})")
+
+    try:
+        await create_indexes()
+    except Exception as e:
+        logger.error(f"Error creating indexes: {str(e)}")
+
+    global settlement_queue
+    settlement_queue = asyncio.Queue()
+    try:
+        await load_order_book()
+    except Exception as e:
+        logger.error(f"Error loading order book: {str(e)}")
+    for _ in range(ORDER_SETTLEMENT_WORKERS):
+        asyncio.create_task(settlement_worker())
+    report_jobs.start()
     
     # Start the WebSocket broadcast loop
     asyncio.create_task(price_broadcast_loop())
+    asyncio.create_task(news_refresh_loop())
+    asyncio.create_task(market_clock_loop())
+    asyncio.create_task(gainers_snapshot.run())
+    asyncio.create_task(indices_snapshot.run())
+    asyncio.create_task(symbol_master_refresh_loop())
+    asyncio.create_task(event_loop_lag_monitor())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     logger.info("Shutting down NSE Stock API")
+    quote_executor.shutdown(wait=False)
+    mongo_executor.shutdown(wait=False)
+    report_executor.shutdown(wait=False)
 
 # Run the application
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+"""Batch vs single order placement throughput.
+
+Places the same N orders once through ``/api/place-order`` one request at a
+time and once through ``/api/place-orders`` in batches, then prints orders per
+second for each batch size. Batched throughput should grow with batch size
+because the Mongo round-trips per batch stay fixed.
+
+Needs a local mongod (never point this at production):
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_batch_orders.py --orders 1000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import app as backend  # noqa: E402
+
+SYMBOLS = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ITC"]
+
+
+def make_orders(count, email, holding_id):
+    return [{
+        "symbol": SYMBOLS[i % len(SYMBOLS)],
+        "quantity": 1 + i % 3,
+        "order_type": "BUY",
+        "target_price": 100.0 + i % 7,
+        "Email": email,
+        "OrderId": str(i),
+        "HoldingId": holding_id,
+    } for i in range(count)]
+
+
+def seed_account():
+    email = f"bench-{uuid.uuid4().hex[:8]}@growup.local"
+    holding_id = f"bench-{uuid.uuid4().hex[:8]}"
+    backend.users.insert_one({"Email": email, "Balance": 10 ** 12, "HoldingId": holding_id})
+    return email, holding_id
+
+
+def drop_account(email, holding_id):
+    backend.users.delete_one({"Email": email})
+    backend.holdings.delete_one({"HoldingId": holding_id})
+    backend.orders_collection.delete_many({"Email": email})
+
+
+async def run(orders, batch_sizes):
+    await backend.create_indexes()
+    transport = httpx.ASGITransport(app=backend.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as http:
+        email, holding_id = seed_account()
+        payloads = make_orders(orders, email, holding_id)
+        started = time.perf_counter()
+        for payload in payloads:
+            await http.post("/api/place-order", json=payload)
+        elapsed = time.perf_counter() - started
+        drop_account(email, holding_id)
+        print(f"single orders:    {orders / elapsed:>10,.1f} orders/sec")
+
+        for size in batch_sizes:
+            email, holding_id = seed_account()
+            payloads = make_orders(orders, email, holding_id)
+            executed = 0
+            started = time.perf_counter()
+            for start in range(0, orders, size):
+                response = await http.post("/api/place-orders", json={"orders": payloads[start:start + size]})
+                executed += response.json().get("executed", 0)
+            elapsed = time.perf_counter() - started
+            drop_account(email, holding_id)
+            print(f"batch of {size:<8} {orders / elapsed:>10,.1f} orders/sec ({executed} executed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 50, 100, 500])
+    args = parser.parse_args()
+    asyncio.run(run(args.orders, args.batch_sizes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Tick-to-client latency of the WebSocket fan-out as subscribers grow.
+
+Builds N in-memory WebSocket stand-ins, subscribes each to one symbol and
+pushes ticks through ``fan_out`` exactly as ``price_broadcast_loop`` does.
+A share of the clients are deliberately slow; the latency reported is what
+the healthy clients see, which should stay flat from 10 to 10,000
+subscribers because slow sockets only ever delay themselves.
+
+    python benchmarks/bench_broadcast.py --clients 10 100 1000 10000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FakeWebSocket:
+    """Records when each tick reaches the client; slow clients stall on every send."""
+
+    def __init__(self, latencies, delay=0.0):
+        self.latencies = latencies
+        self.delay = delay
+
+    async def send_text(self, payload):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.latencies is not None:
+            sent_at = float(payload[payload.index('"sent_at":') + 10:payload.index("}", payload.index('"sent_at":'))])
+            self.latencies.append((time.perf_counter() - sent_at) * 1000)
+
+    async def close(self):
+        pass
+
+
+async def run_once(clients, ticks, slow_share, interval):
+    symbol = "RELIANCE"
+    latencies = []
+    slow_every = int(1 / slow_share) if slow_share else 0
+    connections = []
+    for i in range(clients):
+        slow = slow_every and i % slow_every == 0
+        websocket = FakeWebSocket(None if slow else latencies, delay=1.0 if slow else 0.0)
+        conn = backend.ClientConnection(websocket)
+        backend.active_connections[websocket] = conn
+        backend.subscribe_client(conn, symbol)
+        connections.append(conn)
+
+    fan_out_ms = []
+    for tick in range(ticks):
+        started = time.perf_counter()
+        backend.fan_out(symbol, {"T": "q", "S": symbol, "lastPrice": 2500 + tick, "sent_at": started})
+        fan_out_ms.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(interval)
+
+    for conn in connections:
+        backend.remove_client(conn)
+
+    dropped = sum(conn.coalesced + conn.dropped for conn in connections)
+    print(f"{clients:>6} clients | fan-out p50={percentile(fan_out_ms, 50):7.2f}ms "
+          f"| tick->client p50={percentile(latencies, 50):7.2f}ms p99={percentile(latencies, 99):7.2f}ms "
+          f"| coalesced/dropped for slow clients={dropped}")
+
+
+async def run(client_counts, ticks, slow_share, interval):
+    for clients in client_counts:
+        await run_once(clients, ticks, slow_share, interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--slow-share", type=float, default=0.05, help="fraction of clients that stall")
+    parser.add_argument("--interval", type=float, default=0.25, help="seconds between ticks")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.ticks, args.slow_share, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Response encoding cost: serialize_doc + JSONResponse vs FastJSONResponse.
+
+Builds N synthetic order documents the way Mongo returns them (ObjectId,
+datetime) and encodes one orders page two ways: the old path (copy and
+stringify every document with ``serialize_doc``, run FastAPI's
+``jsonable_encoder``, render with the stdlib encoder) and the new one
+(``FastJSONResponse`` with the encoder handling those types natively). Both
+bodies are cross-checked, then gzip/br sizes and times are printed for the
+compression middleware. No Mongo or NSE access is needed.
+
+    python benchmarks/bench_json.py --orders 5000
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.objectid import ObjectId  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import app as backend  # noqa: E402
+
+
+def make_orders(count, seed):
+    rng = random.Random(seed)
+    started = datetime(2024, 1, 1, 9, 15)
+    symbols = ["RELIANCE", "TCS", "INFY", "HDFCBANK", "ITC", "SBIN", "LT", "AXISBANK"]
+    orders = []
+    for i in range(count):
+        quantity = rng.randint(1, 100)
+        price = round(rng.uniform(100, 4000), 2)
+        created_at = started + timedelta(seconds=i * 7)
+        orders.append({
+            "_id": ObjectId(),
+            "OrderId": str(i),
+            "Email": "bench@growup.local",
+            "HoldingId": "bench-holding",
+            "symbol": rng.choice(symbols),
+            "quantity": quantity,
+            "order_type": rng.choice(["BUY", "SELL"]),
+            "order_kind": "MARKET",
+            "target_price": price,
+            "total_amount": quantity * price,
+            "status": "EXECUTED",
+            "created_at": created_at,
+            "filled_at": created_at + timedelta(milliseconds=rng.randint(5, 500)),
+        })
+    return orders
+
+
+def serialize_doc(doc):
+    """The pre-walk every Mongo-backed response used to go through."""
+    if not doc:
+        return doc
+    doc_copy = doc.copy()
+    for key, value in doc_copy.items():
+        if isinstance(value, ObjectId):
+            doc_copy[key] = str(value)
+        elif isinstance(value, datetime):
+            doc_copy[key] = value.isoformat()
+    return doc_copy
+
+
+def legacy_body(orders):
+    payload = {"orders": [serialize_doc(order) for order in orders], "count": len(orders), "next_cursor": None}
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_body(orders):
+    return backend.FastJSONResponse({"orders": orders, "count": len(orders), "next_cursor": None}).body
+
+
+def best_of(runs, fn):
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    orders = make_orders(args.orders, args.seed)
+    legacy_ms, legacy = best_of(args.runs, lambda: legacy_body(orders))
+    fast_ms, fast = best_of(args.runs, lambda: fast_body(orders))
+
+    print(f"orders:           {args.orders:,} ({len(fast) / 1024:,.0f} KiB of JSON, "
+          f"{'orjson' if backend.ORJSON_AVAILABLE else 'stdlib json fallback'})")
+    print(f"serialize_doc:    {legacy_ms:8.1f}ms")
+    print(f"FastJSONResponse: {fast_ms:8.1f}ms ({legacy_ms / fast_ms:.1f}x)")
+    print(f"bodies match:     {json.loads(legacy) == json.loads(fast)}")
+
+    gzip_ms, gzipped = best_of(args.runs, lambda: gzip.compress(fast, compresslevel=backend.RESPONSE_GZIP_LEVEL))
+    print(f"gzip -{backend.RESPONSE_GZIP_LEVEL}:          {gzip_ms:8.1f}ms -> {len(gzipped) / 1024:,.0f} KiB "
+          f"({len(gzipped) / len(fast):.0%})")
+    if backend.BROTLI_AVAILABLE:
+        br_ms, compressed = best_of(args.runs, lambda: backend.brotli.compress(
+            fast, quality=backend.RESPONSE_BROTLI_QUALITY))
+        print(f"br q{backend.RESPONSE_BROTLI_QUALITY}:            {br_ms:8.1f}ms -> {len(compressed) / 1024:,.0f} KiB "
+              f"({len(compressed) / len(fast):.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Matching engine cost per price tick.
+
+Fills the in-memory order book with N resting limit orders spread over a
+set of symbols (a share of them cancelled, to exercise lazy deletion), then
+times ``OrderBook.match`` the way price_broadcast_loop calls it: once per
+symbol per tick. Reports tick cost when nothing crosses and when a price
+move sweeps through part of the book. No Mongo or NSE access is needed.
+
+    python benchmarks/bench_order_book.py --orders 100000 --symbols 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_book(orders, symbols, cancel_ratio, seed):
+    rng = random.Random(seed)
+    book = backend.OrderBook()
+    for i in range(orders):
+        side = rng.choice(["BUY", "SELL"])
+        spread = rng.uniform(0.5, 50)
+        book.add(backend.RestingOrder({
+            "OrderId": str(i),
+            "Email": f"user{i % 1000}@growup.local",
+            "symbol": rng.choice(symbols),
+            "order_type": side,
+            "quantity": rng.randint(1, 10),
+            "target_price": 1000 - spread if side == "BUY" else 1000 + spread,
+        }))
+    for i in rng.sample(range(orders), int(orders * cancel_ratio)):
+        book.cancel(str(i))
+    return book
+
+
+def time_ticks(book, symbols, ticks, price_for):
+    latencies = []
+    filled = 0
+    for tick in range(ticks):
+        started = time.perf_counter()
+        for symbol in symbols:
+            filled += len(book.match(symbol, price_for(tick)))
+        latencies.append((time.perf_counter() - started) * 1_000_000)
+    return latencies, filled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=1000)
+    parser.add_argument("--cancel-ratio", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    started = time.perf_counter()
+    book = build_book(args.orders, symbols, args.cancel_ratio, args.seed)
+    print(f"book:             {len(book):,} resting orders over {args.symbols} symbols "
+          f"(built in {time.perf_counter() - started:.2f}s)")
+
+    quiet, _ = time_ticks(book, symbols, args.ticks, lambda tick: 1000.0)
+    print(f"quiet tick:       p50={percentile(quiet, 50):.1f}us p99={percentile(quiet, 99):.1f}us "
+          f"for all {args.symbols} symbols")
+
+    # Price drifts down 5% then back up 10%, sweeping through both sides of the book
+    def drifting(tick):
+        step = tick / max(1, args.ticks - 1)
+        return 1000.0 * (1 - 0.05 * step * 2) if step < 0.5 else 1000.0 * (0.95 + 0.10 * (step - 0.5) * 2)
+
+    moving, filled = time_ticks(book, symbols, args.ticks, drifting)
+    print(f"moving tick:      p50={percentile(moving, 50):.1f}us p99={percentile(moving, 99):.1f}us "
+          f"max={max(moving):.1f}us, {filled:,} orders filled ({len(book):,} left)")
+
+
+if __name__ == "__main__":
+    main()
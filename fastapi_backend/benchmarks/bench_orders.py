@@ -0,0 +1,102 @@
+"""Order placement throughput and event-loop responsiveness benchmark.
+
+Fires N concurrent ``/api/place-order`` requests against the app in-process
+while a probe coroutine plays the part of the WebSocket broadcast tick and
+records how late each tick fires. A blocking Mongo call anywhere on the
+request path shows up directly as tick latency.
+
+Needs a local mongod (never point this at production):
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/bench_orders.py --orders 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import app as backend  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def tick_probe(interval, lateness, stop):
+    """Stand-in for price_broadcast_loop: record how late every tick wakes up."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lateness.append((loop.time() - expected) * 1000)
+
+
+async def run(orders, tick_interval):
+    email = f"bench-{uuid.uuid4().hex[:8]}@growup.local"
+    holding_id = f"bench-{uuid.uuid4().hex[:8]}"
+    backend.users.insert_one({"Email": email, "Balance": 10 ** 12, "HoldingId": holding_id})
+    await backend.create_indexes()
+
+    lateness = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(tick_probe(tick_interval, lateness, stop))
+
+    transport = httpx.ASGITransport(app=backend.app)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def place(i):
+            payload = {
+                "symbol": "RELIANCE",
+                "quantity": 1,
+                "order_type": "BUY",
+                "target_price": 100.0 + i % 7,
+                "Email": email,
+                "OrderId": str(i),
+                "HoldingId": holding_id,
+            }
+            started = time.perf_counter()
+            response = await http.post("/api/place-order", json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(place(i) for i in range(orders)))
+        elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+
+    backend.users.delete_one({"Email": email})
+    backend.holdings.delete_one({"HoldingId": holding_id})
+    backend.orders_collection.delete_many({"Email": email})
+
+    print(f"orders:           {orders} ({statuses.count(200)} ok)")
+    print(f"throughput:       {orders / elapsed:,.1f} orders/sec")
+    print(f"order latency:    p50={percentile(latencies, 50):.1f}ms p99={percentile(latencies, 99):.1f}ms")
+    print(f"tick latency:     p50={percentile(lateness, 50):.1f}ms p99={percentile(lateness, 99):.1f}ms "
+          f"max={max(lateness, default=0):.1f}ms over {len(lateness)} ticks "
+          f"(mean {statistics.fmean(lateness) if lateness else 0:.1f}ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--tick-interval", type=float, default=0.01, help="probe interval in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.orders, args.tick_interval))
+
+
+if __name__ == "__main__":
+    main()
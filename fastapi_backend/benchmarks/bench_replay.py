@@ -0,0 +1,107 @@
+"""Market data replay throughput.
+
+Records a synthetic session of N symbols x T polls through
+``MarketDataRecorder`` (stamped with recorded times ``--interval`` seconds
+apart), then opens it with ``MarketReplay`` at the given speed and polls
+every symbol the way price_broadcast_loop does, for ``--seconds`` of wall
+time. Prints the log size, index build time and quotes served per second.
+No Mongo or NSE access is needed.
+
+    python benchmarks/bench_replay.py --symbols 2000 --ticks 100 --speed 100
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend  # noqa: E402
+
+
+class SyntheticSource:
+    """Answers like NSELive with quote-sized payloads and a random walk."""
+
+    def __init__(self, symbols, seed):
+        self.rng = random.Random(seed)
+        self.prices = {symbol: self.rng.uniform(50, 4000) for symbol in symbols}
+
+    def stock_quote(self, symbol):
+        price = self.prices[symbol] = round(self.prices[symbol] * (1 + self.rng.gauss(0, 0.002)), 2)
+        return {
+            "info": {"symbol": symbol, "companyName": f"{symbol} Limited"},
+            "metadata": {"market": "Open"},
+            "securityInfo": {"tickSize": 0.05},
+            "priceInfo": {
+                "lastPrice": price, "change": round(self.rng.uniform(-20, 20), 2), "pChange": 0.5,
+                "previousClose": price, "open": price, "vwap": price,
+                "intraDayHighLow": {"min": price * 0.98, "max": price * 1.02, "value": price},
+                "weekHighLow": {"min": price * 0.7, "max": price * 1.3, "minDate": "01-Jan-2024", "maxDate": "01-Jun-2024"},
+            },
+        }
+
+    def all_indices(self):
+        return {"data": [{"index": "NIFTY 50", "last": 22000.0}]}
+
+    def market_status(self):
+        return {"marketState": [{"market": "Capital Market", "marketStatus": "Open"}]}
+
+
+def record(path, symbols, ticks, interval, seed):
+    source = SyntheticSource(symbols, seed)
+    recorder = backend.MarketDataRecorder(source, path)
+    session_start = time.time() - ticks * interval
+    for tick in range(ticks):
+        with mock.patch.object(backend.time, "time", return_value=session_start + tick * interval):
+            recorder.market_status()
+            recorder.all_indices()
+            for symbol in symbols:
+                recorder.stock_quote(symbol)
+    recorder._file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--symbols", type=int, default=2000)
+    parser.add_argument("--ticks", type=int, default=100, help="recorded polls per symbol")
+    parser.add_argument("--interval", type=float, default=3.0, help="recorded seconds between polls")
+    parser.add_argument("--speed", type=float, default=100.0)
+    parser.add_argument("--seconds", type=float, default=5.0, help="wall time to replay for")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "market_data.log")
+        started = time.perf_counter()
+        record(path, symbols, args.ticks, args.interval, args.seed)
+        record_s = time.perf_counter() - started
+        records = args.ticks * (args.symbols + 2)
+        size = os.path.getsize(path)
+
+        started = time.perf_counter()
+        replay = backend.MarketReplay(path, speed=args.speed, loop=True)
+        index_s = time.perf_counter() - started
+
+        served = 0
+        polls = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.seconds:
+            for symbol in symbols:
+                replay.stock_quote(symbol)
+            served += len(symbols)
+            polls += 1
+        elapsed = time.perf_counter() - started
+
+    print(f"recorded:         {records:,} records in {record_s:.2f}s, {size / 1024 / 1024:.1f} MiB "
+          f"({size / records:.0f} bytes/record)")
+    print(f"index build:      {index_s * 1000:8.1f}ms ({replay.duration / 60:.0f} recorded minutes)")
+    print(f"replay at {args.speed:g}x:    {served / elapsed:>12,.0f} quotes/sec "
+          f"({polls} polls of {args.symbols} symbols in {elapsed:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
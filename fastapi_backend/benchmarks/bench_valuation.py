@@ -0,0 +1,109 @@
+"""Vectorized valuation vs the per-position report loop.
+
+Generates N synthetic holding documents and a price map, then values them
+twice: with the loop the text report uses (one Python iteration per
+position, formatting as it goes) and with ``ValuationEngine.value``. Totals
+from both are cross-checked. No Mongo or NSE access is needed.
+
+    python benchmarks/bench_valuation.py --portfolios 5000 --positions 12
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as backend  # noqa: E402
+
+
+def make_data(portfolios, positions, symbols, seed):
+    rng = random.Random(seed)
+    universe = [f"SYM{i}" for i in range(symbols)]
+    prices = {
+        symbol: {"T": "q", "lastPrice": rng.uniform(10, 5000), "change": rng.uniform(-50, 50)}
+        for symbol in universe
+    }
+    docs = [{
+        "HoldingId": f"H{i}",
+        "Holdings": [
+            {"symbol": symbol, "quantity": rng.randint(1, 500), "price": rng.uniform(10, 5000)}
+            for symbol in rng.sample(universe, min(positions, symbols))
+        ],
+    } for i in range(portfolios)]
+    return docs, prices
+
+
+def loop_valuation(docs, prices):
+    """The report's approach: walk every position, accumulate totals, format lines."""
+    results = []
+    for doc in docs:
+        lines = []
+        total_value = 0
+        total_change_value = 0
+        total_cost = 0
+        for item in doc["Holdings"]:
+            data = prices.get(item["symbol"])
+            if not data:
+                lines.append(f"❌ {item['symbol']}: ERROR - no price")
+                continue
+            quantity = item["quantity"]
+            holding_value = data["lastPrice"] * quantity
+            change_value = data["change"] * quantity
+            total_value += holding_value
+            total_change_value += change_value
+            total_cost += item["price"] * quantity
+            lines.append(f"    Holding Value: ₹{holding_value:.2f}")
+            lines.append(f"    Day P&L: ₹{change_value:+.2f}")
+        results.append({
+            "HoldingId": doc["HoldingId"],
+            "market_value": total_value,
+            "day_pnl": total_change_value,
+            "unrealized_pnl": total_value - total_cost,
+            "text": "\n".join(lines),
+        })
+    return results
+
+
+def best_of(runs, fn):
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--portfolios", type=int, default=5000)
+    parser.add_argument("--positions", type=int, default=12, help="positions per portfolio")
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    docs, prices = make_data(args.portfolios, args.positions, args.symbols, args.seed)
+    engine = backend.ValuationEngine()
+    total_positions = sum(len(doc["Holdings"]) for doc in docs)
+
+    loop_ms, looped = best_of(args.runs, lambda: loop_valuation(docs, prices))
+    vector_ms, vectored = best_of(args.runs, lambda: engine.value(docs, prices))
+    detail_ms, _ = best_of(args.runs, lambda: engine.value(docs, prices, include_positions=True))
+
+    mismatches = sum(
+        1 for a, b in zip(looped, vectored)
+        if abs(a["market_value"] - b["market_value"]) > 0.01 or abs(a["day_pnl"] - b["day_pnl"]) > 0.01
+    )
+
+    print(f"portfolios:       {args.portfolios:,} ({total_positions:,} positions, {args.symbols} symbols)")
+    print(f"report loop:      {loop_ms:8.1f}ms")
+    print(f"vectorized:       {vector_ms:8.1f}ms ({loop_ms / vector_ms:.1f}x)")
+    print(f"  with positions: {detail_ms:8.1f}ms")
+    print(f"total mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Local stand-in for NSE, nsepython and feedparser used by the benchmarks.
+
+``install(market)`` registers fake ``jugaad_data.nse``, ``nsepython`` and
+``feedparser`` modules, so it must run before ``app`` is imported. Every
+upstream call sleeps for a configurable latency (mean plus gaussian jitter)
+and fails with a configurable probability, which is what the service sees
+from the real endpoints on a bad day. Prices are a seeded random walk per
+symbol, so runs with the same seed see the same market.
+
+    import fake_nse
+    market = fake_nse.FakeMarket(latency_ms=80, jitter_ms=30, error_rate=0.01)
+    fake_nse.install(market)
+    import app as backend
+    backend.news_feed_store.session = fake_nse.FakeSession(market)
+"""
+import random
+import sys
+import threading
+import time
+import types
+import zlib
+from datetime import datetime, timedelta
+
+INDICES = ["NIFTY 50", "NIFTY BANK", "NIFTY IT", "NIFTY NEXT 50", "NIFTY MIDCAP 100", "INDIA VIX"]
+
+
+class FakeUpstreamError(Exception):
+    """Raised by injected failures, like a timed-out or rejected NSE call."""
+
+
+class FeedEntry(dict):
+    """feedparser entries allow both ``entry["title"]`` and ``entry.title``."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FeedResult:
+    def __init__(self, entries):
+        self.entries = entries
+
+
+class FakeResponse:
+    def __init__(self, content: bytes, etag: str):
+        self.status_code = 200
+        self.content = content
+        self.text = content.decode()
+        self.headers = {"ETag": etag}
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeMarket:
+    """Seeded random-walk market answering the NSE calls the service makes.
+
+    ``issued`` keeps the latest price handed out per symbol and when, so a
+    client receiving that price can work out tick-to-client latency.
+    """
+
+    def __init__(self, latency_ms: float = 50, jitter_ms: float = 20, error_rate: float = 0.0,
+                 feed_latency_ms: float = 150, market_open: bool = True, seed: int = 7):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.feed_latency_ms = feed_latency_ms
+        self.market_open = market_open
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stocks = {}  # symbol -> walk state
+        self.indices = {name: 10000.0 + 5000 * i for i, name in enumerate(INDICES)}
+        self.issued = {}  # symbol -> (lastPrice, perf_counter when handed out)
+        self.calls = {}  # call -> count
+        self.failures = {}  # call -> injected failures
+
+    def upstream(self, call: str, latency_ms: float):
+        """Sleep like a network round-trip and maybe fail."""
+        with self.lock:
+            self.calls[call] = self.calls.get(call, 0) + 1
+            delay = max(0.0, self.rng.gauss(latency_ms, self.jitter_ms)) / 1000
+            failed = self.rng.random() < self.error_rate
+            if failed:
+                self.failures[call] = self.failures.get(call, 0) + 1
+        time.sleep(delay)
+        if failed:
+            raise FakeUpstreamError(f"Injected {call} failure")
+
+    def _stock(self, symbol: str) -> dict:
+        state = self.stocks.get(symbol)
+        if state is None:
+            # Base price depends only on the symbol, so every run starts from the same book
+            base = 50 + zlib.crc32(symbol.encode()) % 4000
+            state = self.stocks[symbol] = {
+                "price": float(base), "previous_close": float(base), "open": float(base),
+                "high": float(base), "low": float(base), "volume": 0,
+            }
+        return state
+
+    def _step(self, symbol: str) -> dict:
+        with self.lock:
+            state = self._stock(symbol)
+            price = round(max(1.0, state["price"] * (1 + self.rng.gauss(0, 0.002))), 2)
+            state["price"] = price
+            state["high"] = max(state["high"], price)
+            state["low"] = min(state["low"], price)
+            state["volume"] += self.rng.randint(100, 5000)
+            return dict(state)
+
+    # jugaad_data.nse.NSELive
+
+    def stock_quote(self, symbol: str) -> dict:
+        self.upstream("stock_quote", self.latency_ms)
+        state = self._step(symbol)
+        price, previous = state["price"], state["previous_close"]
+        self.issued[symbol] = (price, time.perf_counter())
+        today = datetime.now()
+        return {
+            "info": {"symbol": symbol, "companyName": f"{symbol.title()} Limited", "industry": "Benchmark"},
+            "metadata": {"market": "Open" if self.market_open else "Closed", "advances": 25, "declines": 25},
+            "securityInfo": {"companyName": f"{symbol.title()} Limited", "tickSize": 0.05, "index": ""},
+            "priceInfo": {
+                "lastPrice": price,
+                "change": round(price - previous, 2),
+                "pChange": round((price - previous) / previous * 100, 2),
+                "previousClose": previous,
+                "open": state["open"],
+                "close": 0,
+                "vwap": round((state["high"] + state["low"] + price) / 3, 2),
+                "lowerCP": round(previous * 0.8, 2),
+                "upperCP": round(previous * 1.2, 2),
+                "pPriceBand": "20",
+                "basePrice": previous,
+                "intraDayHighLow": {"min": state["low"], "max": state["high"], "value": price},
+                "weekHighLow": {
+                    "min": round(previous * 0.7, 2), "max": round(previous * 1.3, 2),
+                    "minDate": (today - timedelta(days=200)).strftime("%d-%b-%Y"),
+                    "maxDate": (today - timedelta(days=30)).strftime("%d-%b-%Y"),
+                },
+            },
+        }
+
+    def trade_info(self, symbol: str) -> dict:
+        self.upstream("trade_info", self.latency_ms)
+        with self.lock:
+            state = self._stock(symbol)
+            volume, price = state["volume"], state["price"]
+        return {"marketDeptOrderBook": {
+            "totalBuyQuantity": volume // 2,
+            "totalSellQuantity": volume // 2,
+            "tradeInfo": {"totalTradedVolume": volume, "totalTradedValue": round(volume * price / 1e7, 2)},
+        }}
+
+    def market_status(self) -> dict:
+        self.upstream("market_status", self.latency_ms)
+        return {"marketState": [{
+            "market": "Capital Market",
+            "marketStatus": "Open" if self.market_open else "Closed",
+            "tradeDate": datetime.now().strftime("%d-%b-%Y"),
+        }]}
+
+    def all_indices(self) -> dict:
+        self.upstream("all_indices", self.latency_ms)
+        rows = []
+        with self.lock:
+            for name, value in self.indices.items():
+                last = round(value * (1 + self.rng.gauss(0, 0.0005)), 2)
+                self.indices[name] = last
+                rows.append({"index": name, "indexSymbol": name, "last": last,
+                             "variation": round(last - value, 2), "percentChange": round((last - value) / value * 100, 2)})
+        return {"data": rows, "timestamp": datetime.now().strftime("%d-%b-%Y %H:%M")}
+
+    # nsepython
+
+    def movers(self, gainers: bool) -> list:
+        self.upstream("top_gainers" if gainers else "top_losers", self.latency_ms)
+        with self.lock:
+            rows = [
+                {"symbol": symbol, "ltp": state["price"],
+                 "netPrice": round((state["price"] - state["previous_close"]) / state["previous_close"] * 100, 2)}
+                for symbol, state in self.stocks.items()
+            ]
+        rows.sort(key=lambda row: row["netPrice"], reverse=gainers)
+        return rows[:20]
+
+    # feedparser
+
+    def parse(self, source) -> FeedResult:
+        if isinstance(source, str) and source.startswith("http"):
+            self.upstream("feed", self.feed_latency_ms)
+        name = source.decode() if isinstance(source, bytes) else str(source)
+        with self.lock:
+            symbols = list(self.stocks) or ["RELIANCE", "TCS", "INFY"]
+            picks = [self.rng.choice(symbols) for _ in range(10)]
+        published = time.gmtime()
+        return FeedResult([
+            FeedEntry({
+                "title": f"{symbol} {symbol.title()} Limited shares move on benchmark news",
+                "summary": f"Synthetic entry for {symbol} from {name}",
+                "link": f"https://feeds.example/{symbol}/{i}",
+                "id": f"{name}:{symbol}:{int(time.time())}:{i}",
+                "published": time.strftime("%Y-%m-%d %H:%M:%S", published),
+                "published_parsed": published,
+            })
+            for i, symbol in enumerate(picks)
+        ])
+
+
+class FakeSession:
+    """requests.Session stand-in for NewsFeedStore downloads."""
+
+    def __init__(self, market: FakeMarket):
+        self.market = market
+        self.headers = {}
+
+    def get(self, url, headers=None, timeout=None):
+        self.market.upstream("feed", self.market.feed_latency_ms)
+        return FakeResponse(url.encode(), etag=f'"{int(time.time())}"')
+
+
+def install(market: FakeMarket):
+    """Register the fake upstream modules; call before importing ``app``."""
+    jugaad_data = types.ModuleType("jugaad_data")
+    jugaad_nse = types.ModuleType("jugaad_data.nse")
+    jugaad_nse.NSELive = lambda: market
+    jugaad_data.nse = jugaad_nse
+
+    nsepython = types.ModuleType("nsepython")
+    nsepython.nse_get_top_gainers = lambda: market.movers(True)
+    nsepython.nse_get_top_losers = lambda: market.movers(False)
+
+    feedparser = types.ModuleType("feedparser")
+    feedparser.parse = market.parse
+
+    sys.modules.update({
+        "jugaad_data": jugaad_data,
+        "jugaad_data.nse": jugaad_nse,
+        "nsepython": nsepython,
+        "feedparser": feedparser,
+    })
@@ -0,0 +1,463 @@
+"""Offline benchmark suite: the whole service against a fake NSE and local Mongo.
+
+Installs the ``fake_nse`` stand-ins for NSELive, nsepython and feedparser
+(latency and error injection set from the command line), starts the app
+under uvicorn on a local port with its normal startup tasks, and runs
+reproducible scenarios against it over real HTTP and WebSocket connections:
+
+    ws       N clients x M symbols subscribed through /ws: ticks/sec and tick-to-client latency
+    orders   concurrent /api/place-order against seeded accounts
+    reports  /report_generation for large portfolios (fresh, not cached)
+    history  /api/orders page walks over a seeded order history (1M documents by default)
+
+Each run prints throughput, p50 and p99 per scenario and writes them to a
+JSON file; ``--compare`` prints the change against an earlier run's file.
+Use a local mongod (never production), or ``--mongo mongomock`` for a run
+with no database at all (order execution relies on pipeline updates that
+mongomock may not support, so prefer mongod for the orders scenario).
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/run_suite.py --out run-a.json
+    python benchmarks/run_suite.py --scenarios ws reports --nse-latency-ms 200 --compare run-a.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_nse  # noqa: E402
+
+SCENARIOS = ["ws", "orders", "reports", "history"]
+HISTORY_EMAIL = "bench-history@growup.local"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors=0, **extra):
+    """The per-scenario record written to the report and compared between runs."""
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        **extra,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def load_app(args, market):
+    """Import the app with the fakes (and mongomock, if asked) in place."""
+    fake_nse.install(market)
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    os.environ.setdefault("LIVE_POLL_INTERVAL", str(args.poll_interval))
+    if args.mongo == "mongomock":
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import app as backend
+    backend.news_feed_store.session = fake_nse.FakeSession(market)
+    return backend
+
+
+class Server:
+    """The app under uvicorn on its own thread and event loop, startup tasks included."""
+
+    def __init__(self, backend, port):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(backend.app, host="127.0.0.1", port=port,
+                                                    log_level="warning", lifespan="on"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def bench_symbols(backend, count):
+    """The first ``count`` symbols of the symbol master, padded with synthetic ones."""
+    symbols = sorted(backend.symbol_master.names)[:count]
+    symbols += [f"BENCH{i}" for i in range(count - len(symbols))]
+    return symbols
+
+
+async def scenario_ws(args, backend, market, base_url):
+    import websockets
+
+    rng = random.Random(args.seed)
+    universe = bench_symbols(backend, args.ws_universe)
+    url = base_url.replace("http", "ws", 1) + "/ws"
+    tick_latencies, subscribe_latencies = [], []
+    received = 0
+    failed = 0
+    stop = asyncio.Event()
+
+    def record(quote, now, seen):
+        """Latency of the first delivery of each fetched price to this client.
+
+        Cached quotes are re-sent every broadcast cycle, so later frames for
+        the same (symbol, issue time) are not new ticks and are skipped.
+        """
+        symbol = quote.get("S")
+        issued = market.issued.get(symbol)
+        if issued and issued[0] == quote.get("lastPrice") and seen.get(symbol) != issued[1]:
+            seen[symbol] = issued[1]
+            tick_latencies.append((now - issued[1]) * 1000)
+
+    async def client(symbols):
+        nonlocal received, failed
+        seen = {}  # symbol -> issue time already measured
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                started = time.perf_counter()
+                await ws.send(json.dumps({"action": "subscribe", "symbols": symbols}))
+                subscribed = False
+                while not stop.is_set():
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), 0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    now = time.perf_counter()
+                    message = json.loads(raw)
+                    if message.get("T") == "b" and not subscribed:
+                        subscribed = True
+                        subscribe_latencies.append((now - started) * 1000)
+                    elif message.get("T") == "q":
+                        received += 1
+                        record(message, now, seen)
+        except Exception:
+            failed += 1
+
+    clients = [asyncio.create_task(client(rng.sample(universe, min(args.ws_symbols, len(universe)))))
+               for _ in range(args.ws_clients)]
+    await asyncio.sleep(args.ws_duration)
+    stop.set()
+    await asyncio.gather(*clients)
+
+    return summarize(
+        tick_latencies, args.ws_duration, errors=failed,
+        clients=args.ws_clients, symbols_per_client=args.ws_symbols, universe=len(universe),
+        messages=received, messages_per_sec=round(received / args.ws_duration, 2),
+        subscribe_p50_ms=round(percentile(subscribe_latencies, 50), 2),
+        subscribe_p99_ms=round(percentile(subscribe_latencies, 99), 2),
+    )
+
+
+async def scenario_orders(args, backend, market, base_url):
+    import httpx
+
+    rng = random.Random(args.seed)
+    symbols = bench_symbols(backend, 20)
+    accounts = []
+    for _ in range(args.order_accounts):
+        email = f"bench-{uuid.uuid4().hex[:8]}@growup.local"
+        holding_id = f"bench-{uuid.uuid4().hex[:8]}"
+        backend.users.insert_one({"Email": email, "Balance": 10 ** 12, "HoldingId": holding_id})
+        # Large starting positions so SELLs race each other rather than fail outright
+        backend.holdings.insert_one({"HoldingId": holding_id, "Holdings": [
+            {"symbol": symbol, "quantity": 10 ** 6, "price": 100.0} for symbol in symbols
+        ]})
+        accounts.append((email, holding_id))
+
+    payloads = []
+    for i in range(args.orders):
+        email, holding_id = accounts[i % len(accounts)]
+        payloads.append({
+            "symbol": rng.choice(symbols),
+            "quantity": rng.randint(1, 10),
+            "order_type": rng.choice(["BUY", "SELL"]),
+            "target_price": round(rng.uniform(100, 1000), 2),
+            "Email": email,
+            "OrderId": str(i),
+            "HoldingId": holding_id,
+        })
+
+    latencies, statuses = [], []
+    limit = asyncio.Semaphore(args.order_concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        async def place(payload):
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    response = await http.post("/api/place-order", json=payload)
+                    statuses.append(response.status_code)
+                except httpx.HTTPError:
+                    statuses.append(0)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(place(payload) for payload in payloads))
+        elapsed = time.perf_counter() - started
+
+    for email, holding_id in accounts:
+        backend.users.delete_one({"Email": email})
+        backend.holdings.delete_one({"HoldingId": holding_id})
+        backend.orders_collection.delete_many({"Email": email})
+
+    return summarize(
+        latencies, elapsed, errors=sum(1 for status in statuses if status not in (200, 400)),
+        accounts=len(accounts), concurrency=args.order_concurrency,
+        executed=statuses.count(200), rejected=statuses.count(400),
+    )
+
+
+async def scenario_reports(args, backend, market, base_url):
+    import httpx
+
+    symbols = bench_symbols(backend, args.report_positions)
+    holding_ids = []
+    for i in range(args.reports):
+        holding_id = f"bench-report-{uuid.uuid4().hex[:8]}"
+        backend.holdings.insert_one({"HoldingId": holding_id, "Holdings": [
+            {"symbol": symbol, "quantity": 1 + (i + j) % 50, "price": 100.0 + j}
+            for j, symbol in enumerate(symbols)
+        ]})
+        holding_ids.append(holding_id)
+
+    latencies, statuses = [], []
+    limit = asyncio.Semaphore(args.report_concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600) as http:
+        async def generate(holding_id):
+            async with limit:
+                started = time.perf_counter()
+                try:
+                    response = await http.get(f"/report_generation/{holding_id}",
+                                              params={"view": "json", "refresh": "true"})
+                    statuses.append(response.status_code)
+                except httpx.HTTPError:
+                    statuses.append(0)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(generate(holding_id) for holding_id in holding_ids))
+        elapsed = time.perf_counter() - started
+
+    for holding_id in holding_ids:
+        backend.holdings.delete_one({"HoldingId": holding_id})
+
+    return summarize(
+        latencies, elapsed, errors=sum(1 for status in statuses if status != 200),
+        positions=len(symbols), concurrency=args.report_concurrency,
+    )
+
+
+def seed_history(backend, count, seed):
+    """Give HISTORY_EMAIL ``count`` orders, reusing what earlier runs left behind."""
+    existing = backend.orders_collection.count_documents({"Email": HISTORY_EMAIL})
+    if existing >= count:
+        return 0
+    rng = random.Random(seed + existing)
+    start = datetime(2020, 1, 1, 9, 15)
+    batch = []
+    for i in range(existing, count):
+        quantity = rng.randint(1, 100)
+        price = round(rng.uniform(50, 4000), 2)
+        batch.append({
+            "OrderId": f"history-{i}",
+            "Email": HISTORY_EMAIL,
+            "HoldingId": "bench-history",
+            "symbol": f"BENCH{i % 500}",
+            "quantity": quantity,
+            "order_type": "BUY" if i % 2 else "SELL",
+            "order_kind": "MARKET",
+            "target_price": price,
+            "total_amount": quantity * price,
+            "status": "EXECUTED",
+            "created_at": start + timedelta(seconds=i * 13),
+        })
+        if len(batch) == 10_000:
+            backend.orders_collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        backend.orders_collection.insert_many(batch, ordered=False)
+    return count - existing
+
+
+async def scenario_history(args, backend, market, base_url):
+    import httpx
+
+    started = time.perf_counter()
+    seeded = seed_history(backend, args.history_docs, args.seed)
+    seed_seconds = time.perf_counter() - started
+
+    latencies, errors = [], 0
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+        started = time.perf_counter()
+        cursor = None
+        for _ in range(args.history_pages):
+            params = {"limit": args.history_page_size}
+            if cursor:
+                params["cursor"] = cursor
+            page_started = time.perf_counter()
+            response = await http.get(f"/api/orders/{HISTORY_EMAIL}", params=params)
+            latencies.append((time.perf_counter() - page_started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+                break
+            cursor = response.json().get("next_cursor")
+            if not cursor:
+                break
+        elapsed = time.perf_counter() - started
+
+        export = {}
+        if args.history_export:
+            exported = 0
+            export_started = time.perf_counter()
+            async with http.stream("GET", f"/api/orders/{HISTORY_EMAIL}", params={"format": "ndjson"}) as response:
+                async for line in response.aiter_lines():
+                    exported += bool(line)
+            export_seconds = time.perf_counter() - export_started
+            export = {"export_docs": exported, "export_docs_per_sec": round(exported / export_seconds, 2)}
+
+    if args.history_cleanup:
+        backend.orders_collection.delete_many({"Email": HISTORY_EMAIL})
+
+    return summarize(
+        latencies, elapsed, errors=errors, documents=args.history_docs, seeded=seeded,
+        seed_seconds=round(seed_seconds, 2), page_size=args.history_page_size, **export,
+    )
+
+
+def compare(previous_path, results):
+    """Print each metric's change against an earlier report."""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_path} (rev {previous.get('revision')}, {previous.get('started_at')}):")
+    for name, result in results.items():
+        before = previous.get("results", {}).get(name)
+        if not before:
+            print(f"  {name:<8} not in the earlier run")
+            continue
+        changes = []
+        for metric in ("throughput", "p50_ms", "p99_ms", "messages_per_sec", "errors"):
+            if metric in result and metric in before:
+                old, new = before[metric], result[metric]
+                delta = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+                changes.append(f"{metric} {old} -> {new} ({delta})")
+        print(f"  {name:<8} " + "; ".join(changes))
+
+
+async def run(args):
+    market = fake_nse.FakeMarket(latency_ms=args.nse_latency_ms, jitter_ms=args.nse_jitter_ms,
+                                 error_rate=args.nse_error_rate, feed_latency_ms=args.feed_latency_ms,
+                                 seed=args.seed)
+    backend = load_app(args, market)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    runners = {"ws": scenario_ws, "orders": scenario_orders, "reports": scenario_reports, "history": scenario_history}
+
+    report = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("out", "compare")},
+        "results": {},
+    }
+    with Server(backend, port):
+        await asyncio.sleep(args.warmup)
+        for name in args.scenarios:
+            print(f"running {name} ...", flush=True)
+            try:
+                result = await runners[name](args, backend, market, base_url)
+            except Exception as e:
+                result = {"failed": f"{type(e).__name__}: {e}"}
+            report["results"][name] = result
+            if "failed" in result:
+                print(f"  {name:<8} FAILED {result['failed']}")
+            else:
+                print(f"  {name:<8} {result['throughput']:>10,.1f}/s  p50={result['p50_ms']:.1f}ms "
+                      f"p99={result['p99_ms']:.1f}ms  errors={result['errors']}")
+    report["upstream"] = {"calls": market.calls, "injected_failures": market.failures}
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nreport written to {args.out}")
+    if args.compare:
+        compare(args.compare, report["results"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--mongo", choices=["mongod", "mongomock"], default="mongod")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", default=f"bench-{datetime.now():%Y%m%d-%H%M%S}.json")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds to let startup tasks settle")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="LIVE_POLL_INTERVAL for the run")
+
+    upstream = parser.add_argument_group("fake upstream")
+    upstream.add_argument("--nse-latency-ms", type=float, default=50)
+    upstream.add_argument("--nse-jitter-ms", type=float, default=20)
+    upstream.add_argument("--nse-error-rate", type=float, default=0.0)
+    upstream.add_argument("--feed-latency-ms", type=float, default=150)
+
+    ws = parser.add_argument_group("ws scenario")
+    ws.add_argument("--ws-clients", type=int, default=200)
+    ws.add_argument("--ws-symbols", type=int, default=10, help="symbols per client")
+    ws.add_argument("--ws-universe", type=int, default=50, help="distinct symbols clients pick from")
+    ws.add_argument("--ws-duration", type=float, default=30, help="seconds")
+
+    orders = parser.add_argument_group("orders scenario")
+    orders.add_argument("--orders", type=int, default=2000)
+    orders.add_argument("--order-concurrency", type=int, default=100)
+    orders.add_argument("--order-accounts", type=int, default=20)
+
+    reports = parser.add_argument_group("reports scenario")
+    reports.add_argument("--reports", type=int, default=20)
+    reports.add_argument("--report-positions", type=int, default=200)
+    reports.add_argument("--report-concurrency", type=int, default=5)
+
+    history = parser.add_argument_group("history scenario")
+    history.add_argument("--history-docs", type=int, default=1_000_000)
+    history.add_argument("--history-pages", type=int, default=200)
+    history.add_argument("--history-page-size", type=int, default=100)
+    history.add_argument("--history-export", action="store_true", help="also time a full NDJSON export")
+    history.add_argument("--history-cleanup", action="store_true", help="drop the seeded history afterwards")
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Concurrency stress test for order execution.
+
+Seeds one account with a small balance and position, then fires a burst of
+concurrent BUY and SELL orders against it so that many of them race for the
+same funds and shares. Afterwards the stored balance and position must equal
+exactly what the accepted orders imply, and neither may ever go negative.
+Lost updates or overdrafts make the script exit non-zero.
+
+Needs a local mongod (never point this at production):
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/stress_orders.py --orders 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+import app as backend  # noqa: E402
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(orders, balance, shares, seed):
+    rng = random.Random(seed)
+    email = f"stress-{uuid.uuid4().hex[:8]}@growup.local"
+    holding_id = f"stress-{uuid.uuid4().hex[:8]}"
+    symbol = "RELIANCE"
+    price = 100.0
+    backend.users.insert_one({"Email": email, "Balance": balance, "HoldingId": holding_id})
+    backend.holdings.insert_one({"HoldingId": holding_id, "Holdings": [{"symbol": symbol, "quantity": shares, "price": price}]})
+    await backend.create_indexes()
+
+    payloads = [{
+        "symbol": symbol,
+        "quantity": rng.randint(1, 5),
+        "order_type": rng.choice(["BUY", "SELL"]),
+        "target_price": price,
+        "Email": email,
+        "OrderId": str(i),
+        "HoldingId": holding_id,
+    } for i in range(orders)]
+
+    transport = httpx.ASGITransport(app=backend.app)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress", timeout=60) as http:
+        async def place(payload):
+            started = time.perf_counter()
+            response = await http.post("/api/place-order", json=payload)
+            latencies.append((time.perf_counter() - started) * 1000)
+            return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(place(p) for p in payloads))
+        elapsed = time.perf_counter() - started
+
+    expected_balance = balance
+    expected_shares = shares
+    for payload, status in zip(payloads, statuses):
+        if status != 200:
+            continue
+        amount = payload["quantity"] * payload["target_price"]
+        if payload["order_type"] == "BUY":
+            expected_balance -= amount
+            expected_shares += payload["quantity"]
+        else:
+            expected_balance += amount
+            expected_shares -= payload["quantity"]
+
+    user = backend.users.find_one({"Email": email})
+    holding = backend.holdings.find_one({"HoldingId": holding_id}) or {}
+    stored_shares = sum(h["quantity"] for h in holding.get("Holdings", []) if h["symbol"] == symbol)
+    executed = backend.orders_collection.count_documents({"Email": email, "status": "EXECUTED"})
+
+    backend.users.delete_one({"Email": email})
+    backend.holdings.delete_one({"HoldingId": holding_id})
+    backend.orders_collection.delete_many({"Email": email})
+
+    accepted = statuses.count(200)
+    rejected = statuses.count(400)
+    print(f"orders:           {orders} ({accepted} executed, {rejected} rejected, "
+          f"{orders - accepted - rejected} errored)")
+    print(f"throughput:       {orders / elapsed:,.1f} orders/sec")
+    print(f"order latency:    p50={percentile(latencies, 50):.1f}ms p99={percentile(latencies, 99):.1f}ms")
+    print(f"balance:          stored={user['Balance']:.2f} expected={expected_balance:.2f}")
+    print(f"shares:           stored={stored_shares} expected={expected_shares}")
+    print(f"order documents:  {executed} EXECUTED")
+
+    failures = []
+    if abs(user["Balance"] - expected_balance) > 1e-6:
+        failures.append("balance drifted from the accepted orders")
+    if stored_shares != expected_shares:
+        failures.append("position drifted from the accepted orders")
+    if user["Balance"] < 0 or stored_shares < 0:
+        failures.append("account went negative")
+    if executed != accepted:
+        failures.append("order documents do not match accepted orders")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--balance", type=float, default=2000.0, help="starting balance, small enough to run out")
+    parser.add_argument("--shares", type=int, default=20, help="starting position, small enough to run out")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    ok = asyncio.run(run(args.orders, args.balance, args.shares, args.seed))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()